@@ -0,0 +1,44 @@
+"""
+Building the columnar store of a Collection and grouping its spectra.
+"""
+from generators import SIZES, skip_large, files
+from specdal.collection import Collection
+
+
+class Data(object):
+    params = [list(SIZES)]
+    param_names = ['spectra']
+    number = 1
+
+    def setup(self, n):
+        skip_large(n)
+        self.coll = Collection.from_files(files(n, 'as7'))
+
+    def time_data(self, n):
+        # setup runs before every repeat, so the store is built each time
+        self.coll.data
+
+    def peakmem_data(self, n):
+        self.coll.data
+
+
+class Groups(object):
+    params = [list(SIZES)]
+    param_names = ['spectra']
+    number = 1
+
+    def setup(self, n):
+        skip_large(n)
+        self.coll = Collection.from_files(files(n, 'as7'))
+        self.coll.data
+
+    def time_group_by_separator(self, n):
+        self.coll.group_by_separator('_', 0, 1)
+
+    def time_group_stats(self, n):
+        # a new separator each time would hit the GroupIndex cache
+        self.coll._group_indexes = {}
+        self.coll.group_stats(('_', 0, 1))
+
+    def peakmem_group_by_separator(self, n):
+        self.coll.group_by_separator('_', 0, 1)
@@ -0,0 +1,55 @@
+"""
+End-to-end runs of the pipeline command line.
+"""
+import sys
+import shutil
+import tempfile
+import subprocess
+from generators import ROOT, SIZES, skip_large, directory
+from specdal import cli
+
+
+def run_pipeline(*args):
+    """
+    run the pipeline in this process, as if from the command line
+    """
+    cli.main([str(arg) for arg in args])
+
+
+class Startup(object):
+    """
+    Start-up of a fresh interpreter, as paid by every scheduled run.
+    """
+    number = 1
+
+    def time_import_cli(self):
+        subprocess.check_call([sys.executable, "-c", "import specdal.cli"],
+                              cwd=ROOT)
+
+    def time_help(self):
+        subprocess.check_call([sys.executable, "-m", "specdal", "--help"],
+                              cwd=ROOT, stdout=subprocess.DEVNULL)
+
+
+class Pipeline(object):
+    params = [list(SIZES), ['batch', 'stream']]
+    param_names = ['spectra', 'mode']
+    number = 1
+
+    def setup(self, n, mode):
+        skip_large(n)
+        self.indir = directory(n, 'mixed')
+        self.outdir = tempfile.mkdtemp(prefix="specdal-bench-out-")
+        self.args = [self.indir, self.outdir, '-res', 'slinear',
+                     '-sti', 'mean', '-gsep', '_', '0', '1', '--no-figures']
+        if mode == 'stream':
+            self.args.append('--stream')
+
+    def teardown(self, n, mode):
+        shutil.rmtree(self.outdir, True)
+
+    def time_pipeline(self, n, mode):
+        run_pipeline(*self.args)
+
+    def peakmem_pipeline(self, n, mode):
+        run_pipeline(*self.args)
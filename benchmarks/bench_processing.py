@@ -0,0 +1,105 @@
+"""
+Resampling, stitching, transforms and library search of single spectra
+and whole collections.
+"""
+import numpy as np
+from generators import SIZES, skip_large, files
+from specdal import readers, resamplers, stitchers, transforms, \
+    calibration, library
+from specdal.collection import Collection
+
+
+class Spectrum(object):
+    params = [['slinear', 'cubic'], ['mean', 'blending']]
+    param_names = ['resampler', 'stitcher']
+
+    def setup(self, resampler, stitcher):
+        # .sig files have fractional wavelengths and overlapping detectors
+        self.spectrum = readers.read(files(1, 'sig')[0])
+
+    def time_resample(self, resampler, stitcher):
+        resamplers.resample(self.spectrum, method=resampler)
+
+    def time_stitch(self, resampler, stitcher):
+        stitchers.stitch(self.spectrum, method=stitcher)
+
+
+class Processing(object):
+    params = [list(SIZES)]
+    param_names = ['spectra']
+    number = 1
+
+    def setup(self, n):
+        skip_large(n)
+        self.coll = Collection.from_files(files(n, 'sig'))
+
+    def time_resample_collection(self, n):
+        resamplers.resample_collection(self.coll)
+
+    def peakmem_resample_collection(self, n):
+        resamplers.resample_collection(self.coll)
+
+    def time_stitch_collection(self, n):
+        stitchers.stitch_collection(self.coll)
+
+    def peakmem_stitch_collection(self, n):
+        stitchers.stitch_collection(self.coll)
+
+
+class Transforms(object):
+    params = [list(SIZES)]
+    param_names = ['spectra']
+    number = 1
+
+    def setup(self, n):
+        skip_large(n)
+        self.coll = Collection.from_files(files(n, 'as7'))
+        # build the columnar store outside of the timings
+        self.coll.matrix
+
+    def time_indices(self, n):
+        transforms.indices(self.coll)
+
+    def time_savgol(self, n):
+        transforms.filter_collection(self.coll, 'savgol', deriv=1)
+
+    def peakmem_savgol(self, n):
+        transforms.filter_collection(self.coll, 'savgol', deriv=1)
+
+
+class Recalibration(object):
+    params = [list(SIZES)]
+    param_names = ['spectra']
+    number = 1
+
+    def setup(self, n):
+        skip_large(n)
+        self.coll = Collection.from_files(files(n, 'as7'))
+        self.coll.matrix
+        # a panel every 10 spectra, one spectrum a minute
+        self.times = np.datetime64('2020-01-01') + \
+            np.arange(n).astype('m8[m]')
+        self.panels = list(self.coll.names[::10])
+
+    def time_recalibrate(self, n):
+        calibration.recalibrate(self.coll, self.panels, method="linear",
+                                times=self.times,
+                                panel_times=self.times[::10])
+
+
+class LibrarySearch(object):
+    params = [list(SIZES), [None, 20]]
+    param_names = ['spectra', 'components']
+    number = 1
+
+    def setup(self, n, components):
+        skip_large(n)
+        coll = Collection.from_files(files(n, 'as7'))
+        self.index = library.LibraryIndex.from_collection(
+            coll, components=components)
+        self.queries = coll.matrix[:100]
+        # normalize the library outside of the timings
+        self.index.query(self.queries[:1])
+
+    def time_query(self, n, components):
+        self.index.query(self.queries, k=5)
@@ -0,0 +1,59 @@
+"""
+Reading files: one file of every format and .asd version, and
+directories of files.
+"""
+from generators import KINDS, SIZES, skip_large, files, directory
+from specdal import readers
+from specdal.collection import Collection
+
+
+class ReadFile(object):
+    params = [list(KINDS)]
+    param_names = ['kind']
+
+    def setup(self, kind):
+        self.filepath = files(1, kind)[0]
+
+    def time_read(self, kind):
+        readers.read(self.filepath)
+
+    def peakmem_read(self, kind):
+        readers.read(self.filepath)
+
+    def time_read_metadata(self, kind):
+        readers.read_metadata(self.filepath)
+
+
+class ReadDirectory(object):
+    params = [list(SIZES), ['as7', 'sig', 'sed']]
+    param_names = ['spectra', 'kind']
+    number = 1
+
+    def setup(self, n, kind):
+        skip_large(n)
+        self.path = directory(n, kind)
+
+    def time_from_directory(self, n, kind):
+        Collection.from_directory(self.path)
+
+    def peakmem_from_directory(self, n, kind):
+        Collection.from_directory(self.path)
+
+    def time_scan(self, n, kind):
+        Collection.scan(self.path)
+
+
+class ReadBatch(object):
+    params = [list(SIZES), ['as7', 'sig', 'sed']]
+    param_names = ['spectra', 'kind']
+    number = 1
+
+    def setup(self, n, kind):
+        skip_large(n)
+        self.filepaths = files(n, kind)
+
+    def time_read_batch(self, n, kind):
+        if kind == 'as7':
+            readers.read_asd_batch(self.filepaths)
+        else:
+            readers.read_text_batch(self.filepaths)
@@ -0,0 +1,100 @@
+"""
+Directories of synthetic spectrum files for the benchmarks.
+
+Files are written with the writers used by the tests, at the sizes of
+real instruments: 2151 channels for .asd and .sed files and 1024 channels
+over three overlapping detectors for .sig files. Directories are written
+once per process and removed at exit.
+"""
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+sys.path.insert(0, ROOT)
+from synthetic import write_asd, write_sig, write_sed
+
+# .asd header versions understood by readers.read_asd
+ASD_VERSIONS = ('ASD', 'asd', 'as6', 'as7', 'as8')
+KINDS = ASD_VERSIONS + ('sig', 'sed')
+
+# largest number of spectra a benchmark is run with; the 100k runs need
+# SPECDAL_BENCH_MAX_SPECTRA=100000 and several GB of memory and disk
+MAX_SPECTRA = int(os.environ.get("SPECDAL_BENCH_MAX_SPECTRA", 1000))
+SIZES = (1, 1000, 100000)
+
+_root = None
+_directories = {}
+
+
+class SkipNotImplemented(NotImplementedError):
+    """
+    raised by a benchmark setup to skip the benchmark; asv skips any
+    NotImplementedError, benchmarks/run.py only this one
+    """
+
+
+def skip_large(n):
+    """
+    skip a benchmark of `n` spectra above MAX_SPECTRA
+    """
+    if n > MAX_SPECTRA:
+        raise SkipNotImplemented("{} spectra > SPECDAL_BENCH_MAX_SPECTRA"
+                                 .format(n))
+
+
+def write_file(filepath, kind, seed=0):
+    """
+    write one synthetic file of `kind`, an .asd header version, 'sig' or
+    'sed'
+    """
+    rng = np.random.RandomState(seed)
+    if kind == 'sig':
+        write_sig(filepath, seed=seed)
+    elif kind == 'sed':
+        write_sed(filepath, seed=seed)
+    else:
+        write_asd(filepath, version=kind,
+                  target=1000. + 1000.*rng.rand(2151),
+                  reference=2000. + 1000.*rng.rand(2151))
+    return filepath
+
+
+def file_name(kind, i, groups=10):
+    """
+    name `<site>_<plot>_<i>.<ext>` placing file `i` in one of `groups`
+    groups on its first two name elements
+    """
+    ext = kind if kind in ('sig', 'sed') else 'asd'
+    return "site{}_plot{}_{:06d}.{}".format(i % 2, i % groups, i, ext)
+
+
+def directory(n, kind='as7', groups=10):
+    """
+    path of a directory of `n` synthetic files of `kind`, or of all kinds
+    in turn if kind='mixed'
+    """
+    global _root
+    key = (n, kind, groups)
+    if key in _directories:
+        return _directories[key]
+    if _root is None:
+        _root = tempfile.mkdtemp(prefix="specdal-bench-")
+        atexit.register(shutil.rmtree, _root, True)
+    path = os.path.join(_root, "{}_{}_{}".format(kind, n, groups))
+    os.makedirs(path)
+    for i in range(n):
+        file_kind = KINDS[i % len(KINDS)] if kind == 'mixed' else kind
+        write_file(os.path.join(path, file_name(file_kind, i, groups)),
+                   file_kind, seed=i)
+    _directories[key] = path
+    return path
+
+
+def files(n, kind='as7', groups=10):
+    path = directory(n, kind, groups)
+    return [os.path.join(path, f) for f in sorted(os.listdir(path))]
@@ -0,0 +1,152 @@
+"""
+Run the benchmarks without asv.
+
+Benchmarks follow asv's conventions: classes in bench_*.py modules with
+`time_*` and `peakmem_*` methods, `params`/`param_names` attributes and
+optional `setup`/`teardown` methods, which are called before and after
+every repeat. A setup raising generators.SkipNotImplemented skips the
+benchmark; any other exception, NotImplementedError included, fails it.
+
+time_* results are the median and minimum wall time over the repeats;
+peakmem_* results are the peak of memory allocated during one call, as
+traced by tracemalloc.
+
+Usage:
+    python benchmarks/run.py [-k PATTERN] [--repeat N]
+                             [--save results.json]
+                             [--compare baseline.json] [--factor 1.2]
+
+With --compare the script exits with status 1 if any benchmark is slower
+or uses more memory than `factor` times its baseline.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import itertools
+import importlib
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from generators import SkipNotImplemented
+
+
+def discover(pattern=None):
+    """
+    (name, class, method name, params) of every benchmark
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    for path in sorted(glob.glob(os.path.join(here, "bench_*.py"))):
+        module = importlib.import_module(
+            os.path.splitext(os.path.basename(path))[0])
+        for cname in sorted(vars(module)):
+            cls = getattr(module, cname)
+            if not isinstance(cls, type) or cls.__module__ != module.__name__:
+                continue
+            grid = list(itertools.product(*getattr(cls, 'params', [])))
+            for mname in sorted(vars(cls)):
+                if not mname.startswith(('time_', 'peakmem_')):
+                    continue
+                name = ".".join([module.__name__, cname, mname])
+                if pattern and pattern not in name:
+                    continue
+                for params in grid:
+                    yield name, cls, mname, params
+
+
+def run(cls, mname, params, repeat):
+    """
+    measurements of one benchmark, None if it is skipped
+    """
+    results = []
+    for _ in range(repeat if mname.startswith('time_') else 1):
+        bench = cls()
+        try:
+            if hasattr(bench, 'setup'):
+                bench.setup(*params)
+        except SkipNotImplemented:
+            return
+        method = getattr(bench, mname)
+        try:
+            if mname.startswith('time_'):
+                start = time.perf_counter()
+                method(*params)
+                results.append(time.perf_counter() - start)
+            else:
+                tracemalloc.start()
+                try:
+                    method(*params)
+                    results.append(tracemalloc.get_traced_memory()[1])
+                finally:
+                    tracemalloc.stop()
+        finally:
+            if hasattr(bench, 'teardown'):
+                bench.teardown(*params)
+    results.sort()
+    return {'median': results[len(results) // 2], 'min': results[0]}
+
+
+def format_value(mname, value):
+    if mname.startswith('time_'):
+        for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+            if value >= scale:
+                break
+        return "{:.3g}{}".format(value / scale, unit)
+    for unit, scale in (('GB', 2**30), ('MB', 2**20), ('kB', 2**10),
+                        ('B', 1)):
+        if value >= scale:
+            break
+    return "{:.3g}{}".format(value / scale, unit)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SpecDAL benchmarks")
+    parser.add_argument('-k', dest='pattern', default=None,
+                        help='run only benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', default=None,
+                        help='write the results to this JSON file')
+    parser.add_argument('--compare', default=None,
+                        help='JSON file of baseline results')
+    parser.add_argument('--factor', type=float, default=1.2,
+                        help='slowdown or memory growth reported as a '
+                        'regression')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results, regressions = {}, []
+    for name, cls, mname, params in discover(args.pattern):
+        key = "{}({})".format(name, ", ".join(map(str, params)))
+        result = run(cls, mname, params, args.repeat)
+        if result is None:
+            print("{:<70} skipped".format(key))
+            continue
+        results[key] = result
+        line = "{:<70} {:>10}".format(key,
+                                      format_value(mname, result['median']))
+        if key in baseline:
+            ratio = result['median'] / baseline[key]['median']
+            line += "  {:5.2f}x".format(ratio)
+            if ratio > args.factor:
+                regressions.append(key)
+                line += "  REGRESSION"
+        print(line)
+        sys.stdout.flush()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if regressions:
+        print("\n{} regression(s)".format(len(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
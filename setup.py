@@ -0,0 +1,15 @@
+from setuptools import setup
+
+setup(
+    name='specdal',
+    version='0.1.0',
+    description='Loading and processing of field spectroscopy data',
+    url='https://github.com/EnSpec/SpecDAL-code',
+    packages=['specdal'],
+    install_requires=['numpy', 'pandas', 'scipy', 'matplotlib'],
+    extras_require={'dask': ['dask[distributed]']},
+    entry_points={
+        'console_scripts': ['specdal_pipeline = specdal.cli:main',
+                            'specdal_ingest = specdal.ingest:main'],
+    },
+)
@@ -0,0 +1,165 @@
+"""
+Execution backends of the partitioned pipeline.
+
+A backend maps a function over partitions and reduces the results
+pairwise in a tree, so no step holds more than two partial results:
+
+    backend = get_backend("dask", scheduler="tcp://scheduler:8786")
+    partials = backend.map(process, partitions)
+    result = backend.compute(backend.reduce(merge, partials))
+
+'local' runs on a process or thread pool of this machine and needs no
+dependency. 'dask' builds a dask task graph and runs it on a dask
+scheduler: 'threads', 'processes' or 'synchronous' on this machine,
+'local-cluster' on a dask.distributed cluster started on this machine, or
+the address of a running cluster spanning many machines.
+"""
+import sys
+from .collection import EXECUTORS
+
+
+def _pairs(items):
+    """
+    pairs of consecutive items, and the odd one left over
+    """
+    pairs = list(zip(items[0::2], items[1::2]))
+    rest = items[-1:] if len(items) % 2 else []
+    return pairs, rest
+
+
+class LocalBackend(object):
+    """
+    Runs tasks on a pool of this machine.
+
+    Parameters
+    ----------
+    workers: int, optional
+        Number of workers; tasks run serially if None or 1.
+    executor: {'process', 'thread'}
+    """
+    def __init__(self, workers=None, executor="process"):
+        self.workers = workers
+        self.executor = executor
+        self.pool = None
+        if workers is not None and workers > 1:
+            self.pool = EXECUTORS[executor](max_workers=workers)
+
+    def _map(self, func, *iterables):
+        if self.pool is None:
+            return list(map(func, *iterables))
+        return list(self.pool.map(func, *iterables))
+
+    def map(self, func, items):
+        """
+        func(item) of every item
+        """
+        return self._map(func, items)
+
+    def reduce(self, func, items):
+        """
+        reduce items with func(a, b) pairwise, a level of the tree at a
+        time
+        """
+        items = list(items)
+        while len(items) > 1:
+            pairs, rest = _pairs(items)
+            items = self._map(func, [a for a, b in pairs],
+                              [b for a, b in pairs]) + rest
+        return items[0]
+
+    def compute(self, result):
+        return result
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+class DaskBackend(object):
+    """
+    Runs tasks as a dask task graph.
+
+    Parameters
+    ----------
+    scheduler: string
+        'threads', 'processes' or 'synchronous' for a dask scheduler of
+        this process, 'local-cluster' to start a dask.distributed cluster
+        on this machine, or the address of a dask.distributed scheduler.
+    workers: int, optional
+        Number of workers of the local schedulers and cluster.
+    """
+    def __init__(self, scheduler="processes", workers=None):
+        import dask
+
+        self.dask = dask
+        self.scheduler = scheduler
+        self.workers = workers
+        self.client = None
+        self.cluster = None
+        if scheduler == "local-cluster":
+            from dask.distributed import Client, LocalCluster
+            self.cluster = LocalCluster(n_workers=workers or 1,
+                                        threads_per_worker=1,
+                                        processes=True,
+                                        dashboard_address=None)
+            self.client = Client(self.cluster)
+        elif scheduler not in ("threads", "processes", "synchronous"):
+            from dask.distributed import Client
+            self.client = Client(scheduler)
+
+    def map(self, func, items):
+        task = self.dask.delayed(func, pure=True)
+        return [task(item) for item in items]
+
+    def reduce(self, func, items):
+        task = self.dask.delayed(func, pure=True)
+        items = list(items)
+        while len(items) > 1:
+            pairs, rest = _pairs(items)
+            items = [task(a, b) for a, b in pairs] + rest
+        return items[0]
+
+    def compute(self, result):
+        if self.client is not None:
+            return self.client.compute(result).result()
+        kwargs = {}
+        if self.workers is not None:
+            kwargs['num_workers'] = self.workers
+        return self.dask.compute(result, scheduler=self.scheduler,
+                                 **kwargs)[0]
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        if self.cluster is not None:
+            self.cluster.close()
+
+
+BACKENDS = {'local': LocalBackend, 'dask': DaskBackend}
+
+
+def get_backend(name="local", **kwargs):
+    """
+    Backend of BACKENDS by name.
+
+    Parameters
+    ----------
+    name: {'local', 'dask'}
+    kwargs:
+        Options of the backend, e.g. workers and executor of 'local' or
+        scheduler and workers of 'dask'.
+
+    Returns
+    -------
+    LocalBackend or DaskBackend
+        None is returned if the backend is unknown or dask is missing.
+    """
+    if name not in BACKENDS:
+        msg = " ".join(["ERROR: backend", str(name), "not supported.\n"])
+        sys.stderr.write(msg)
+        return
+    try:
+        return BACKENDS[name](**kwargs)
+    except ImportError as e:
+        sys.stderr.write("ERROR: backend {} needs {}.\n".format(name, e.name))
+        return
@@ -0,0 +1,78 @@
+import os
+import hashlib
+import pickle
+
+
+class SpectrumCache(object):
+    """
+    On-disk cache of processed spectra.
+
+    Each entry is keyed on the absolute path of the source file, its
+    modification time and size (or a hash of its contents), and the
+    processing settings, so that changed files or settings are processed
+    again while everything else is loaded from the cache.
+
+    Parameters
+    ----------
+    cachedir: string
+        Directory holding the cache entries; created if missing.
+    settings: dict, optional
+        Processing settings the cached spectra depend on, e.g. the
+        resampler and stitcher methods.
+    content_hash: bool
+        Key on a hash of the file contents instead of mtime and size, so
+        that copied or touched but unchanged files still hit.
+    """
+    VERSION = 1
+
+    def __init__(self, cachedir, settings=None, content_hash=False):
+        self.cachedir = cachedir
+        self.settings = tuple(sorted((settings or {}).items()))
+        self.content_hash = content_hash
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(cachedir):
+            os.makedirs(cachedir)
+
+    def key(self, filepath):
+        filepath = os.path.abspath(filepath)
+        if self.content_hash:
+            digest = hashlib.sha1()
+            with open(filepath, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            ident = digest.hexdigest()
+        else:
+            stat = os.stat(filepath)
+            ident = (stat.st_mtime_ns, stat.st_size)
+        key = repr((self.VERSION, filepath, ident, self.settings))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cachedir, key[:2], key + '.pkl')
+
+    def get(self, key):
+        """
+        cached spectrum of `key`, or None
+        """
+        try:
+            with open(self._path(key), 'rb') as f:
+                spectrum = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return
+        self.hits += 1
+        return spectrum
+
+    def put(self, key, spectrum):
+        path = self._path(key)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so readers never see partial data
+        tmppath = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmppath, 'wb') as f:
+            pickle.dump(spectrum, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmppath, path)
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses}
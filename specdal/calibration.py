@@ -0,0 +1,287 @@
+"""
+Recalibration of reflectance against white reference panels.
+
+Readers keep the raw target and reference of every spectrum next to its
+reflectance, as one of the column pairs of RAW_COLUMNS. `recalibrate`
+replaces the reference of many spectra with the panel measured nearest in
+time, or interpolated between the panels measured before and after, and
+recomputes their reflectance:
+
+    pct_reflect = scale * target / panel * panel_reflectance
+
+Panels are matched to spectra by timestamp once (see match_panels), and
+every spectrum sharing a wavelength grid is then recalibrated in one
+broadcast over its (spectra x wavelengths) block.
+"""
+import sys
+import numpy as np
+import pandas as pd
+
+# (target, reference) column pairs and the scale of the reflectance the
+# readers derive from them: .asd files hold a ratio, .sig and .sed files a
+# percentage
+RAW_COLUMNS = ((('target', 'reference'), 1.),
+               (('tgt_radiance', 'ref_radiance'), 100.),
+               (('tgt_counts', 'ref_counts'), 100.))
+MATCH_METHODS = ('nearest', 'linear')
+
+
+def _raw_columns(columns):
+    """
+    the (target, reference) pair of RAW_COLUMNS in `columns` and its
+    scale, (None, None) if there is none
+    """
+    if 'pct_reflect' not in columns:
+        return None, None
+    for pair, scale in RAW_COLUMNS:
+        if all(col in columns for col in pair):
+            return pair, scale
+    return None, None
+
+
+def timestamp(metadata):
+    """
+    Time a target was measured, from the metadata of its spectrum.
+
+    Reads 'timestamp' of .asd files, the second of the 'time' pair of .sig
+    files and of the 'Date' and 'Time' pairs of .sed files; the first of
+    each pair is the time of the reference.
+
+    Returns
+    -------
+    pd.Timestamp
+        NaT if the metadata holds no time.
+    """
+    metadata = metadata or {}
+    value = metadata.get('timestamp')
+    if value is None and 'time' in metadata:
+        value = str(metadata['time']).split(',')[-1]
+    if value is None and 'Date' in metadata and 'Time' in metadata:
+        value = " ".join([str(metadata['Date']).split(',')[-1],
+                          str(metadata['Time']).split(',')[-1]])
+    if value is None:
+        return pd.NaT
+    return pd.to_datetime(str(value).strip(), errors='coerce')
+
+
+def timestamps(metadata):
+    """
+    datetime64[ns] array of the timestamp of every metadata dict
+    """
+    return pd.DatetimeIndex([timestamp(m) for m in metadata]).values
+
+
+def match_panels(times, panel_times, method="nearest", max_gap=None):
+    """
+    Match spectra to the panels measured nearest in time.
+
+    Parameters
+    ----------
+    times: array-like
+        datetime64 time of every spectrum.
+    panel_times: array-like
+        datetime64 time of every panel.
+    method: {'nearest', 'linear'}
+        Take the nearest panel, or interpolate linearly in time between the
+        panels measured before and after; spectra measured before the
+        first or after the last panel take that panel.
+    max_gap: float, optional
+        Largest number of seconds between a spectrum and the nearest panel.
+
+    Returns
+    -------
+    (left, right, weight, matched)
+        Each spectrum's reference is (1 - weight)*panel[left] +
+        weight*panel[right]. matched is False for spectra without a time or
+        a panel within max_gap; their left and right are 0.
+        None is returned if the method is not supported.
+    """
+    if method not in MATCH_METHODS:
+        msg = " ".join(["ERROR:", method, "not supported.\n"])
+        sys.stderr.write(msg)
+        return
+    times = np.asarray(times, dtype='datetime64[ns]')
+    panel_times = np.asarray(panel_times, dtype='datetime64[ns]')
+    n = len(times)
+    known = ~np.isnat(panel_times)
+    panel_rows = np.flatnonzero(known)
+    if len(panel_rows) == 0:
+        zeros = np.zeros(n, dtype=int)
+        return zeros, zeros, np.zeros(n), np.zeros(n, dtype=bool)
+    order = panel_rows[np.argsort(panel_times[known], kind='stable')]
+    # seconds since the first panel
+    origin = panel_times[order[0]]
+    tp = (panel_times[order] - origin) / np.timedelta64(1, 's')
+    t = (times - origin) / np.timedelta64(1, 's')
+
+    pos = np.searchsorted(tp, np.where(np.isnan(t), 0, t))
+    before = np.clip(pos - 1, 0, len(tp) - 1)
+    after = np.clip(pos, 0, len(tp) - 1)
+    with np.errstate(invalid='ignore'):
+        gap_before = np.abs(t - tp[before])
+        gap_after = np.abs(tp[after] - t)
+        gap = np.fmin(gap_before, gap_after)
+        if method == "nearest":
+            nearest = np.where(gap_after < gap_before, after, before)
+            before = after = nearest
+            weight = np.zeros(n)
+        else:
+            span = tp[after] - tp[before]
+            weight = np.where(span > 0, (t - tp[before]) / np.where(
+                span > 0, span, 1), 0.)
+        matched = ~np.isnan(t)
+        if max_gap is not None:
+            matched &= gap <= max_gap
+    weight = np.where(matched, weight, 0.)
+    left = np.where(matched, order[before], 0)
+    right = np.where(matched, order[after], 0)
+    return left, right, weight, matched
+
+
+def recalibrate_array(target, panels, left, right, weight,
+                      panel_reflectance=1., scale=1.):
+    """
+    Reference and reflectance of many spectra from their raw targets and
+    matched panels.
+
+    Parameters
+    ----------
+    target: np.ndarray
+        (spectra x wavelengths) raw targets.
+    panels: np.ndarray
+        (panels x wavelengths) raw panel measurements on the same axis.
+    left, right, weight:
+        Panels of every spectrum, see match_panels.
+    panel_reflectance: float or np.ndarray
+        Reflectance of the panel, per wavelength if an array.
+    scale: float
+        Reflectance of a perfect reflector, e.g. 100 for percent.
+
+    Returns
+    -------
+    (reference, reflectance)
+        (spectra x wavelengths) arrays.
+    """
+    target = np.asarray(target)
+    dtype = target.dtype if np.issubdtype(target.dtype, np.floating) \
+        else np.float64
+    panels = np.asarray(panels, dtype=dtype)
+    weight = np.asarray(weight, dtype=dtype)[:, np.newaxis]
+    reference = panels[left]
+    reference *= 1 - weight
+    reference += weight*panels[right]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        reflectance = target / reference
+    reflectance *= np.asarray(panel_reflectance, dtype=dtype)*scale
+    return reference, reflectance
+
+
+def _panel_block(panels, index, column):
+    """
+    (panels x wavelengths) matrix of data column `column` of every panel
+    on `index`, NaN where a panel has no value
+    """
+    out = np.full((len(panels.spectra), len(index)), np.nan)
+    rows = {id(s): i for i, s in enumerate(panels.spectra)}
+    for spectra, pindex, columns, values in panels._grid_blocks():
+        if column not in columns:
+            continue
+        positions = pd.Index(pindex).get_indexer(index)
+        found = positions >= 0
+        block = values[columns.index(column)][:, positions[found]]
+        out[np.ix_([rows[id(s)] for s in spectra],
+                   np.flatnonzero(found))] = block
+    return out
+
+
+def _panel_reflectance(panel_reflectance, index):
+    if isinstance(panel_reflectance, pd.Series):
+        return np.interp(np.asarray(index, dtype=float),
+                         panel_reflectance.index.values.astype(float),
+                         panel_reflectance.values.astype(float))
+    return panel_reflectance
+
+
+def recalibrate(collection, panels, method="nearest", max_gap=None,
+                panel_reflectance=1., times=None, panel_times=None):
+    """
+    Recompute the reference and reflectance of every spectrum of a
+    Collection from white panel measurements.
+
+    Parameters
+    ----------
+    collection: Collection
+        Spectra holding a raw target and reference pair of RAW_COLUMNS.
+    panels: Collection or list of string
+        Panel measurements, or the names of the spectra of `collection`
+        measuring the panel. Their target column is the panel radiance.
+    method, max_gap:
+        See match_panels. Spectra without a matched panel are unchanged.
+    panel_reflectance: float or pd.Series
+        Reflectance of the panel; a Series indexed by wavelength is
+        interpolated onto the wavelengths of the spectra.
+    times, panel_times: array-like, optional
+        Timestamps of the spectra and the panels, in place of those read
+        from their metadata (see timestamp).
+
+    Returns
+    -------
+    Collection
+        `collection`, recalibrated in place.
+        None is returned if something goes wrong.
+    """
+    if not collection.spectra:
+        return collection
+    if not hasattr(panels, 'spectra'):
+        names = set(panels)
+        panel_coll = type(collection)()
+        for s in collection.spectra:
+            if s.name in names:
+                panel_coll.add_spectrum(s)
+        panels = panel_coll
+    if not panels.spectra:
+        sys.stderr.write("ERROR: no panel measurements to recalibrate "
+                         "with.\n")
+        return
+    if panel_times is None:
+        panel_times = timestamps(s.metadata for s in panels.spectra)
+    if times is None:
+        times = timestamps(s.metadata for s in collection.spectra)
+    match = match_panels(times, panel_times, method, max_gap)
+    if match is None:
+        return
+    rows = {id(s): i for i, s in enumerate(collection.spectra)}
+
+    blocks = collection._grid_blocks()
+    # the panels are read from their own data before any block changes it
+    panel_blocks = {}
+    for spectra, index, columns, values in blocks:
+        pair, scale = _raw_columns(columns)
+        if pair is None:
+            msg = "ERROR: spectra without a raw target and reference.\n"
+            sys.stderr.write(msg)
+            return
+        key = (index.values.tobytes(), pair[0])
+        if key not in panel_blocks:
+            panel_blocks[key] = _panel_block(panels, index, pair[0])
+
+    for spectra, index, columns, values in blocks:
+        pair, scale = _raw_columns(columns)
+        panel_values = panel_blocks[(index.values.tobytes(), pair[0])]
+        sel = np.array([rows[id(s)] for s in spectra])
+        left, right, weight, matched = (a[sel] for a in match)
+        if not matched.any():
+            continue
+        if not values.flags.writeable:
+            values = values.copy()
+        target = values[columns.index(pair[0])]
+        reference, reflectance = recalibrate_array(
+            target[matched], panel_values, left[matched], right[matched],
+            weight[matched], _panel_reflectance(panel_reflectance, index),
+            scale)
+        values[columns.index(pair[1]), matched] = reference
+        values[columns.index('pct_reflect'), matched] = reflectance
+        if values is not getattr(collection, '_values', None):
+            collection._set_grid_block(spectra, index, columns, values)
+        # else the spectra are views into the store, changed in place
+    return collection
@@ -0,0 +1,325 @@
+"""
+Collections larger than memory.
+
+A ChunkedCollection keeps its spectra in a binary store (see
+specdal.store) and memory-maps one chunk at a time, so reading the data,
+the mask, grouping and group statistics never hold more than a chunk, or
+one group, in memory.
+"""
+import os
+import numpy as np
+import pandas as pd
+from .collection import Collection, list_files, _element_inds
+from .groups import GroupIndex, RunningStats, STATS, _nanmedian
+from . import calibration
+from . import pipeline
+from . import store
+
+
+class ChunkedCollection(object):
+    """
+    Collection of spectra stored on disk in chunks.
+
+    Parameters
+    ----------
+    path: string
+        Store directory, e.g. written by `from_files` or Collection.save.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def from_files(cls, path, filepaths, chunksize=1000, resampler=None,
+                   stitcher=None, workers=None, executor="process",
+                   dtype=None, layers=None, wavelengths=None):
+        """
+        Read, resample and stitch files a chunk at a time into a new store
+        at `path`.
+
+        Parameters
+        ----------
+        filepaths: list of string
+        chunksize: int
+            Number of files read, and spectra stored, per chunk.
+        resampler, stitcher, workers, executor, dtype:
+            See pipeline.process_files.
+        layers: tuple of string, optional
+            Data columns stored, those of the first chunk by default, so
+            raw targets and references are kept for recalibration.
+            Columns a spectrum lacks are NaN.
+        wavelengths: array-like, optional
+            Wavelength axis of the store; the axis of the first chunk by
+            default. Other chunks are reindexed onto it.
+
+        Returns
+        -------
+        ChunkedCollection
+        """
+        coll = cls(path)
+        coll.failures = []
+        chunks = pipeline.iter_chunks(list(filepaths), chunksize, resampler,
+                                      stitcher, workers, executor,
+                                      dtype=dtype)
+        first = True
+        for chunk in chunks:
+            coll.failures += chunk.failures
+            if chunk.spectra:
+                coll.append(chunk, layers=layers, wavelengths=wavelengths,
+                            replace=first)
+                first = False
+        return coll
+
+    @classmethod
+    def from_directory(cls, path, indir, **kwargs):
+        """
+        from_files over every file of `indir`
+        """
+        return cls.from_files(path, list_files(indir), **kwargs)
+
+    def append(self, collection, layers=None, wavelengths=None,
+               replace=False):
+        """
+        Add the spectra of a Collection to the store as one chunk.
+
+        The first chunk fixes the layers, every data column of the
+        Collection by default, the wavelength axis and dtype of the store;
+        later chunks are reindexed onto that axis and cast to that dtype.
+        Only the new chunk is read or written, so appending costs the same
+        however large the store is.
+
+        Returns
+        -------
+        np.ndarray
+            The (layers x spectra x wavelengths) values stored.
+        """
+        collection._update_store()
+        exists = not replace and os.path.exists(store._meta_path(self.path))
+        dtype = collection._values.dtype
+        if exists:
+            header = store.read_header(self.path)
+            layers = header['layers']
+            wavelengths = self.wavelengths
+            dtype = self._dtype(header)
+        else:
+            if layers is None:
+                layers = collection._layers
+            if wavelengths is None:
+                wavelengths = collection._index.values
+        wavelengths = np.asarray(wavelengths, dtype=float)
+
+        spectra = collection._rows
+        values = np.full((len(layers), len(spectra), len(wavelengths)),
+                         np.nan, dtype=dtype)
+        positions = pd.Index(wavelengths).get_indexer(collection._index)
+        found = positions >= 0
+        for i, layer in enumerate(layers):
+            if layer in collection._layers:
+                layer_values = collection._values[
+                    collection._layers.index(layer)]
+                values[i][:, positions[found]] = layer_values[:, found]
+        chunk = store.write(self.path, values, wavelengths,
+                            [s.name for s in spectra], tuple(layers),
+                            mask=collection.mask_vector,
+                            metadata=[s.metadata for s in spectra],
+                            resampled=[s.resampled for s in spectra],
+                            index_name=collection._index.name or "wavelength",
+                            append=exists)
+        if exists and '_meta' in self.__dict__:
+            self._meta['chunks'].append(chunk)
+        else:
+            self.__dict__.pop('_meta', None)
+        return values
+
+    @property
+    def meta(self):
+        if '_meta' not in self.__dict__:
+            self._meta = store.read_meta(self.path)
+        return self._meta
+
+    @property
+    def layers(self):
+        return list(self.meta['layers'])
+
+    @property
+    def wavelengths(self):
+        return np.load(os.path.join(self.path, 'wavelengths.npy'))
+
+    @property
+    def index(self):
+        return pd.Index(self.wavelengths, name=self.meta['index_name'])
+
+    def _dtype(self, header):
+        if not header['nchunks']:
+            return np.dtype(np.float64)
+        return np.load(os.path.join(self.path, store.chunk_file(0)),
+                       mmap_mode='r').dtype
+
+    @property
+    def dtype(self):
+        return self._dtype(store.read_header(self.path))
+
+    @property
+    def names(self):
+        return pd.Index([name for chunk in self.meta['chunks']
+                         for name in chunk['names']])
+
+    def __len__(self):
+        return sum(len(chunk['names']) for chunk in self.meta['chunks'])
+
+    @property
+    def mask(self):
+        return pd.DataFrame(data=[m for chunk in self.meta['chunks']
+                                  for m in chunk['mask']],
+                            index=self.names, columns=['mask'])
+
+    @property
+    def metadata(self):
+        return pd.DataFrame([m for chunk in self.meta['chunks']
+                             for m in chunk['metadata']], index=self.names)
+
+    @property
+    def data(self):
+        """
+        (wavelengths x spectra) DataFrame of the whole store; this reads
+        every chunk, use iter_data to stay within memory
+        """
+        return Collection.load(self.path, mmap=True).data
+
+    def iter_chunks(self, layers=None):
+        """
+        Yield a Collection per chunk whose spectra are views into the
+        memory-mapped chunk.
+        """
+        index = self.index
+        for chunk, values in store.iter_chunks(self.path, layers):
+            coll = Collection.from_array(
+                values, index, chunk['names'],
+                layers=layers or self.layers, mask=chunk['mask'],
+                metadata=chunk['metadata'])
+            for s, resampled in zip(coll.spectra, chunk['resampled']):
+                s.resampled = resampled
+            yield coll
+
+    def recalibrate(self, panels, **kwargs):
+        """
+        Recalibrate the stored spectra against white panel measurements,
+        rewriting the reference and reflectance of one chunk at a time in
+        place; see calibration.recalibrate.
+
+        Parameters
+        ----------
+        panels: Collection or list of string
+            Panel measurements, or the names of the stored spectra
+            measuring the panel.
+        kwargs:
+            method, max_gap, panel_reflectance of calibration.recalibrate.
+        """
+        if not hasattr(panels, 'spectra'):
+            panels = Collection.load(self.path, names=list(panels))
+        index = self.index
+        layers = self.layers
+        for chunk in self.meta['chunks']:
+            values = np.load(os.path.join(self.path, chunk['file']),
+                             mmap_mode='r+')
+            # the spectra are views into the chunk, which is written back
+            coll = Collection.from_array(values, index, chunk['names'],
+                                         layers=layers,
+                                         metadata=chunk['metadata'])
+            if calibration.recalibrate(coll, panels, **kwargs) is None:
+                return
+            values.flush()
+        return self
+
+    def iter_data(self):
+        """
+        Yield the (wavelengths x spectra) reflectance DataFrame of every
+        chunk.
+        """
+        index = self.index
+        for chunk, values in store.iter_chunks(self.path, ["pct_reflect"]):
+            yield pd.DataFrame(values[0].T, index=index,
+                               columns=chunk['names'], copy=False)
+
+    def group_index(self, separator, *element_inds):
+        return GroupIndex(self.names, separator,
+                          _element_inds(element_inds))
+
+    def _group_rows(self, index):
+        """
+        per group, a list of (chunk number, rows of the chunk)
+        """
+        rows = [[] for _ in range(len(index))]
+        start = 0
+        for c, chunk in enumerate(self.meta['chunks']):
+            n = len(chunk['names'])
+            codes = index.codes[start:start + n]
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(index) + 1))
+            for g in np.flatnonzero(np.diff(bounds)):
+                rows[g].append((c, order[bounds[g]:bounds[g + 1]]))
+            start += n
+        return rows
+
+    def group_by_separator(self, separator, *element_inds):
+        """
+        Yield (group name, (wavelengths x spectra) DataFrame) per group,
+        holding only one group in memory at a time.
+        """
+        index = self.group_index(separator, *element_inds)
+        files = [chunk['file'] for chunk in self.meta['chunks']]
+        layer = self.layers.index("pct_reflect")
+        wavelengths = self.index
+        for gname, group_rows in zip(index.groups,
+                                     self._group_rows(index)):
+            names, blocks = [], []
+            for c, rows in group_rows:
+                values = np.load(os.path.join(self.path, files[c]),
+                                 mmap_mode='r')
+                blocks.append(values[layer, rows])
+                names += [self.meta['chunks'][c]['names'][i] for i in rows]
+            yield gname, pd.DataFrame(np.concatenate(blocks).T,
+                                      index=wavelengths, columns=names)
+
+    def group_stats(self, separator, *element_inds, **kwargs):
+        """
+        Statistics of groups of spectra, computed a chunk at a time.
+
+        Parameters
+        ----------
+        separator, element_inds:
+            See Collection.group_by_separator.
+        stats: list of string
+            Any of 'mean', 'median', 'std', 'min', 'max', 'count'. The
+            median needs the spectra of a group together, so it is computed
+            a group at a time.
+
+        Returns
+        -------
+        dict
+            (wavelengths x groups) DataFrame per statistic.
+        """
+        stats = kwargs.get('stats', STATS)
+        index = self.group_index(separator, *element_inds)
+        wavelengths = self.index
+        dtype = self.dtype
+        running = RunningStats(len(index), len(wavelengths))
+        start = 0
+        for chunk, values in store.iter_chunks(self.path, ["pct_reflect"]):
+            n = len(chunk['names'])
+            running.add(index.codes[start:start + n], values[0])
+            start += n
+        moments = running.stats([stat for stat in stats if stat != 'median'])
+        if 'median' in stats and len(index):
+            moments['median'] = np.vstack([
+                _nanmedian(gdata.values.T) for gname, gdata in
+                self.group_by_separator(separator, *element_inds)])
+
+        result = {}
+        for stat in stats:
+            out = moments.get(stat, np.empty((0, len(wavelengths))))
+            if stat != 'count':
+                out = out.astype(dtype, copy=False)
+            result[stat] = pd.DataFrame(out.T, index=wavelengths,
+                                        columns=index.groups)
+        return result
+
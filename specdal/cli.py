@@ -0,0 +1,265 @@
+"""
+Command line interface of the SpecDAL pipeline.
+
+Importing this module, parsing arguments, --help and argument errors do
+not import matplotlib or scipy. A run imports them only for the stages
+that need them: matplotlib when figures are rendered, which is the default
+unless --no-figures is given, scipy when spectra are resampled
+(--resampler) or smoothed (--filter savgol), and the spectrum cache when
+--cache-dir is given.
+"""
+import argparse
+import sys
+import os
+import numpy as np
+import pandas as pd
+from . import collection as c
+from . import pipeline as pl
+from . import plotting
+from . import profiling
+from . import qa
+from . import transforms
+
+
+def add_processing_arguments(parser):
+    """
+    add the options of reading and processing spectra, shared with the
+    ingestion service
+    """
+    parser.add_argument('-res', '--resampler', choices=['slinear', 'cubic'],
+                        default=None)
+    parser.add_argument('-sti', '--stitcher', choices=['mean', 'blending'],
+                        default=None)
+    parser.add_argument('-gsep', '--group_by_separator', nargs='*',
+                        default=None, help='First arg specifies the separator. Remaining args specify positions for forming a group',
+                        metavar="separator")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of parallel workers used to read files')
+    parser.add_argument('--executor', choices=['process', 'thread'],
+                        default='process', help='worker pool used with --jobs')
+    parser.add_argument('--dtype', choices=['float64', 'float32'],
+                        default='float64', help='floating point precision of '
+                        'the data through every stage')
+    parser.add_argument('--jump-correct', choices=['additive', 'multiplicative'],
+                        default=None, help='correct steps between the '
+                        'detectors of .asd spectra')
+    parser.add_argument('--jump-reference', type=int, default=1,
+                        help='detector left unchanged by --jump-correct, '
+                        '0 for the first one')
+    parser.add_argument('--qa', nargs='*', default=None, choices=qa.CHECKS,
+                        metavar='CHECK', help='leave out spectra failing '
+                        'quality checks (any of {}; {} by default) and write '
+                        'their flags to qa.csv'.format(
+                            ', '.join(qa.CHECKS),
+                            ', '.join(qa.DEFAULT_CHECKS)))
+    parser.add_argument('--saturation', type=float, default=None,
+                        help='reflectance level at which --qa considers a band '
+                        'saturated')
+    parser.add_argument('--indices', nargs='*', default=None,
+                        choices=sorted(transforms.INDICES), metavar='INDEX',
+                        help='write spectral indices (all of {} by default) '
+                        'to indices.csv'.format(
+                            ', '.join(sorted(transforms.INDICES))))
+    return parser
+
+
+def processing_options(args):
+    """
+    qa, jump and indices options of pipeline.process_files from the
+    arguments added by add_processing_arguments
+    """
+    qa_options = None
+    if args.qa is not None:
+        qa_options = {'checks': args.qa or qa.DEFAULT_CHECKS,
+                      'saturation': args.saturation}
+
+    jump = None
+    if args.jump_correct:
+        jump = {'method': args.jump_correct,
+                'reference': args.jump_reference}
+    return {'qa': qa_options, 'jump': jump, 'indices': args.indices}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="SpecDAL Pipeline")
+
+    parser.add_argument('indir', help='input directory')
+    parser.add_argument('outdir', help='output directory')
+    add_processing_arguments(parser)
+    parser.add_argument('--stream', action='store_true',
+                        help='process files a chunk at a time with bounded memory')
+    parser.add_argument('--chunksize', type=int, default=1000,
+                        help='number of files per chunk with --stream')
+    parser.add_argument('--backend', choices=['local', 'dask'], default=None,
+                        help='process partitions of files as tasks of this '
+                        'execution backend and reduce their group statistics')
+    parser.add_argument('--scheduler', default='processes',
+                        help='dask scheduler of --backend dask: threads, '
+                        'processes, synchronous, local-cluster or the '
+                        'address of a dask.distributed scheduler')
+    parser.add_argument('--partition-size', type=int, default=1000,
+                        help='number of files per partition with --backend')
+    parser.add_argument('--save-partitions', action='store_true',
+                        help='write the spectra of every partition to '
+                        'binary stores with --backend')
+    parser.add_argument('--cache-dir', default=None,
+                        help='directory caching processed spectra between runs')
+    parser.add_argument('--cache-key', choices=['stat', 'content'],
+                        default='stat', help='detect changed files by mtime and '
+                        'size, or by a hash of their contents')
+    parser.add_argument('--no-figures', action='store_true',
+                        help='do not render group figures')
+    parser.add_argument('--max-lines', type=int, default=None,
+                        help='draw at most this many spectra per group figure')
+    parser.add_argument('--format', choices=['csv', 'npy'], default='csv',
+                        help='write group data as CSV or as binary stores '
+                        'readable with Collection.load')
+    parser.add_argument('--profile', default=None, metavar='REPORT',
+                        help='time every stage and file read and write the '
+                        'report to REPORT (.json or .csv)')
+    parser.add_argument('--filter', choices=sorted(transforms.FILTERS),
+                        default=None, help='filter the spectra before '
+                        'grouping, e.g. Savitzky-Golay smoothing')
+    parser.add_argument('--window', type=int, default=11,
+                        help='number of bands fitted by --filter savgol')
+    parser.add_argument('--polyorder', type=int, default=2,
+                        help='polynomial order of --filter savgol')
+    parser.add_argument('--deriv', type=int, default=0,
+                        help='order of the derivative taken by --filter')
+    return parser
+
+
+def main(argv=None):
+    """
+    run the pipeline with command line arguments `argv`, sys.argv[1:] by
+    default; returns the exit status
+    """
+    args = build_parser().parse_args(argv)
+
+    if args.profile:
+        profiling.enable()
+
+    options = processing_options(args)
+    qa_options, jump = options['qa'], options['jump']
+
+    transform = None
+    if args.filter == 'savgol':
+        transform = {'method': 'savgol', 'window': args.window,
+                     'polyorder': args.polyorder, 'deriv': args.deriv}
+    elif args.filter == 'derivative':
+        transform = {'method': 'derivative', 'order': args.deriv or 1}
+
+    # make output directory
+    outdir = os.path.abspath(args.outdir)
+    figdir = os.path.join(outdir, 'figures')
+    datadir = os.path.join(outdir, 'data')
+    for d in (outdir, figdir, datadir):
+        if not os.path.exists(d):
+            os.makedirs(d)
+
+    ############################################################################
+    # spectra of unchanged files are loaded from the cache
+    cache = None
+    if args.cache_dir:
+        from .cache import SpectrumCache
+        cache = SpectrumCache(args.cache_dir,
+                              settings={'resampler': args.resampler,
+                                        'dtype': args.dtype,
+                                        'stitcher': args.stitcher,
+                                        'jump': jump},
+                              content_hash=args.cache_key == 'content')
+
+    # streaming mode: groups are written as chunks of files are processed
+    if args.stream:
+        pl.stream(args.indir, outdir, resampler=args.resampler,
+                  stitcher=args.stitcher,
+                  group_by_separator=args.group_by_separator,
+                  chunksize=args.chunksize, workers=args.jobs,
+                  executor=args.executor, cache=cache, format=args.format,
+                  dtype=np.dtype(args.dtype), qa=qa_options, jump=jump,
+                  indices=args.indices, transform=transform,
+                  figures=not args.no_figures)
+        if args.profile:
+            profiling.active().save(args.profile)
+        return 0
+
+    # partitioned mode: partitions of files run as tasks of a backend
+    if args.backend:
+        from .backends import get_backend
+        if args.backend == 'dask':
+            backend = get_backend('dask', scheduler=args.scheduler,
+                                  workers=args.jobs)
+        else:
+            backend = get_backend('local', workers=args.jobs,
+                                  executor=args.executor)
+        if backend is None:
+            return 1
+        try:
+            pl.partitioned(args.indir, outdir, backend,
+                           partition_size=args.partition_size,
+                           resampler=args.resampler, stitcher=args.stitcher,
+                           group_by_separator=args.group_by_separator,
+                           dtype=np.dtype(args.dtype), qa=qa_options,
+                           jump=jump, indices=args.indices,
+                           transform=transform,
+                           figures=not args.no_figures,
+                           save=args.save_partitions)
+        finally:
+            backend.close()
+        if args.profile:
+            profiling.active().save(args.profile)
+        return 0
+
+    # read, resample and stitch files
+    coll = pl.process_files(c.list_files(args.indir), resampler=args.resampler,
+                            stitcher=args.stitcher, workers=args.jobs,
+                            executor=args.executor, cache=cache,
+                            dtype=np.dtype(args.dtype), qa=qa_options,
+                            jump=jump, indices=args.indices,
+                            transform=transform)
+    for filepath, error in coll.failures:
+        sys.stderr.write(" ".join(["ERROR:", filepath, error]) + "\n")
+
+    # group by
+    with profiling.stage("group"):
+        if args.group_by_separator:
+            groups = list(coll.group_by_separator(*args.group_by_separator))
+        else:
+            groups = [('all', coll.data)]
+
+    # save data
+    with profiling.stage("write"):
+        for gname, gdata in groups:
+            if args.format == 'npy':
+                coll.save(os.path.join(datadir, gname), names=gdata.columns)
+            else:
+                gdata.transpose().to_csv(os.path.join(datadir, gname + '.csv'))
+
+    # save figures
+    if not args.no_figures:
+        with profiling.stage("plot"):
+            plotting.render_groups(groups, figdir, workers=args.jobs,
+                                   executor=args.executor,
+                                   max_lines=args.max_lines)
+
+    # save mask
+    maskpath = os.path.join(outdir, 'mask.csv')
+    coll.mask.to_csv(maskpath)
+
+    # save quality flags
+    if qa_options is not None and coll.qa is not None:
+        coll.qa.to_frame().to_csv(os.path.join(outdir, 'qa.csv'))
+
+    # save spectral indices
+    if args.indices is not None and coll.indices is not None:
+        coll.indices.to_csv(os.path.join(outdir, 'indices.csv'))
+
+    # save files that could not be read
+    if coll.failures:
+        failpath = os.path.join(outdir, 'failures.csv')
+        pd.DataFrame(coll.failures, columns=['filepath', 'error']).to_csv(
+            failpath, index=False)
+
+    if args.profile:
+        profiling.active().save(args.profile)
+    return 0
@@ -1,20 +1,211 @@
+import os
 import sys
+import functools
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import time
 import numpy as np
 import pandas as pd
-from .spectrum import Spectrum
-import matplotlib.pyplot as plt
+from .spectrum import Spectrum, _versions
+from . import readers
+from . import store
+from . import plotting
+from . import profiling
+from .groups import GroupIndex, STATS
+
+EXECUTORS = {'process': ProcessPoolExecutor, 'thread': ThreadPoolExecutor}
+
+
+def list_files(path):
+    """
+    files of a directory in sorted order
+    """
+    filepaths = [os.path.join(path, f) for f in sorted(os.listdir(path))]
+    return [f for f in filepaths if os.path.isfile(f)]
+
+
+def _element_inds(args):
+    """
+    flatten name element positions given as ints, strings or lists
+    """
+    element_inds = []
+    for arg in args:
+        if isinstance(arg, (list, tuple)):
+            element_inds += [int(e) for e in arg]
+        else:
+            element_inds.append(int(arg))
+    return element_inds
+
+
+def _read_file(filepath, lazy=False, dtype=np.float64):
+    """
+    read a single file, returning (spectrum, error message)
+
+    Exceptions are caught here so that one bad file cannot abort a
+    parallel directory read.
+    """
+    try:
+        return readers.read(filepath, lazy=lazy, dtype=dtype), None
+    except Exception as e:
+        return None, "{}: {}".format(type(e).__name__, e)
+
+
+def _read_file_profiled(filepath, lazy=False, dtype=np.float64):
+    """
+    _read_file, also returning the seconds spent and the bytes read; the
+    bytes are 0 for header-only reads
+    """
+    start = time.perf_counter()
+    spectrum, error = _read_file(filepath, lazy, dtype)
+    seconds = time.perf_counter() - start
+    nbytes = 0
+    if not lazy and os.path.exists(filepath):
+        nbytes = os.path.getsize(filepath)
+    return spectrum, error, seconds, nbytes
+
 
 class Collection(object):
     """
     Class representing a dataset of spectra
     
     data: pd.DataFrame of multiple spectrum
-    
+
+    The reflectance of all spectra is kept in one (spectra x wavelengths)
+    matrix on a shared wavelength axis, rebuilt only when a spectrum's data
+    is reassigned. Spectra sharing that axis hold views into the matrix.
+
+    dtype: numpy floating point dtype, optional
+        dtype of the matrix; by default the dtype of the spectra's data,
+        e.g. float32 for spectra read with dtype=np.float32.
     """
-    def __init__(self):
+    def __init__(self, dtype=None):
         self.group = None
-        pass
+        self.failures = []
+        self.dtype = dtype
+
+    @classmethod
+    def from_directory(cls, path, workers=None, executor="process",
+                       dtype=None):
+        """
+        Read every supported file in a directory into a new Collection.
+
+        Parameters
+        ----------
+        path: string
+            Directory containing .asd, .sig and .sed files.
+        workers: int, optional
+            Number of parallel workers. Files are read serially if None or 1.
+        executor: {"process", "thread"}
+            Kind of pool used when workers > 1.
+        dtype: numpy floating point dtype, optional
+            dtype of the data read; float64 by default.
+
+        Returns
+        -------
+        Collection
+            Spectra in sorted filename order. Files that raised while being
+            parsed are listed in `failures` as (filepath, message) pairs.
+        """
+        return cls.from_files(list_files(path), workers=workers,
+                              executor=executor, dtype=dtype)
+
+    @classmethod
+    def scan(cls, path, workers=None, executor="thread", dtype=None):
+        """
+        Read the headers of every supported file in a directory.
+
+        Only metadata is parsed; each spectrum reads its data on the first
+        access to Spectrum.data, so a large directory can be filtered on
+        `metadata` before any data is loaded. Until then the mask of a
+        spectrum is False.
+
+        Parameters
+        ----------
+        path: string
+        workers: int, optional
+            Number of parallel workers. Headers are read serially if None
+            or 1.
+        executor: {"process", "thread"}
+            Kind of pool used when workers > 1.
+        dtype: numpy floating point dtype, optional
+            dtype of the data once loaded.
+
+        Returns
+        -------
+        Collection
+        """
+        return cls.from_files(list_files(path), workers=workers,
+                              executor=executor, lazy=True, dtype=dtype)
+
+    @classmethod
+    def from_files(cls, filepaths, workers=None, executor="process",
+                   pool=None, lazy=False, dtype=None):
+        """
+        Read a list of files into a new Collection, keeping their order.
+
+        Parameters
+        ----------
+        filepaths: list of string
+        workers: int, optional
+            Number of parallel workers. Files are read serially if None or 1.
+        executor: {"process", "thread"}
+            Kind of pool used when workers > 1.
+        pool: concurrent.futures.Executor, optional
+            Existing pool to read with, e.g. one shared by many calls.
+        lazy: bool
+            Read only the headers; see `scan`.
+        dtype: numpy floating point dtype, optional
+            dtype of the data read and of the Collection; float64 by
+            default.
+
+        Returns
+        -------
+        Collection
+        """
+        if executor not in EXECUTORS:
+            msg = " ".join(["ERROR:", str(executor), "not supported.\n"])
+            sys.stderr.write(msg)
+            return
+
+        read_dtype = np.float64 if dtype is None else dtype
+        read_file = functools.partial(_read_file, lazy=lazy, dtype=read_dtype)
+        if profiling.active() is not None:
+            # timed where the file is read, which may be a worker process
+            read_file = functools.partial(_read_file_profiled, lazy=lazy,
+                                          dtype=read_dtype)
+        if pool is not None:
+            return cls._from_results(filepaths,
+                                     cls._map(pool, filepaths, read_file),
+                                     dtype)
+
+        if workers is None or workers <= 1:
+            results = map(read_file, filepaths)
+            return cls._from_results(filepaths, results, dtype)
+
+        with EXECUTORS[executor](max_workers=workers) as pool:
+            return cls._from_results(filepaths,
+                                     cls._map(pool, filepaths, read_file),
+                                     dtype)
+
+    @staticmethod
+    def _map(pool, filepaths, read_file=_read_file):
+        workers = getattr(pool, '_max_workers', 1)
+        chunksize = max(1, len(filepaths) // (workers*4))
+        # map() yields in submission order, keeping the output deterministic
+        return pool.map(read_file, filepaths, chunksize=chunksize)
+
+    @classmethod
+    def _from_results(cls, filepaths, results, dtype=None):
+        coll = cls(dtype=dtype)
+        for filepath, result in zip(filepaths, results):
+            spectrum, error = result[:2]
+            if len(result) > 2:
+                profiling.record_file(filepath, result[2], result[3], error)
+            if error is not None:
+                coll.failures.append((filepath, error))
+            elif spectrum is not None:
+                coll.add_spectrum(spectrum)
+        return coll
 
     @property
     def spectra(self):
@@ -22,13 +213,284 @@ class Collection(object):
             return
         return self._spectrums
 
+    @classmethod
+    def from_array(cls, values, wavelengths, names, layers=("pct_reflect",),
+                   mask=None, metadata=None):
+        """
+        Wrap a reflectance matrix in a Collection without copying it.
+
+        Parameters
+        ----------
+        values: np.ndarray
+            (spectra x wavelengths) matrix, or (layers x spectra x
+            wavelengths) array holding one matrix per data column.
+        wavelengths: array-like
+            Shared wavelength axis.
+        names: list of string
+            Spectrum names.
+        layers: tuple of string
+            Data column held by each matrix; must include "pct_reflect".
+        mask: array-like of bool, optional
+        metadata: list of dict, optional
+
+        Returns
+        -------
+        Collection
+            Spectra are views into `values`.
+        """
+        if values.ndim == 2:
+            values = values[np.newaxis]
+        coll = cls()
+        coll._spectrums = []
+        if mask is None:
+            mask = np.zeros(values.shape[1], dtype=bool)
+        if metadata is None:
+            metadata = [None]*values.shape[1]
+        for i, name in enumerate(names):
+            coll._spectrums.append(Spectrum(name=name, mask=bool(mask[i]),
+                                            metadata=metadata[i]))
+        index = pd.Index(np.asarray(wavelengths),
+                         name=getattr(wavelengths, 'name', None) or
+                         "wavelength")
+        coll._set_store(values, index, tuple(layers), coll._spectrums)
+        return coll
+
+    def save(self, path, names=None, append=False):
+        """
+        Write the collection to a binary store; see specdal.store.
+
+        Parameters
+        ----------
+        path: string
+            Store directory.
+        names: list of string, optional
+            Save only these spectra.
+        append: bool
+            Add the spectra to an existing store at `path`.
+        """
+        self._update_store()
+        rows = np.arange(len(self._rows))
+        if names is not None:
+            rows = self._names.get_indexer(names)
+            rows = rows[rows >= 0]
+        spectra = [self._rows[i] for i in rows]
+        values = self._values
+        if len(rows) != values.shape[1]:
+            values = values[:, rows, :]
+        store.write(path, values, self._index.values,
+                    [s.name for s in spectra], self._layers,
+                    mask=self.mask_vector[rows],
+                    metadata=[s.metadata for s in spectra],
+                    resampled=[s.resampled for s in spectra],
+                    index_name=self._index.name, append=append)
+
+    @classmethod
+    def load(cls, path, names=None, layers=None, wavelengths=None,
+             mmap=False):
+        """
+        Read a Collection from a binary store written by `save`.
+
+        Parameters
+        ----------
+        path: string
+            Store directory.
+        names: list of string, optional
+            Load only these spectra.
+        layers: list of string, optional
+            Load only these data columns; "pct_reflect" is always loaded.
+        wavelengths: (float, float), optional
+            Load only wavelengths in this closed range.
+        mmap: bool
+            Memory-map the stored arrays instead of reading them.
+        """
+        if layers is not None and "pct_reflect" not in layers:
+            layers = ["pct_reflect"] + list(layers)
+        stored = store.read(path, names=names, layers=layers,
+                            wavelengths=wavelengths, mmap=mmap)
+        index = pd.Index(stored['wavelengths'], name=stored['index_name'])
+        coll = cls.from_array(stored['values'], index, stored['names'],
+                              layers=stored['layers'], mask=stored['mask'],
+                              metadata=stored['metadata'])
+        for s, resampled in zip(coll.spectra, stored['resampled']):
+            s.resampled = resampled
+        return coll
+
     @property
     def data(self):
         if not hasattr(self, '_spectrums'):
             return
-        return pd.concat([s.data["pct_reflect"].rename(s.name) for s in
-                          self._spectrums if "pct_reflect" in s.data],
-                         axis=1)
+        self._update_store()
+        return pd.DataFrame(self.matrix.T, index=self._index,
+                            columns=self._names, copy=False)
+
+    @property
+    def matrix(self):
+        """
+        (spectra x wavelengths) reflectance matrix backing `data`
+        """
+        return self.layer("pct_reflect")
+
+    def layer(self, name):
+        """
+        (spectra x wavelengths) matrix of data column `name`
+        """
+        if not hasattr(self, '_spectrums'):
+            return
+        self._update_store()
+        return self._values[self._layers.index(name)]
+
+    @property
+    def wavelengths(self):
+        if not hasattr(self, '_spectrums'):
+            return
+        self._update_store()
+        return self._index.values
+
+    @property
+    def names(self):
+        if not hasattr(self, '_spectrums'):
+            return
+        self._update_store()
+        return self._names
+
+    @property
+    def mask_vector(self):
+        """
+        boolean mask of the rows of `matrix`, read from the spectra since
+        setting a mask does not rebuild the store
+        """
+        if not hasattr(self, '_spectrums'):
+            return
+        self._update_store()
+        return np.array([bool(s.mask) for s in self._rows], dtype=bool)
+
+    def _store_key(self):
+        return tuple(s.version for s in self._spectrums)
+
+    def _update_store(self):
+        """
+        (re)build the columnar store if any spectrum changed since last time
+        """
+        key = self._store_key()
+        if getattr(self, '_key', None) == key:
+            return
+        spectra = [s for s in self._spectrums if "pct_reflect" in s.data]
+        if len(spectra) == 0:
+            self._set_store(np.empty((1, 0, 0)),
+                            pd.Index([], name="wavelength"),
+                            ("pct_reflect",), spectra)
+            return
+
+        # data columns shared by every spectrum become layers
+        first = spectra[0].data
+        layers = tuple(col for col in first.columns if
+                       col == "pct_reflect" or
+                       (all(col in s.data for s in spectra) and
+                        np.issubdtype(first[col].dtype, np.number)))
+        dtype = self._store_dtype(s.data.dtypes[col] for s in spectra
+                                  for col in layers)
+
+        index = first.index
+        shared = all(s.data.index is index or
+                     np.array_equal(s.data.index.values, index.values)
+                     for s in spectra)
+        if shared:
+            values = np.empty((len(layers), len(spectra), len(index)),
+                              dtype=dtype)
+            for i, s in enumerate(spectra):
+                values[:, i, :] = s.data.loc[:, layers].values.T
+        else:
+            if not all(s.data.index.is_unique for s in spectra):
+                raise ValueError("spectra with overlapping wavelengths must "
+                                 "share one wavelength axis; stitch them "
+                                 "first")
+            index = pd.Index(np.unique(np.concatenate(
+                [s.data.index.values for s in spectra])), name=index.name)
+            values = np.full((len(layers), len(spectra), len(index)), np.nan,
+                             dtype=dtype)
+            for i, s in enumerate(spectra):
+                positions = index.get_indexer(s.data.index)
+                values[:, i, positions] = s.data.loc[:, layers].values.T
+        self._set_store(values, index, layers, spectra, shared)
+
+    def _store_dtype(self, dtypes):
+        """
+        the Collection's dtype, or else the floating point type holding all
+        of `dtypes` (float64 if they aren't all floating point)
+        """
+        if getattr(self, 'dtype', None) is not None:
+            return np.dtype(self.dtype)
+        dtypes = set(dtypes)
+        if dtypes and all(np.issubdtype(d, np.floating) for d in dtypes):
+            return np.result_type(*dtypes)
+        return np.dtype(np.float64)
+
+    def _set_store(self, values, index, layers, spectra, views=True):
+        """
+        install a columnar store and point the spectra's data at its rows
+        """
+        self._values = values
+        self._index = index
+        self._layers = layers
+        self._rows = list(spectra)
+        self._names = pd.Index([s.name for s in spectra])
+        viewed = 0
+        if views:
+            for i, s in enumerate(spectra):
+                # only spectra holding exactly the stored columns are
+                # replaced, so no data column is lost
+                current = getattr(s, '_data', None)
+                if current is None or set(current.columns) == set(layers):
+                    s._data = pd.DataFrame(values[:, i, :].T, index=index,
+                                           columns=list(layers), copy=False)
+                    if s.version is None:
+                        s._version = next(_versions)
+                    viewed += 1
+        # every spectrum is a view, so the store holds all of their data
+        self._complete = viewed == len(self._spectrums)
+        self._key = self._store_key()
+
+    def _grid_blocks(self):
+        """
+        stack spectra sharing a wavelength grid and data columns
+
+        Returns
+        -------
+        list of (spectra, index, columns, values)
+            values is a (columns x spectra x wavelengths) array.
+        """
+        if getattr(self, '_key', None) == self._store_key() and \
+           self._complete:
+            return [(self._spectrums, self._index, list(self._layers),
+                     self._values)]
+
+        groups = OrderedDict()
+        for s in self._spectrums:
+            key = (s.data.index.values.tobytes(), tuple(s.data.columns))
+            groups.setdefault(key, []).append(s)
+
+        blocks = []
+        for spectra in groups.values():
+            first = spectra[0].data
+            values = np.empty((len(first.columns), len(spectra),
+                               len(first.index)),
+                              dtype=self._store_dtype(
+                                  d for s in spectra for d in s.data.dtypes))
+            for i, s in enumerate(spectra):
+                values[:, i, :] = s.data.values.T
+            blocks.append((spectra, first.index, list(first.columns), values))
+        return blocks
+
+    def _set_grid_block(self, spectra, index, columns, values):
+        """
+        point spectra at the rows of a (columns x spectra x wavelengths)
+        array, adopting it as the store when it covers the collection
+        """
+        for i, s in enumerate(spectra):
+            s.data = pd.DataFrame(values[:, i, :].T, index=index,
+                                  columns=columns, copy=False)
+        if len(spectra) == len(self._spectrums) and "pct_reflect" in columns:
+            self._set_store(values, index, tuple(columns), spectra)
 
     def add_spectrum(self, spectrum):
         '''Consider OrderedDict rather than list (i.e. for setting mask)'''
@@ -38,7 +500,19 @@ class Collection(object):
             self._spectrums.append(spectrum)
         if isinstance(spectrum, list):
             [self._spectrums.append(item) for item in spectrum if
-             isinstance(spectrum, Spectrum)]
+             isinstance(item, Spectrum)]
+
+    @property
+    def metadata(self):
+        """
+        pd.DataFrame of the metadata of every spectrum, one row per spectrum
+
+        Reading it does not load the data of lazily read spectra.
+        """
+        if not hasattr(self, '_spectrums'):
+            return
+        return pd.DataFrame([s.metadata or {} for s in self._spectrums],
+                            index=[s.name for s in self._spectrums])
 
     @property
     def mask(self):
@@ -48,19 +522,85 @@ class Collection(object):
                             index=[s.name for s in self._spectrums],
                             columns=['mask'])
 
+    def group_index(self, separator, *element_inds):
+        """
+        GroupIndex of the spectra in `data` for a separator and name element
+        positions, parsed once and cached until the spectra change
+        """
+        element_inds = _element_inds(element_inds)
+        self._update_store()
+        key = (separator, tuple(element_inds))
+        cache = getattr(self, '_group_indexes', {})
+        if key in cache and cache[key].names.equals(self._names):
+            return cache[key]
+        cache[key] = GroupIndex(self._names, separator, element_inds)
+        self._group_indexes = cache
+        return cache[key]
+
     def group_by_separator(self, *args):
         separator = args[0]
-        element_inds = list(map(int, args[1:]))
-        def group_fcn(name):
-            return separator.join([name.split(separator)[e] for e in element_inds])
-        self.group = self.data.groupby(by=group_fcn, axis=1)
+        index = self.group_index(separator, *args[1:])
+        self.group = self.data.groupby(by=index.keys, axis=1)
         return self.group
 
+    def group_stats(self, *specs, **kwargs):
+        """
+        Vectorized statistics of groups of spectra.
+
+        Parameters
+        ----------
+        *specs: tuple
+            One (separator, element index, ...) tuple per grouping, as
+            passed to group_by_separator.
+        stats: list of string
+            Any of 'mean', 'median', 'std', 'min', 'max', 'count'.
+
+        Returns
+        -------
+        dict
+            For a single spec, a (wavelengths x groups) DataFrame per
+            statistic; for several specs, such a dict per spec.
+        """
+        stats = kwargs.get('stats', STATS)
+        matrix = self.matrix
+        result = {}
+        for spec in specs:
+            index = self.group_index(*spec)
+            result[tuple(spec)] = index.aggregate(matrix, stats,
+                                                  index=self._index)
+        if len(specs) == 1:
+            return result[tuple(specs[0])]
+        return result
+
 #    def group_by_separator(self, separator, element_inds):
 #        def group_fcn(name):
 #            return separator.join([name.split(separator)[e] for e in element_inds])
 #        self.group = self.data.groupby(by=group_fcn, axis=1)
 #        return self.group
     
-    def plot(self):
-        pass
+    def plot(self, ax=None, max_lines=None, step=1, title=None,
+             legend=None):
+        """
+        Plot the spectra in `data` as lines.
+
+        Parameters
+        ----------
+        ax: matplotlib Axes, optional
+            Axes to draw on; a new pyplot figure is made if None.
+        max_lines: int, optional
+            Draw at most this many evenly spaced spectra.
+        step: int
+            Draw every `step`-th wavelength.
+        title: string, optional
+        legend: bool, optional
+            Defaults to a legend for at most 20 spectra.
+
+        Returns
+        -------
+        matplotlib Axes
+        """
+        if ax is None:
+            import matplotlib.pyplot as plt
+            fig, ax = plt.subplots()
+        data = plotting.decimate(self.data, max_lines, step)
+        return plotting.plot_spectra(data, ax, title=title, legend=legend)
@@ -0,0 +1,315 @@
+import re
+import numpy as np
+import pandas as pd
+
+STATS = ('mean', 'median', 'std', 'min', 'max', 'count')
+
+
+def group_keys(names, separator, element_inds):
+    """
+    group key of each spectrum name: the name elements at `element_inds`
+    joined by `separator`; negative positions count from the end of each
+    name, and an IndexError is raised for a name without such an element
+    """
+    names = list(names)
+    if not names or not len(element_inds):
+        return np.full(len(names), "", dtype=object)
+    # a separator longer than one character is taken as a regex
+    parts = pd.Series(names, dtype=object).str.split(re.escape(separator),
+                                                     expand=True)
+    elements = parts.values
+    # number of elements of each name; shorter names are padded with None
+    counts = parts.notna().values.sum(axis=1)
+    rows = np.arange(len(names))
+    keys = None
+    for e in element_inds:
+        cols = e + counts if e < 0 else np.full(len(names), e)
+        missing = (cols < 0) | (cols >= counts)
+        if missing.any():
+            raise IndexError("name {} has no element {}".format(
+                names[np.argmax(missing)], e))
+        key = elements[rows, cols].astype(str).astype(object)
+        keys = key if keys is None else keys + separator + key
+    return keys
+
+
+class GroupIndex(object):
+    """
+    Group membership of spectra as integer codes.
+
+    Group keys are parsed from the spectrum names once. Spectra are then
+    ordered by group so that every group is a contiguous block of rows and
+    statistics reduce all groups at once with ufunc.reduceat.
+
+    Parameters
+    ----------
+    names: list of string
+        Spectrum names.
+    separator: string
+    element_inds: list of int
+        Positions of the name elements forming a group.
+    """
+    def __init__(self, names, separator, element_inds):
+        self.separator = separator
+        self.element_inds = list(element_inds)
+        self.names = pd.Index(names)
+        self.keys = group_keys(names, separator, self.element_inds)
+        self.codes, self.groups = pd.factorize(self.keys, sort=True)
+        self.order = np.argsort(self.codes, kind='stable')
+        self.counts = np.bincount(self.codes, minlength=len(self.groups))
+        self.starts = np.concatenate([[0], np.cumsum(self.counts)[:-1]])
+
+    def __len__(self):
+        return len(self.groups)
+
+    def aggregate(self, matrix, stats=STATS, index=None):
+        """
+        Statistics of every group over a (spectra x wavelengths) matrix.
+
+        NaNs are skipped as in pandas; std uses one degree of freedom and
+        count is the number of non-NaN values. Statistics keep the floating
+        point dtype of `matrix`; sums are accumulated in float64.
+
+        Returns
+        -------
+        dict
+            (wavelengths x groups) DataFrame per statistic.
+        """
+        result = {}
+        if len(self.groups) == 0:
+            return {stat: pd.DataFrame(index=index) for stat in stats}
+        values = np.asarray(matrix)
+        if not np.issubdtype(values.dtype, np.floating):
+            values = values.astype(float)
+        dtype = values.dtype
+        values = values[self.order]
+        finite = np.isfinite(values)
+        count = np.add.reduceat(finite, self.starts, axis=0).astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            total = np.add.reduceat(np.where(finite, values, 0), self.starts,
+                                    axis=0, dtype=np.float64)
+            mean = total / count
+            for stat in stats:
+                if stat == 'mean':
+                    out = mean
+                elif stat == 'count':
+                    out = count.astype(int)
+                elif stat == 'std':
+                    sorted_codes = self.codes[self.order]
+                    deviations = np.where(finite,
+                                          values - mean[sorted_codes], 0)
+                    out = np.sqrt(np.add.reduceat(deviations**2, self.starts,
+                                                  axis=0, dtype=np.float64) /
+                                  (count - 1))
+                    out[count < 2] = np.nan
+                elif stat == 'min':
+                    out = np.fmin.reduceat(values, self.starts, axis=0)
+                elif stat == 'max':
+                    out = np.fmax.reduceat(values, self.starts, axis=0)
+                elif stat == 'median':
+                    out = np.vstack([
+                        _nanmedian(values[start:start + n])
+                        for start, n in zip(self.starts, self.counts)])
+                else:
+                    raise ValueError("unknown statistic {}".format(stat))
+                if stat != 'count':
+                    out = out.astype(dtype, copy=False)
+                result[stat] = pd.DataFrame(out.T, index=index,
+                                            columns=self.groups)
+        return result
+
+
+class RunningStats(object):
+    """
+    Count, mean, variance, minimum and maximum of groups of spectra,
+    updated a block of spectra at a time.
+
+    Each block is reduced per group with ufunc.reduceat and merged into the
+    running statistics with the pairwise update of Chan et al.
+
+    Parameters
+    ----------
+    ngroups: int
+    nwaves: int
+        Number of wavelengths of every block.
+    """
+    def __init__(self, ngroups, nwaves):
+        shape = (ngroups, nwaves)
+        self.count = np.zeros(shape)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.minimum = np.full(shape, np.inf)
+        self.maximum = np.full(shape, -np.inf)
+
+    def resize(self, ngroups):
+        """
+        make room for groups added since, keeping the statistics of the
+        others
+        """
+        extra = ngroups - len(self.count)
+        if extra <= 0:
+            return
+        nwaves = self.count.shape[1]
+        for name, fill in (('count', 0), ('mean', 0), ('m2', 0),
+                           ('minimum', np.inf), ('maximum', -np.inf)):
+            setattr(self, name, np.vstack([getattr(self, name),
+                                           np.full((extra, nwaves), fill)]))
+
+    def add(self, codes, values):
+        """
+        add the rows of a (spectra x wavelengths) block whose group codes
+        are `codes`
+        """
+        if len(codes) == 0:
+            return
+        order = np.argsort(codes, kind='stable')
+        codes = codes[order]
+        values = np.asarray(values)[order]
+        groups, starts = np.unique(codes, return_index=True)
+        finite = np.isfinite(values)
+        count = np.add.reduceat(finite, starts, axis=0).astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.add.reduceat(np.where(finite, values, 0), starts,
+                                   axis=0, dtype=np.float64) / count
+            rows = np.searchsorted(groups, codes)
+            m2 = np.add.reduceat(np.where(finite, values - mean[rows], 0)**2,
+                                 starts, axis=0, dtype=np.float64)
+            old = self.count[groups]
+            total = old + count
+            delta = np.where(count > 0, mean - self.mean[groups], 0)
+            self.mean[groups] = np.where(
+                total > 0, self.mean[groups] + delta*count/total, 0)
+            self.m2[groups] = np.where(
+                total > 0, self.m2[groups] + np.where(count > 0, m2, 0) +
+                delta**2*old*count/total, 0)
+        self.count[groups] = total
+        self.minimum[groups] = np.fmin(self.minimum[groups],
+                                       np.fmin.reduceat(values, starts,
+                                                        axis=0))
+        self.maximum[groups] = np.fmax(self.maximum[groups],
+                                       np.fmax.reduceat(values, starts,
+                                                        axis=0))
+
+    def merge(self, other):
+        """
+        add the statistics of `other`, of the same groups and wavelengths
+        """
+        total = self.count + other.count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = other.mean - self.mean
+            self.mean = np.where(total > 0, self.mean +
+                                 delta*other.count/total, 0)
+            self.m2 = np.where(total > 0, self.m2 + other.m2 +
+                               delta**2*self.count*other.count/total, 0)
+        self.count = total
+        self.minimum = np.fmin(self.minimum, other.minimum)
+        self.maximum = np.fmax(self.maximum, other.maximum)
+        return self
+
+    def stats(self, stats=('mean', 'std', 'min', 'max', 'count')):
+        """
+        dict of (groups x wavelengths) arrays per statistic, NaN where a
+        group has no values
+        """
+        empty = self.count == 0
+        result = {}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for stat in stats:
+                if stat == 'mean':
+                    result[stat] = np.where(empty, np.nan, self.mean)
+                elif stat == 'std':
+                    result[stat] = np.where(self.count > 1, np.sqrt(
+                        self.m2 / (self.count - 1)), np.nan)
+                elif stat == 'min':
+                    result[stat] = np.where(empty, np.nan, self.minimum)
+                elif stat == 'max':
+                    result[stat] = np.where(empty, np.nan, self.maximum)
+                elif stat == 'count':
+                    result[stat] = self.count.astype(int)
+                else:
+                    raise ValueError("unknown statistic {}".format(stat))
+        return result
+
+
+class GroupStats(object):
+    """
+    RunningStats of named groups on a wavelength index.
+
+    GroupStats of disjoint sets of spectra merge into the statistics of
+    their union, whatever their groups and wavelengths, so partitions of a
+    dataset can be reduced pairwise in a tree. The median is not mergeable
+    and is left out.
+
+    Parameters
+    ----------
+    index: pd.Index
+        Wavelengths.
+    groups: list of string, optional
+    """
+    def __init__(self, index, groups=()):
+        self.index = index
+        self.groups = list(groups)
+        self.running = RunningStats(len(self.groups), len(index))
+
+    def add(self, keys, values):
+        """
+        add a (spectra x wavelengths) block whose group keys are `keys`
+        """
+        codes = {key: i for i, key in enumerate(self.groups)}
+        for key in keys:
+            if key not in codes:
+                codes[key] = len(self.groups)
+                self.groups.append(key)
+        self.running.resize(len(self.groups))
+        self.running.add(np.array([codes[key] for key in keys], dtype=int),
+                         values)
+        return self
+
+    def _reindex(self, index, groups):
+        out = GroupStats(index, groups)
+        rows = np.array([groups.index(g) for g in self.groups], dtype=int)
+        cols = index.get_indexer(self.index)
+        for name in ('count', 'mean', 'm2', 'minimum', 'maximum'):
+            getattr(out.running, name)[np.ix_(rows, cols)] = \
+                getattr(self.running, name)
+        return out
+
+    def merge(self, other):
+        """
+        GroupStats of the spectra of both, on the union of their groups and
+        wavelengths; self is updated and returned unless it lacks some of
+        them
+        """
+        groups = self.groups + [g for g in other.groups
+                                if g not in self.groups]
+        if self.index.equals(other.index):
+            index = self.index
+        else:
+            index = self.index.union(other.index)
+        if groups == self.groups and index is self.index:
+            merged = self
+        else:
+            merged = self._reindex(index, groups)
+        if other.groups != groups or other.index is not index:
+            other = other._reindex(index, groups)
+        merged.running.merge(other.running)
+        return merged
+
+    def frames(self, stats=('mean', 'std', 'min', 'max', 'count')):
+        """
+        (wavelengths x statistics) DataFrame of every group, by name
+        """
+        arrays = self.running.stats(stats)
+        return {g: pd.DataFrame({stat: arrays[stat][i] for stat in stats},
+                                index=self.index)
+                for i, g in enumerate(self.groups)}
+
+
+def _nanmedian(values):
+    finite = np.isfinite(values)
+    if finite.all():
+        return np.median(values, axis=0)
+    out = np.full(values.shape[1], np.nan)
+    some = finite.any(axis=0)
+    out[some] = np.nanmedian(values[:, some], axis=0)
+    return out
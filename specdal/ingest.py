@@ -0,0 +1,450 @@
+"""
+Continuous ingestion of spectrum files.
+
+An Ingestor appends spectra to a binary store (see specdal.chunked) as
+their files arrive:
+
+- `watch` polls a directory and submits every new file once its size and
+  modification time stop changing;
+- `serve` accepts uploads on a local TCP or unix socket: a line holding the
+  file name, then the file contents up to the end of the stream. The reply
+  is one JSON line with the result of the file (see Ingestor.submit), so
+  instruments get quality flags back within a batch delay;
+- `submit` queues a file from other code.
+
+Submitted files wait in a bounded queue; producers wait while it is full.
+Queued files are read with readers.read on an executor a batch at a time,
+processed like pipeline.process_files, and appended to the store as one
+chunk. Group statistics are updated with the new spectra only and written
+for the groups they belong to, so a batch costs time proportional to its
+files, not to the size of the store.
+
+Under `outdir` the service keeps
+
+- store/: the ChunkedCollection of ingested spectra;
+- inbox/: files uploaded through `serve`;
+- data/<group>_stats.csv: mean, std, min, max and count of every group;
+- qa.csv, indices.csv and failures.csv, appended to batch by batch.
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import numpy as np
+import pandas as pd
+from .collection import Collection, EXECUTORS, list_files, \
+    _read_file_profiled
+from .chunked import ChunkedCollection
+from .groups import RunningStats, group_keys
+from . import pipeline
+from . import store
+
+PORT = 8642
+STATS = ('mean', 'std', 'min', 'max', 'count')
+
+
+def _json_value(value):
+    if isinstance(value, (np.bool_, bool)):
+        return bool(value)
+    if isinstance(value, (np.integer, int)):
+        return int(value)
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+class Ingestor(object):
+    """
+    Appends spectra of incoming files to a store under `outdir`.
+
+    Parameters
+    ----------
+    outdir: string
+        Directory of the store and outputs; an existing store is appended
+        to and its spectra are not ingested again.
+    resampler, stitcher, dtype, qa, jump, indices:
+        See pipeline.process_files. Spectra flagged by `qa` are not stored.
+    group_by_separator: list, optional
+        Separator, then the positions of the name elements forming a
+        group; all spectra form one group "all" if None.
+    workers: int
+        Number of files read at a time.
+    executor: {'process', 'thread'}
+        Pool reading the files.
+    max_pending: int
+        Number of submitted files waiting to be read before `submit`
+        waits.
+    batch_size: int
+        Largest number of files stored as one chunk.
+    batch_delay: float
+        Seconds a batch waits for more files once it has one.
+    """
+    def __init__(self, outdir, resampler=None, stitcher=None,
+                 group_by_separator=None, workers=4, executor="process",
+                 max_pending=1000, batch_size=100, batch_delay=1.0,
+                 dtype=None, qa=None, jump=None, indices=None):
+        self.outdir = outdir
+        self.resampler = resampler
+        self.stitcher = stitcher
+        self.separator, self.element_inds = None, []
+        if group_by_separator:
+            self.separator = group_by_separator[0]
+            self.element_inds = [int(e) for e in group_by_separator[1:]]
+        self.workers = workers
+        self.executor = executor
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.dtype = dtype
+        self.qa = qa
+        self.jump = jump
+        self.indices = indices
+
+        self.inbox = os.path.join(outdir, 'inbox')
+        self.datadir = os.path.join(outdir, 'data')
+        for d in (outdir, self.inbox, self.datadir):
+            if not os.path.exists(d):
+                os.makedirs(d)
+        self.store = ChunkedCollection(os.path.join(outdir, 'store'))
+        self.names = set()
+        self.groups = []
+        self.codes = {}
+        self.stats = None
+        self.queue = None
+        self._pool = None
+        self._task = None
+        self._load()
+
+    def _load(self):
+        """
+        names and group statistics of the spectra already stored
+        """
+        if not os.path.exists(store._meta_path(self.store.path)):
+            return
+        layer = self.store.layers.index("pct_reflect")
+        for chunk, values in store.iter_chunks(self.store.path):
+            self.names.update(chunk['names'])
+            self._add_stats(chunk['names'], values[layer])
+
+    def _group_codes(self, names):
+        if self.separator is None:
+            keys = ["all"]*len(names)
+        else:
+            keys = group_keys(names, self.separator, self.element_inds)
+        for key in keys:
+            if key not in self.codes:
+                self.codes[key] = len(self.groups)
+                self.groups.append(key)
+        return np.array([self.codes[key] for key in keys], dtype=int)
+
+    def _add_stats(self, names, values):
+        """
+        add a (spectra x wavelengths) block to the group statistics;
+        returns the codes of the groups it touched
+        """
+        codes = self._group_codes(names)
+        if self.stats is None:
+            self.stats = RunningStats(len(self.groups), values.shape[1])
+        self.stats.resize(len(self.groups))
+        self.stats.add(codes, values)
+        return np.unique(codes)
+
+    def _write_stats(self, codes):
+        index = self.store.index
+        stats = self.stats.stats(STATS)
+        for code in codes:
+            frame = pd.DataFrame({stat: stats[stat][code] for stat in STATS},
+                                 index=index)
+            frame.to_csv(os.path.join(self.datadir,
+                                      self.groups[code] + '_stats.csv'))
+
+    def _append(self, filepaths, results):
+        """
+        process and store one batch of read files; returns the result of
+        every file
+        """
+        coll = Collection._from_results(filepaths, results, self.dtype)
+        pipeline._process(coll, self.resampler, self.stitcher, self.jump)
+        coll = pipeline._finish(coll, self.qa, self.indices, None)
+
+        report = {os.path.abspath(f): {'filepath': f,
+                                       'name': os.path.basename(f),
+                                       'error': None, 'stored': False}
+                  for f in filepaths}
+        for filepath, error in coll.failures:
+            report[os.path.abspath(filepath)]['error'] = error
+            sys.stderr.write(" ".join(["ERROR:", filepath, error]) + "\n")
+        for filepath, result in zip(filepaths, results):
+            if result[0] is None and result[1] is None:
+                # the reader reported why on stderr
+                report[os.path.abspath(filepath)]['error'] = "not read"
+        failures = [(r['filepath'], r['error']) for r in report.values()
+                    if r['error'] is not None]
+        if failures:
+            pipeline._append_csv(pd.DataFrame(failures,
+                                              columns=['filepath', 'error']),
+                                 os.path.join(self.outdir, 'failures.csv'),
+                                 index=False)
+        by_name = {r['name']: r for r in report.values()}
+        if self.qa is not None and coll.qa is not None:
+            frame = coll.qa.to_frame()
+            pipeline._append_csv(frame, os.path.join(self.outdir, 'qa.csv'))
+            for name, row in frame.iterrows():
+                by_name[name]['qa'] = {k: _json_value(v)
+                                       for k, v in row.items()}
+        if self.indices is not None and coll.indices is not None:
+            pipeline._append_csv(coll.indices,
+                                 os.path.join(self.outdir, 'indices.csv'))
+            for name, row in coll.indices.iterrows():
+                by_name[name]['indices'] = {k: _json_value(v)
+                                            for k, v in row.items()}
+
+        if coll.spectra:
+            values = self.store.append(coll)
+            names = [s.name for s in coll._rows]
+            layer = self.store.layers.index("pct_reflect")
+            self._write_stats(self._add_stats(names, values[layer]))
+            for name in names:
+                self.names.add(name)
+                by_name[name]['stored'] = True
+        return [report[os.path.abspath(f)] for f in filepaths]
+
+    async def start(self):
+        """
+        start reading and storing submitted files
+        """
+        self.queue = asyncio.Queue(self.max_pending)
+        self._pool = EXECUTORS[self.executor](max_workers=self.workers)
+        self._task = asyncio.ensure_future(self._consume())
+
+    async def submit(self, filepath):
+        """
+        Queue a file, waiting while the queue is full.
+
+        Returns
+        -------
+        asyncio.Future
+            Resolves to a dict of the file's filepath, name, error (None
+            if it was read), stored, and, with the qa and indices options,
+            its quality flags and spectral indices.
+        """
+        future = asyncio.get_event_loop().create_future()
+        await self.queue.put((filepath, future))
+        return future
+
+    async def _consume(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            items = [await self.queue.get()]
+            deadline = loop.time() + self.batch_delay
+            while len(items) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self.queue.get(),
+                                                        timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._ingest(items)
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+
+    async def _ingest(self, items):
+        loop = asyncio.get_event_loop()
+        batch, seen = [], set()
+        for filepath, future in items:
+            name = os.path.basename(filepath)
+            if name in self.names or name in seen:
+                future.set_result({'filepath': filepath, 'name': name,
+                                   'error': "already ingested",
+                                   'stored': False})
+            else:
+                seen.add(name)
+                batch.append((filepath, future))
+        if not batch:
+            return
+        filepaths = [filepath for filepath, future in batch]
+        dtype = self.dtype if self.dtype is not None else np.float64
+        try:
+            results = await asyncio.gather(*[
+                loop.run_in_executor(self._pool, _read_file_profiled,
+                                     filepath, False, dtype)
+                for filepath in filepaths])
+            # storing runs off the event loop, one batch at a time
+            reports = await loop.run_in_executor(None, self._append,
+                                                 filepaths, results)
+        except Exception as e:
+            for filepath, future in batch:
+                future.set_exception(e)
+            return
+        for (filepath, future), report in zip(batch, reports):
+            future.set_result(report)
+
+    async def join(self):
+        """
+        wait until every submitted file is stored
+        """
+        await self.queue.join()
+
+    async def close(self):
+        """
+        store the submitted files, then stop
+        """
+        await self.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._pool.shutdown()
+
+    async def watch(self, indir, interval=1.0):
+        """
+        Submit every file appearing in `indir`, once its size and
+        modification time are the same on two polls `interval` seconds
+        apart. Runs until cancelled.
+        """
+        sizes, submitted = {}, set()
+        while True:
+            for filepath in list_files(indir):
+                name = os.path.basename(filepath)
+                if filepath in submitted or name in self.names:
+                    continue
+                st = os.stat(filepath)
+                key = (st.st_size, st.st_mtime)
+                if sizes.get(filepath) == key:
+                    submitted.add(filepath)
+                    del sizes[filepath]
+                    await self.submit(filepath)
+                else:
+                    sizes[filepath] = key
+            await asyncio.sleep(interval)
+
+    async def _handle(self, reader, writer):
+        try:
+            name = os.path.basename((await reader.readline()).decode().strip())
+            contents = await reader.read()
+            filepath = os.path.join(self.inbox, name)
+            if not name or name in self.names or os.path.exists(filepath):
+                result = {'filepath': filepath, 'name': name,
+                          'error': "already ingested" if name else
+                          "no file name", 'stored': False}
+            else:
+                with open(filepath, 'wb') as f:
+                    f.write(contents)
+                result = await (await self.submit(filepath))
+            writer.write((json.dumps(result) + "\n").encode())
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=PORT, path=None):
+        """
+        Accept uploads on `host`:`port`, or on the unix socket `path`.
+
+        Returns
+        -------
+        asyncio.AbstractServer
+        """
+        if path is not None:
+            return await asyncio.start_unix_server(self._handle, path)
+        return await asyncio.start_server(self._handle, host, port)
+
+
+def send(filepath, host="127.0.0.1", port=PORT, path=None):
+    """
+    Upload a file to an Ingestor serving on a socket.
+
+    Returns
+    -------
+    dict
+        Result of the file, see Ingestor.submit.
+    """
+    import socket
+
+    if path is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+    else:
+        sock = socket.create_connection((host, port))
+    with sock, open(filepath, 'rb') as f:
+        sock.sendall(os.path.basename(filepath).encode() + b"\n")
+        sock.sendall(f.read())
+        sock.shutdown(socket.SHUT_WR)
+        reply = b"".join(iter(lambda: sock.recv(65536), b""))
+    return json.loads(reply.decode())
+
+
+async def run(ingestor, indir=None, interval=1.0, host="127.0.0.1",
+              port=None, path=None):
+    """
+    run an Ingestor watching `indir` and serving on a socket until
+    cancelled
+    """
+    await ingestor.start()
+    server = None
+    if port is not None or path is not None:
+        server = await ingestor.serve(host, port, path)
+    try:
+        if indir is not None:
+            await ingestor.watch(indir, interval)
+        else:
+            await asyncio.Event().wait()
+    finally:
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+        await ingestor.close()
+
+
+def main(argv=None):
+    """
+    run the ingestion service with command line arguments `argv`,
+    sys.argv[1:] by default
+    """
+    from .cli import add_processing_arguments, processing_options
+
+    parser = argparse.ArgumentParser(description="SpecDAL Ingestion")
+    parser.add_argument('outdir', help='output directory')
+    parser.add_argument('--watch', default=None, metavar='INDIR',
+                        help='ingest new files of this directory')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='seconds between polls of --watch')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=None,
+                        help='accept uploads on this TCP port')
+    parser.add_argument('--socket', default=None, metavar='PATH',
+                        help='accept uploads on this unix socket')
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help='largest number of files stored at once')
+    parser.add_argument('--batch-delay', type=float, default=1.0,
+                        help='seconds a batch waits for more files')
+    parser.add_argument('--max-pending', type=int, default=1000,
+                        help='number of files queued before uploads wait')
+    add_processing_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.watch is None and args.port is None and args.socket is None:
+        parser.error("give --watch, --port or --socket")
+
+    ingestor = Ingestor(args.outdir, resampler=args.resampler,
+                        stitcher=args.stitcher,
+                        group_by_separator=args.group_by_separator,
+                        workers=args.jobs, executor=args.executor,
+                        max_pending=args.max_pending,
+                        batch_size=args.batch_size,
+                        batch_delay=args.batch_delay,
+                        dtype=np.dtype(args.dtype),
+                        **processing_options(args))
+    try:
+        asyncio.run(run(ingestor, args.watch, args.interval, args.host,
+                        args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,357 @@
+"""
+Similarity search in spectral libraries.
+
+A LibraryIndex holds the reflectance of reference spectra sharing one
+wavelength axis, e.g. a resampled Collection, and finds the library
+spectra nearest to query spectra by
+
+- 'angle': the spectral angle, in radians;
+- 'euclidean': the Euclidean distance;
+- 'correlation': one minus the Pearson correlation.
+
+Library spectra are normalized once per metric so that Euclidean
+distance between normalized vectors ranks the metric (unit vectors for
+the angle, centered unit vectors for the correlation). A batch of queries
+is then ranked against the whole library with one matrix multiply. With
+`components`, the normalized vectors are also projected on their first
+principal components and indexed by a k-d tree; candidates found in that
+space are re-ranked by the exact metric, which makes queries against large
+libraries fast at the cost of possibly missing a neighbour that the
+projection moves too far away.
+
+Indices are written to a directory with `save` and read back, memory-
+mapped, with `load`.
+"""
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+from .plans import PlanCache
+from .transforms import BandPlan
+from . import store
+
+METRICS = ('angle', 'euclidean', 'correlation')
+FORMAT_VERSION = 1
+
+# interpolation of queries onto library wavelength axes
+plans = PlanCache(BandPlan, maxsize=8)
+
+
+def normalize(values, metric):
+    """
+    Rows of `values` in the space where the Euclidean distance ranks
+    `metric`: unit vectors for 'angle', centered unit vectors for
+    'correlation', the values themselves for 'euclidean'. Rows of zero
+    norm are left zero.
+    """
+    values = np.asarray(values)
+    if metric == 'euclidean':
+        return values
+    if metric == 'correlation':
+        values = values - values.mean(axis=1, keepdims=True)
+    norms = np.sqrt(np.einsum('ij,ij->i', values, values))
+    return values / np.where(norms > 0, norms, 1)[:, np.newaxis]
+
+
+def _distance(squared, metric):
+    """
+    metric of the squared Euclidean distances between normalized vectors
+    """
+    squared = np.maximum(squared, 0)
+    if metric == 'angle':
+        return np.arccos(np.clip(1 - squared/2, -1, 1))
+    if metric == 'correlation':
+        return squared/2
+    return np.sqrt(squared)
+
+
+def _pca(values, components, seed=0):
+    """
+    mean and (components x bands) principal axes of the rows of `values`;
+    a randomized SVD (Halko et al.) is used for large matrices
+    """
+    center = values.mean(axis=0)
+    centered = values - center
+    components = min(components, *centered.shape)
+    if min(centered.shape) <= 500:
+        basis = np.linalg.svd(centered, full_matrices=False)[2]
+        return center, basis[:components]
+    rng = np.random.RandomState(seed)
+    sample = centered @ rng.standard_normal((centered.shape[1],
+                                             components + 10)).astype(
+        centered.dtype)
+    for _ in range(4):
+        sample = np.linalg.qr(sample)[0]
+        sample = centered @ (centered.T @ sample)
+    q = np.linalg.qr(sample)[0]
+    basis = np.linalg.svd(q.T @ centered, full_matrices=False)[2]
+    return center, basis[:components]
+
+
+class _Space(object):
+    """
+    library vectors normalized for one metric, and their projection on
+    principal components
+    """
+    ARRAYS = ('vectors', 'sqnorms', 'center', 'basis', 'projected')
+
+    def __init__(self, vectors, center=None, basis=None, projected=None,
+                 sqnorms=None):
+        self.vectors = vectors
+        if sqnorms is None:
+            sqnorms = np.einsum('ij,ij->i', vectors, vectors,
+                                dtype=np.float64)
+        self.sqnorms = sqnorms
+        self.center = center
+        self.basis = basis
+        self.projected = projected
+        self._tree = None
+
+    @classmethod
+    def build(cls, values, metric, components=None):
+        vectors = normalize(values, metric).astype(values.dtype, copy=False)
+        if not components:
+            return cls(vectors)
+        center, basis = _pca(vectors, components)
+        return cls(vectors, center, basis, (vectors - center) @ basis.T)
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(self.projected)
+        return self._tree
+
+    def candidates(self, vectors, k, candidates):
+        """
+        (queries x candidates) rows of the library nearest to normalized
+        query vectors
+        """
+        n = len(self.vectors)
+        if self.basis is not None and candidates < n:
+            projected = (vectors - self.center) @ self.basis.T
+            rows = self.tree.query(projected, k=candidates)[1]
+            return rows.reshape(len(vectors), candidates)
+        # squared distances up to the query's own norm, which is the same
+        # for every row
+        squared = self.sqnorms[np.newaxis] - 2*(vectors @ self.vectors.T)
+        if k < n:
+            rows = np.argpartition(squared, k - 1, axis=1)[:, :k]
+        else:
+            rows = np.broadcast_to(np.arange(n), squared.shape)
+        return np.asarray(rows)
+
+
+class LibraryIndex(object):
+    """
+    Nearest-neighbour index of a library of spectra.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        (spectra x wavelengths) reflectance matrix.
+    wavelengths: array-like
+    names: list of string
+    components: int, optional
+        Number of principal components of the normalized vectors indexed
+        by a k-d tree; every query is compared with the whole library if
+        None.
+    exclude: list of (float, float), optional
+        Wavelength ranges left out, e.g. qa.WATER_BANDS. Wavelengths
+        where any library spectrum is NaN are left out too.
+    metadata: list of dict, optional
+    dtype: numpy floating point dtype
+        dtype of the normalized vectors.
+    """
+    def __init__(self, values, wavelengths, names, components=None,
+                 exclude=None, metadata=None, dtype=np.float32):
+        values = np.asarray(values, dtype=np.float64)
+        self.wavelengths = np.asarray(wavelengths, dtype=float)
+        self.names = pd.Index(names)
+        self.metadata = list(metadata) if metadata is not None else \
+            [{} for _ in self.names]
+        self.components = components
+        bands = np.isfinite(values).all(axis=0)
+        for start, stop in exclude or ():
+            bands &= (self.wavelengths < start) | (self.wavelengths > stop)
+        self.bands = bands
+        self.values = values[:, bands].astype(dtype)
+        self.mean = values[:, bands].mean(axis=0) if len(values) else \
+            np.zeros(bands.sum())
+        self._spaces = {}
+
+    @classmethod
+    def from_collection(cls, collection, **kwargs):
+        """
+        Index the reflectance of the spectra of a Collection sharing one
+        wavelength axis, e.g. after resampling; see LibraryIndex.
+        """
+        return cls(collection.matrix, collection.wavelengths,
+                   collection.names,
+                   metadata=[s.metadata for s in collection._rows],
+                   **kwargs)
+
+    def __len__(self):
+        return len(self.names)
+
+    def space(self, metric):
+        """
+        the library normalized for `metric`, built on first use
+        """
+        if metric not in self._spaces:
+            self._spaces[metric] = _Space.build(self.values, metric,
+                                                self.components)
+        return self._spaces[metric]
+
+    def _prepare(self, values, wavelengths):
+        """
+        (queries x bands) query values on the library bands; values off
+        the query's axis or NaN are replaced by the library mean
+        """
+        values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+        if wavelengths is not None and not np.array_equal(
+                np.asarray(wavelengths, dtype=float), self.wavelengths):
+            plan = plans.get(wavelengths,
+                             tuple(self.wavelengths[self.bands]))
+            values = plan.apply(values)
+        else:
+            values = values[:, self.bands]
+        missing = np.isnan(values)
+        if missing.any():
+            values = np.where(missing, self.mean, values)
+        return values
+
+    def query(self, values, wavelengths=None, metric="angle", k=5,
+              candidates=None):
+        """
+        Library spectra nearest to query spectra.
+
+        Parameters
+        ----------
+        values: np.ndarray
+            (queries x wavelengths) reflectance, or one spectrum.
+        wavelengths: array-like, optional
+            Wavelengths of `values`, interpolated linearly onto the
+            library's; the library's by default.
+        metric: {'angle', 'euclidean', 'correlation'}
+        k: int
+            Number of neighbours.
+        candidates: int, optional
+            With components, number of neighbours taken in the projected
+            space and re-ranked by the exact metric; 10*k by default.
+
+        Returns
+        -------
+        (rows, distances)
+            (queries x k) arrays of library rows, nearest first, and their
+            distance by `metric`.
+            None is returned if the metric is not supported.
+        """
+        if metric not in METRICS:
+            msg = " ".join(["ERROR: metric", str(metric),
+                            "not supported.\n"])
+            sys.stderr.write(msg)
+            return
+        space = self.space(metric)
+        k = min(k, len(self))
+        if candidates is None:
+            candidates = 10*k
+        candidates = max(k, min(candidates, len(self)))
+        vectors = normalize(self._prepare(values, wavelengths), metric)
+
+        rows_out = np.empty((len(vectors), k), dtype=int)
+        dist_out = np.empty((len(vectors), k))
+        # bounded (queries x library) and (queries x candidates x bands)
+        # work arrays
+        width = candidates if space.basis is not None else k
+        step = max(1, min(2**24 // max(len(self), 1),
+                          2**22 // max(width*vectors.shape[1], 1)))
+        for start in range(0, len(vectors), step):
+            block = vectors[start:start + step]
+            rows = space.candidates(block.astype(space.vectors.dtype), k,
+                                    candidates)
+            # exact distances of the candidates, in float64
+            diff = space.vectors[rows] - block[:, np.newaxis, :]
+            squared = np.einsum('qcb,qcb->qc', diff, diff)
+            order = np.argsort(squared, axis=1, kind='stable')[:, :k]
+            rows_out[start:start + step] = np.take_along_axis(rows, order, 1)
+            dist_out[start:start + step] = _distance(
+                np.take_along_axis(squared, order, 1), metric)
+        return rows_out, dist_out
+
+    def search(self, collection, metric="angle", k=5, candidates=None):
+        """
+        Library spectra nearest to every spectrum of a Collection.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per spectrum and neighbour, indexed by the spectrum
+            name, with the rank of the neighbour, its name ('match') and
+            its distance.
+        """
+        result = self.query(collection.matrix, collection.wavelengths,
+                            metric, k, candidates)
+        if result is None:
+            return
+        rows, distances = result
+        k = rows.shape[1]
+        return pd.DataFrame({'rank': np.tile(np.arange(1, k + 1), len(rows)),
+                             'match': self.names.values[rows.ravel()],
+                             'distance': distances.ravel()},
+                            index=np.repeat(collection.names.values, k))
+
+    def save(self, path, metrics=METRICS):
+        """
+        Write the index to directory `path`, with the normalized vectors
+        of `metrics` so that loading it builds nothing.
+        """
+        if not os.path.exists(path):
+            os.makedirs(path)
+        arrays = {'wavelengths': self.wavelengths, 'bands': self.bands,
+                  'values': self.values, 'mean': self.mean}
+        for metric in metrics:
+            space = self.space(metric)
+            for name in _Space.ARRAYS:
+                if getattr(space, name) is not None:
+                    arrays[metric + '_' + name] = getattr(space, name)
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + '.npy'), array)
+        store._write_json(os.path.join(path, 'library.json'),
+                          {'format': 'specdal-library',
+                           'version': FORMAT_VERSION,
+                           'names': [str(n) for n in self.names],
+                           'metadata': self.metadata,
+                           'components': self.components,
+                           'metrics': list(metrics)})
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Read an index written by `save`, memory-mapping its arrays by
+        default.
+        """
+        mode = 'r' if mmap else None
+        with open(os.path.join(path, 'library.json')) as f:
+            meta = json.load(f)
+
+        def load_array(name):
+            return np.load(os.path.join(path, name + '.npy'), mmap_mode=mode)
+        index = cls.__new__(cls)
+        index.wavelengths = np.load(os.path.join(path, 'wavelengths.npy'))
+        index.names = pd.Index(meta['names'])
+        index.metadata = meta['metadata']
+        index.components = meta['components']
+        index.bands = load_array('bands')
+        index.values = load_array('values')
+        index.mean = load_array('mean')
+        index._spaces = {}
+        for metric in meta['metrics']:
+            arrays = {}
+            for name in _Space.ARRAYS:
+                filepath = os.path.join(path, metric + '_' + name + '.npy')
+                if os.path.exists(filepath):
+                    arrays[name] = np.load(filepath, mmap_mode=mode)
+            index._spaces[metric] = _Space(**arrays)
+        return index
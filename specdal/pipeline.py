@@ -0,0 +1,528 @@
+"""
+Streaming and partitioned execution of the SpecDAL pipeline.
+
+`stream` reads, resamples and stitches files a chunk at a time, and each
+chunk's spectra are appended to their group's output before the next chunk
+is read, so memory use depends on the chunk size, not on the number of
+files.
+
+`partitioned` runs the same stages on partitions of the files as tasks of
+an execution backend (see specdal.backends), possibly on many machines,
+and reduces the group statistics of the partitions pairwise in a tree.
+"""
+import os
+import sys
+import numpy as np
+import pandas as pd
+import functools
+from .collection import Collection, EXECUTORS, list_files
+from .groups import GroupStats, RunningStats, group_keys
+from . import resamplers
+from . import stitchers
+from . import plotting
+from . import profiling
+from . import qa as quality
+from . import transforms
+
+
+def process_files(filepaths, resampler=None, stitcher=None, workers=None,
+                  executor="process", pool=None, cache=None, dtype=None,
+                  qa=None, jump=None, indices=None, transform=None):
+    """
+    Read, resample and stitch files into a Collection, keeping their order.
+
+    Parameters
+    ----------
+    filepaths: list of string
+    resampler: {'slinear', 'cubic'}, optional
+    stitcher: {'mean', 'blending'}, optional
+    workers, executor, pool:
+        Parallel reading, see Collection.from_files.
+    cache: SpectrumCache, optional
+        Spectra of unchanged files are loaded from the cache; the others
+        are processed and added to it.
+    dtype: numpy floating point dtype, optional
+        dtype of the data, kept through every stage; float64 by default.
+    qa: dict, optional
+        Keyword arguments of qa.check. If given, the processed spectra are
+        checked, the flagged ones left out of the result, and the
+        QAResult of every spectrum kept as its `qa` attribute.
+    jump: dict, optional
+        Keyword arguments of stitchers.jump_correct, applied to the spectra
+        as read, before resampling.
+    indices: list of string, optional
+        Spectral indices of transforms.INDICES computed from the
+        reflectance of the result, after quality checks, and kept as its
+        `indices` attribute, a (spectra x indices) DataFrame; all of them
+        if empty.
+    transform: dict, optional
+        Keyword arguments of transforms.filter_collection applied last,
+        e.g. {'method': 'savgol', 'deriv': 1}.
+
+    Returns
+    -------
+    Collection
+    """
+    keys, cached, missing = {}, {}, []
+    for filepath in filepaths:
+        if cache is not None:
+            keys[filepath] = cache.key(filepath)
+            with profiling.stage("cache"):
+                spectrum = cache.get(keys[filepath])
+            if spectrum is not None:
+                cached[filepath] = spectrum
+                profiling.count("cache_hits")
+                continue
+            profiling.count("cache_misses")
+        missing.append(filepath)
+
+    with profiling.stage("read"):
+        coll = Collection.from_files(missing, workers=workers,
+                                     executor=executor, pool=pool,
+                                     dtype=dtype)
+    profiling.count("files", len(missing))
+    profiling.count("failures", len(coll.failures))
+    _process(coll, resampler, stitcher, jump)
+    if cache is None:
+        return _finish(coll, qa, indices, transform)
+
+    processed = {}
+    for spectrum in coll.spectra or []:
+        filepath = spectrum.metadata['filepath']
+        processed[filepath] = spectrum
+    with profiling.stage("cache"):
+        for filepath in missing:
+            spectrum = processed.get(os.path.abspath(filepath))
+            if spectrum is not None:
+                cache.put(keys[filepath], spectrum)
+
+    result = Collection(dtype=dtype)
+    result.failures = coll.failures
+    for filepath in filepaths:
+        spectrum = cached.get(filepath,
+                              processed.get(os.path.abspath(filepath)))
+        if spectrum is not None:
+            result.add_spectrum(spectrum)
+    return _finish(result, qa, indices, transform)
+
+
+def _process(coll, resampler, stitcher, jump):
+    """
+    jump correction, resampling and stitching of spectra as read
+    """
+    if not coll.spectra:
+        return coll
+    if jump is not None:
+        with profiling.stage("jump"):
+            stitchers.jump_correct(coll, **jump)
+    if resampler:
+        with profiling.stage("resample"):
+            resamplers.resample_collection(coll, method=resampler)
+    if stitcher:
+        with profiling.stage("stitch"):
+            stitchers.stitch_collection(coll, method=stitcher)
+    return coll
+
+
+def _finish(coll, qa, indices, transform):
+    """
+    quality checks, spectral indices and filters of a processed Collection
+    """
+    if qa is not None:
+        coll.qa = None
+        if coll.spectra:
+            with profiling.stage("qa"):
+                report = quality.check(coll, **qa)
+                kept = quality.drop_flagged(coll, report)
+            profiling.count("flagged", int(report.flagged().sum()))
+            kept.qa = report
+            coll = kept
+    if indices is not None:
+        coll.indices = None
+        if coll.spectra:
+            with profiling.stage("indices"):
+                coll.indices = transforms.indices(coll, indices or None)
+    if transform is not None and coll.spectra:
+        with profiling.stage("transform"):
+            transforms.filter_collection(coll, **transform)
+    return coll
+
+
+def iter_chunks(filepaths, chunksize=1000, resampler=None, stitcher=None,
+                workers=None, executor="process", cache=None, dtype=None,
+                qa=None, jump=None, indices=None, transform=None):
+    """
+    Yield a processed Collection for every `chunksize` files.
+
+    One pool is shared by all chunks when workers > 1; only one chunk of
+    files is submitted to it at a time.
+    """
+    pool = None
+    if workers is not None and workers > 1:
+        pool = EXECUTORS[executor](max_workers=workers)
+    try:
+        for start in range(0, len(filepaths), chunksize):
+            yield process_files(filepaths[start:start + chunksize],
+                                resampler, stitcher, pool=pool, cache=cache,
+                                dtype=dtype, qa=qa, jump=jump,
+                                indices=indices, transform=transform)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+class GroupAccumulator(object):
+    """
+    Running count, mean, variance, minimum and maximum of the spectra of
+    one group, on the wavelength axis of the first spectra added; see
+    groups.RunningStats.
+    """
+    STATS = ('mean', 'std', 'min', 'max', 'count')
+
+    def __init__(self, index):
+        self.index = index
+        self.running = RunningStats(1, len(index))
+
+    def add(self, data):
+        """
+        add the columns of a (wavelengths x spectra) DataFrame
+        """
+        values = data.reindex(self.index).values.T
+        self.running.add(np.zeros(len(values), dtype=int), values)
+
+    def stats(self):
+        stats = self.running.stats(self.STATS)
+        return pd.DataFrame({stat: stats[stat][0] for stat in self.STATS},
+                            index=self.index, columns=list(self.STATS))
+
+
+class GroupWriter(object):
+    """
+    Appends the spectra of each Collection to one CSV per group and keeps a
+    GroupAccumulator per group.
+
+    Parameters
+    ----------
+    datadir: string
+        Directory receiving <group>.csv files.
+    separator: string, optional
+        Separator of the spectrum names; all spectra form one group "all"
+        if None.
+    element_inds: list of int
+        Positions of the name elements forming a group.
+    format: {"csv", "npy"}
+        Write <group>.csv files, or <group> binary stores appended to
+        chunk by chunk (see specdal.store).
+    """
+    def __init__(self, datadir, separator=None, element_inds=(),
+                 format="csv"):
+        self.datadir = datadir
+        self.format = format
+        self.separator = separator
+        self.element_inds = list(map(int, element_inds))
+        self.groups = {}
+
+    def write(self, coll):
+        data = coll.data
+        if data is None or data.shape[1] == 0:
+            return
+        with profiling.stage("group"):
+            if self.separator is None:
+                keys = np.full(data.shape[1], "all", dtype=object)
+            else:
+                keys = coll.group_index(self.separator,
+                                        *self.element_inds).keys
+            groups = list(data.groupby(by=keys, axis=1))
+        with profiling.stage("write"):
+            self._write_groups(coll, groups)
+
+    def _write_groups(self, coll, groups):
+        for gname, gdata in groups:
+            first = gname not in self.groups
+            if first:
+                self.groups[gname] = GroupAccumulator(gdata.index)
+            accumulator = self.groups[gname]
+            if self.format == "npy":
+                coll.save(os.path.join(self.datadir, gname),
+                          names=gdata.columns, append=not first)
+            else:
+                if not gdata.index.equals(accumulator.index):
+                    gdata = gdata.reindex(accumulator.index)
+                gdata.transpose().to_csv(
+                    os.path.join(self.datadir, gname + '.csv'),
+                    mode='w' if first else 'a', header=first)
+            accumulator.add(gdata)
+
+
+def _append_csv(frame, path, **kwargs):
+    exists = os.path.exists(path)
+    frame.to_csv(path, mode='a' if exists else 'w', header=not exists,
+                 **kwargs)
+
+
+def stream(indir, outdir, resampler=None, stitcher=None,
+           group_by_separator=None, chunksize=1000, workers=None,
+           executor="process", figures=True, cache=None, format="csv",
+           dtype=None, qa=None, jump=None, indices=None, transform=None):
+    """
+    Run the pipeline over `indir` a chunk of files at a time.
+
+    Writes, under `outdir`, data/<group>.csv (or the binary store
+    data/<group> with format="npy") with the group's spectra as they are
+    processed, data/<group>_stats.csv with the group's mean, std, min, max
+    and count, figures/<group>.png with the group mean and spread,
+    mask.csv, and failures.csv for files that could not be read.
+    Spectra of unchanged files are taken from `cache` if given, and data
+    is processed as `dtype` (float64 by default). With `qa`, keyword
+    arguments of qa.check, spectra failing a quality check are left out
+    and the flags of every spectrum are written to qa.csv. `jump`,
+    keyword arguments of stitchers.jump_correct, corrects detector steps.
+    The spectral `indices` of every spectrum are written to indices.csv,
+    and `transform`, keyword arguments of transforms.filter_collection,
+    filters the spectra before they are grouped.
+
+    Returns
+    -------
+    dict
+        GroupAccumulator of every group.
+    """
+    figdir = os.path.join(outdir, 'figures')
+    datadir = os.path.join(outdir, 'data')
+    for d in (outdir, figdir, datadir):
+        if not os.path.exists(d):
+            os.makedirs(d)
+    maskpath = os.path.join(outdir, 'mask.csv')
+    failpath = os.path.join(outdir, 'failures.csv')
+    qapath = os.path.join(outdir, 'qa.csv')
+    indexpath = os.path.join(outdir, 'indices.csv')
+    for path in (maskpath, failpath, qapath, indexpath):
+        if os.path.exists(path):
+            os.remove(path)
+
+    separator, element_inds = None, ()
+    if group_by_separator:
+        separator, element_inds = (group_by_separator[0],
+                                   group_by_separator[1:])
+    writer = GroupWriter(datadir, separator, element_inds, format)
+
+    chunks = iter_chunks(list_files(indir), chunksize, resampler, stitcher,
+                         workers, executor, cache, dtype, qa, jump, indices,
+                         transform)
+    for coll in chunks:
+        for filepath, error in coll.failures:
+            sys.stderr.write(" ".join(["ERROR:", filepath, error]) + "\n")
+        if coll.failures:
+            _append_csv(pd.DataFrame(coll.failures,
+                                     columns=['filepath', 'error']),
+                        failpath, index=False)
+        if qa is not None and coll.qa is not None:
+            with profiling.stage("write"):
+                _append_csv(coll.qa.to_frame(), qapath)
+        if indices is not None and coll.indices is not None:
+            with profiling.stage("write"):
+                _append_csv(coll.indices, indexpath)
+        if coll.spectra:
+            writer.write(coll)
+            with profiling.stage("write"):
+                _append_csv(coll.mask, maskpath)
+
+    stats = []
+    with profiling.stage("write"):
+        for gname, accumulator in writer.groups.items():
+            stats.append((gname, accumulator.stats()))
+            stats[-1][1].to_csv(os.path.join(datadir, gname + '_stats.csv'))
+    if figures:
+        with profiling.stage("plot"):
+            plotting.render_groups(stats, figdir, workers=workers,
+                                   executor=executor, kind="stats")
+    return writer.groups
+
+
+def _partition(options, partition):
+    """
+    process one (number, filepaths) partition into a partial result of
+    reduce_partitions
+    """
+    # partitions processed in another process record into a profiler of
+    # their own, whose records are returned to be merged in this one
+    worker = options['profile'] and os.getpid() != options['pid']
+    if worker:
+        previous = profiling.active()
+        profiler = profiling.enable(profiling.Profiler())
+    try:
+        result = _process_partition(options, partition)
+    finally:
+        if worker:
+            if previous is None:
+                profiling.disable()
+            else:
+                profiling.enable(previous)
+    result['profiles'] = [profiler.records()] if worker else []
+    return result
+
+
+def _process_partition(options, partition):
+    number, filepaths = partition
+    separator, element_inds = options['separator'], options['element_inds']
+    coll = process_files(filepaths, options['resampler'],
+                         options['stitcher'], dtype=options['dtype'],
+                         qa=options['qa'], jump=options['jump'],
+                         indices=options['indices'],
+                         transform=options['transform'])
+    result = {'failures': list(coll.failures), 'stats': None, 'mask': None,
+              'qa': None, 'indices': None}
+    if options['qa'] is not None and coll.qa is not None:
+        result['qa'] = coll.qa.to_frame()
+    if options['indices'] is not None:
+        result['indices'] = coll.indices
+    if coll.spectra:
+        names = coll.names
+        if separator is None:
+            keys = ["all"]*len(names)
+        else:
+            keys = group_keys(names, separator, element_inds)
+        result['mask'] = coll.mask
+        result['stats'] = GroupStats(coll._index).add(keys, coll.matrix)
+        if options['savedir'] is not None:
+            coll.save(os.path.join(options['savedir'],
+                                   'part_{:06d}'.format(number)))
+    return result
+
+
+def _merge_partitions(a, b):
+    """
+    partial result of the partitions of both partial results, in order
+    """
+    merged = {'failures': a['failures'] + b['failures'],
+              'profiles': a['profiles'] + b['profiles']}
+    for key in ('mask', 'qa', 'indices'):
+        frames = [r[key] for r in (a, b) if r[key] is not None]
+        merged[key] = pd.concat(frames) if frames else None
+    stats = [r['stats'] for r in (a, b) if r['stats'] is not None]
+    merged['stats'] = stats[0].merge(stats[1]) if len(stats) == 2 else \
+        (stats[0] if stats else None)
+    return merged
+
+
+def reduce_partitions(filepaths, backend=None, partition_size=1000,
+                      resampler=None, stitcher=None, group_by_separator=None,
+                      dtype=None, qa=None, jump=None, indices=None,
+                      transform=None, savedir=None):
+    """
+    Process partitions of the files as tasks of `backend` and reduce their
+    results pairwise in a tree.
+
+    Parameters
+    ----------
+    filepaths: list of string
+        Paths readable by every worker of the backend.
+    backend: LocalBackend or DaskBackend, optional
+        See specdal.backends; partitions are processed serially in this
+        process if None.
+    partition_size: int
+        Number of files per partition.
+    resampler, stitcher, dtype, qa, jump, indices, transform:
+        See process_files.
+    group_by_separator: list, optional
+        Separator, then the positions of the name elements forming a
+        group; all spectra form one group "all" if None.
+    savedir: string, optional
+        Directory receiving the spectra of every partition as the binary
+        store part_<number> (see Collection.save).
+
+    With profiling enabled, the stages of partitions processed in other
+    processes, e.g. by a process pool or dask workers, are merged into the
+    active profiler, so their times add up over the workers.
+
+    Returns
+    -------
+    dict
+        'stats': GroupStats of all spectra (None if no file was read),
+        'failures': (filepath, error) of files that could not be read,
+        'mask': mask DataFrame, 'qa': quality flags if qa is given and
+        'indices': spectral indices if indices is given, of all spectra
+        in file order.
+    """
+    from .backends import LocalBackend
+
+    separator, element_inds = None, []
+    if group_by_separator:
+        separator = group_by_separator[0]
+        element_inds = [int(e) for e in group_by_separator[1:]]
+    options = {'resampler': resampler, 'stitcher': stitcher,
+               'separator': separator, 'element_inds': element_inds,
+               'dtype': dtype, 'qa': qa, 'jump': jump, 'indices': indices,
+               'transform': transform, 'savedir': savedir,
+               'profile': profiling.active() is not None, 'pid': os.getpid()}
+    filepaths = list(filepaths)
+    partitions = [(n, filepaths[start:start + partition_size])
+                  for n, start in enumerate(range(0, len(filepaths),
+                                                  partition_size))]
+    if not partitions:
+        partitions = [(0, [])]
+    own = backend is None
+    if own:
+        backend = LocalBackend()
+    try:
+        partials = backend.map(functools.partial(_partition, options),
+                               partitions)
+        result = backend.compute(backend.reduce(_merge_partitions,
+                                                partials))
+    finally:
+        if own:
+            backend.close()
+    profiler = profiling.active()
+    for records in result.pop('profiles'):
+        profiler.merge(records)
+    return result
+
+
+def partitioned(indir, outdir, backend=None, partition_size=1000,
+                resampler=None, stitcher=None, group_by_separator=None,
+                figures=True, dtype=None, qa=None, jump=None, indices=None,
+                transform=None, save=False):
+    """
+    Run the pipeline over `indir` as partitions of files processed by an
+    execution backend; see reduce_partitions.
+
+    Writes, under `outdir`, data/<group>_stats.csv with the group's mean,
+    std, min, max and count, figures/<group>.png with the group mean and
+    spread, mask.csv, failures.csv, qa.csv with `qa` and indices.csv with
+    `indices`. With `save`, the spectra of every partition are written to
+    the binary store partitions/part_<number>.
+
+    Returns
+    -------
+    GroupStats
+        Statistics of every group, None if no file was read.
+    """
+    figdir = os.path.join(outdir, 'figures')
+    datadir = os.path.join(outdir, 'data')
+    savedir = os.path.join(outdir, 'partitions') if save else None
+    for d in (outdir, figdir, datadir, savedir):
+        if d is not None and not os.path.exists(d):
+            os.makedirs(d)
+
+    result = reduce_partitions(list_files(indir), backend, partition_size,
+                               resampler, stitcher, group_by_separator,
+                               dtype, qa, jump, indices, transform, savedir)
+    for filepath, error in result['failures']:
+        sys.stderr.write(" ".join(["ERROR:", filepath, error]) + "\n")
+    with profiling.stage("write"):
+        if result['failures']:
+            pd.DataFrame(result['failures'],
+                         columns=['filepath', 'error']).to_csv(
+                os.path.join(outdir, 'failures.csv'), index=False)
+        for key, filename in (('mask', 'mask.csv'), ('qa', 'qa.csv'),
+                              ('indices', 'indices.csv')):
+            if result[key] is not None:
+                result[key].to_csv(os.path.join(outdir, filename))
+        stats = []
+        if result['stats'] is not None:
+            stats = list(result['stats'].frames().items())
+            for gname, frame in stats:
+                frame.to_csv(os.path.join(datadir, gname + '_stats.csv'))
+    if figures and stats:
+        with profiling.stage("plot"):
+            plotting.render_groups(stats, figdir, kind="stats")
+    return result['stats']
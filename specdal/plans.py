@@ -0,0 +1,57 @@
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+
+class PlanCache(object):
+    """
+    Least-recently-used cache of plans precomputed for a wavelength grid.
+
+    Spectra from one instrument share their wavelength grid, so work that
+    depends only on the grid (segment detection, target index,
+    interpolation weights, ...) is done once per grid and reused.
+
+    Parameters
+    ----------
+    factory: callable
+        Called as factory(wavelengths, *args) to build a missing plan.
+    maxsize: int
+        Number of plans kept; the least recently used is dropped first.
+    """
+    def __init__(self, factory, maxsize=32):
+        self.factory = factory
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._plans = OrderedDict()
+
+    @staticmethod
+    def key(wavelengths, *args):
+        wavelengths = np.ascontiguousarray(wavelengths, dtype=float)
+        digest = hashlib.sha1(wavelengths.tobytes()).hexdigest()
+        return (len(wavelengths), digest) + args
+
+    def get(self, wavelengths, *args):
+        key = self.key(wavelengths, *args)
+        if key in self._plans:
+            self.hits += 1
+            self._plans.move_to_end(key)
+            return self._plans[key]
+        self.misses += 1
+        plan = self.factory(wavelengths, *args)
+        self._plans[key] = plan
+        while len(self._plans) > self.maxsize:
+            self._plans.popitem(last=False)
+        return plan
+
+    def clear(self):
+        self._plans.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'maxsize': self.maxsize, 'currsize': len(self._plans)}
+
+    def __len__(self):
+        return len(self._plans)
@@ -0,0 +1,132 @@
+"""
+Figures of spectra.
+
+Figures are drawn on standalone matplotlib Figures rendered by Agg, so
+no GUI backend is started, figures can be rendered in worker processes,
+and each figure is freed as soon as it has been saved.
+"""
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+
+EXECUTORS = {'process': ProcessPoolExecutor, 'thread': ThreadPoolExecutor}
+
+
+def decimate(data, max_lines=None, step=1):
+    """
+    Thin a (wavelengths x spectra) DataFrame for plotting.
+
+    Parameters
+    ----------
+    max_lines: int, optional
+        Keep at most this many evenly spaced spectra.
+    step: int
+        Keep every `step`-th wavelength.
+    """
+    if max_lines is not None and data.shape[1] > max_lines:
+        cols = np.unique(np.linspace(0, data.shape[1] - 1,
+                                     max_lines).round().astype(int))
+        data = data.iloc[:, cols]
+    if step > 1:
+        data = data.iloc[::step]
+    return data
+
+
+def plot_spectra(data, ax, title=None, legend=None):
+    """
+    Draw the columns of a (wavelengths x spectra) DataFrame as lines.
+
+    The legend is drawn if `legend` is True, or by default for at most 20
+    spectra.
+    """
+    ax.plot(data.index.values, data.values)
+    if legend is None:
+        legend = data.shape[1] <= 20
+    if legend:
+        ax.legend([str(name) for name in data.columns])
+    if title is not None:
+        ax.set_title(title)
+    if data.index.name is not None:
+        ax.set_xlabel(data.index.name)
+    ax.set_ylabel('reflectance %')
+    return ax
+
+
+def plot_stats(stats, ax, title=None):
+    """
+    Draw the mean and +-1 std band of a DataFrame with 'mean' and 'std'
+    columns.
+    """
+    ax.plot(stats.index, stats['mean'], label='mean')
+    ax.fill_between(stats.index, stats['mean'] - stats['std'],
+                    stats['mean'] + stats['std'], alpha=0.3, label='std')
+    if title is not None:
+        ax.set_title(title)
+    ax.set_ylabel('reflectance %')
+    ax.legend()
+    return ax
+
+
+def save_figure(figpath, data, title=None, kind="spectra"):
+    """
+    Render `data` with plot_spectra (kind="spectra") or plot_stats
+    (kind="stats") and save it to `figpath`.
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    ax = fig.subplots()
+    if kind == "stats":
+        plot_stats(data, ax, title=title)
+    else:
+        plot_spectra(data, ax, title=title)
+    fig.savefig(figpath, bbox_inches='tight')
+    fig.clf()
+    return figpath
+
+
+def _save_figure(args):
+    return save_figure(*args)
+
+
+def render_groups(groups, figdir, workers=None, executor="process",
+                  max_lines=None, step=1, kind="spectra"):
+    """
+    Save one <group>.png per group, rendering in a pool of workers.
+
+    Parameters
+    ----------
+    groups: iterable of (string, pd.DataFrame)
+        Group names and their (wavelengths x spectra) data, e.g. a
+        Collection.group_by_separator result.
+    figdir: string
+    workers: int, optional
+        Number of parallel renderers; figures are rendered serially if
+        None or 1.
+    executor: {"process", "thread"}
+    max_lines, step:
+        Decimation applied before rendering; see `decimate`.
+    kind: {"spectra", "stats"}
+
+    Returns
+    -------
+    list of string
+        Paths of the saved figures.
+    """
+    if executor not in EXECUTORS:
+        msg = " ".join(["ERROR:", str(executor), "not supported.\n"])
+        sys.stderr.write(msg)
+        return
+
+    tasks = []
+    for gname, gdata in groups:
+        if kind == "spectra":
+            gdata = decimate(gdata, max_lines, step)
+        tasks.append((os.path.join(figdir, gname + '.png'), gdata, gname,
+                      kind))
+
+    if workers is None or workers <= 1:
+        return list(map(_save_figure, tasks))
+    with EXECUTORS[executor](max_workers=workers) as pool:
+        return list(pool.map(_save_figure, tasks))
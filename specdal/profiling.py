@@ -0,0 +1,230 @@
+"""
+Timers and counters for the stages of the pipeline.
+
+Instrumentation is off by default: `stage` then returns a shared no-op
+context manager and `count` and `record_file` return at once, so
+instrumented code pays a global lookup per call. `enable` installs a
+Profiler, which accumulates stage times, counters and per-file read
+measurements and passes every event on to its hooks, e.g. to export them
+to a metrics system.
+
+    profiler = profiling.enable()
+    profiler.add_hook(lambda kind, name, value, labels: print(kind, name))
+    with profiling.stage("read"):
+        ...
+    profiler.save("profile.json")
+"""
+import os
+import csv
+import json
+import time
+import numpy as np
+
+# upper edges, in seconds, of the per-file read latency histogram; reads
+# slower than the last edge are counted in one more bin
+LATENCY_BINS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                1.0, 2.5, 5.0, 10.0)
+
+_profiler = None
+
+
+class _NullStage(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_null_stage = _NullStage()
+
+
+class _Stage(object):
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler(object):
+    """
+    Accumulates stage timings, counters and per-file read measurements.
+
+    Hooks are called as hook(kind, name, value, labels) for every event:
+    kind "stage" with the seconds spent in stage `name`, kind "counter"
+    with the increment of counter `name`, and kind "file" with the seconds
+    spent reading file `name` and labels reader, bytes and error.
+    """
+    def __init__(self, hooks=()):
+        self.hooks = list(hooks)
+        self.stages = {}
+        self.counters = {}
+        self.files = []
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+        return hook
+
+    def _emit(self, kind, name, value, labels):
+        for hook in self.hooks:
+            hook(kind, name, value, labels)
+
+    def stage(self, name):
+        """
+        context manager timing one call of stage `name`
+        """
+        return _Stage(self, name)
+
+    def add_time(self, name, seconds):
+        calls, total, longest = self.stages.get(name, (0, 0.0, 0.0))
+        self.stages[name] = (calls + 1, total + seconds,
+                             max(longest, seconds))
+        if self.hooks:
+            self._emit("stage", name, seconds, {})
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+        if self.hooks:
+            self._emit("counter", name, n, {})
+
+    def record_file(self, filepath, seconds, nbytes=0, error=None):
+        """
+        record the read of one file; its reader is the file extension
+        """
+        reader = os.path.splitext(filepath)[1]
+        self.files.append((filepath, reader, seconds, nbytes, error))
+        if self.hooks:
+            self._emit("file", filepath, seconds,
+                       {'reader': reader, 'bytes': nbytes, 'error': error})
+
+    def records(self):
+        """
+        stages, counters and file reads as plain data, e.g. to send them
+        from a worker process to be merged
+        """
+        return {'stages': dict(self.stages), 'counters': dict(self.counters),
+                'files': list(self.files)}
+
+    def merge(self, records):
+        """
+        add the `records` of another Profiler; stage times of workers
+        running in parallel add up to more than the wall time
+        """
+        for name, (calls, total, longest) in records['stages'].items():
+            mine = self.stages.get(name, (0, 0.0, 0.0))
+            self.stages[name] = (mine[0] + calls, mine[1] + total,
+                                 max(mine[2], longest))
+        for name, n in records['counters'].items():
+            self.counters[name] = self.counters.get(name, 0) + n
+        self.files.extend(tuple(f) for f in records['files'])
+        return self
+
+    def latency_histogram(self):
+        """
+        number of file reads per LATENCY_BINS bin, and slower
+        """
+        seconds = np.array([f[2] for f in self.files])
+        edges = np.concatenate([[0.0], LATENCY_BINS, [np.inf]])
+        return np.histogram(seconds, bins=edges)[0].tolist()
+
+    def report(self, slowest=10):
+        """
+        dict of stages, counters, per-reader totals, the latency histogram
+        and the `slowest` slowest files
+        """
+        readers = {}
+        for filepath, reader, seconds, nbytes, error in self.files:
+            totals = readers.setdefault(reader, {'files': 0, 'bytes': 0,
+                                                 'seconds': 0.0,
+                                                 'errors': 0})
+            totals['files'] += 1
+            totals['bytes'] += nbytes
+            totals['seconds'] += seconds
+            totals['errors'] += error is not None
+        files = sorted(self.files, key=lambda f: f[2], reverse=True)
+        return {
+            'stages': {name: {'calls': calls, 'seconds': total,
+                              'max_seconds': longest}
+                       for name, (calls, total, longest)
+                       in self.stages.items()},
+            'counters': dict(self.counters),
+            'readers': readers,
+            'latency_histogram': {'upper_edges': list(LATENCY_BINS),
+                                  'counts': self.latency_histogram()},
+            'slowest_files': [{'filepath': f[0], 'seconds': f[2],
+                               'bytes': f[3], 'error': f[4]}
+                              for f in files[:slowest]],
+        }
+
+    def save(self, path):
+        """
+        write the report as JSON, or as CSV rows of stages, counters and
+        files if `path` ends with .csv
+        """
+        if not path.endswith('.csv'):
+            with open(path, 'w') as f:
+                json.dump(self.report(), f, indent=1,
+                          default=lambda v: str(v))
+            return path
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['kind', 'name', 'count', 'seconds', 'bytes',
+                             'error'])
+            for name, (calls, total, longest) in self.stages.items():
+                writer.writerow(['stage', name, calls, total, '', ''])
+            for name, n in self.counters.items():
+                writer.writerow(['counter', name, n, '', '', ''])
+            for filepath, reader, seconds, nbytes, error in self.files:
+                writer.writerow(['file', filepath, 1, seconds, nbytes,
+                                 error or ''])
+        return path
+
+
+def enable(profiler=None):
+    """
+    start recording into `profiler`, or a new Profiler, and return it
+    """
+    global _profiler
+    _profiler = profiler if profiler is not None else Profiler()
+    return _profiler
+
+
+def disable():
+    """
+    stop recording; returns the profiler that was active
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+def active():
+    """
+    the active Profiler, None if profiling is disabled
+    """
+    return _profiler
+
+
+def stage(name):
+    if _profiler is None:
+        return _null_stage
+    return _profiler.stage(name)
+
+
+def count(name, n=1):
+    if _profiler is not None:
+        _profiler.count(name, n)
+
+
+def record_file(filepath, seconds, nbytes=0, error=None):
+    if _profiler is not None:
+        _profiler.record_file(filepath, seconds, nbytes, error)
@@ -0,0 +1,227 @@
+"""
+Quality checks of spectra.
+
+Every check runs on the whole (spectra x wavelengths) reflectance matrix
+of a Collection at once and marks the bands it finds at fault:
+
+- saturated: bands at or above a saturation level, or, without a level,
+  a run of at least `min_run` adjacent bands clipped at the spectrum's
+  maximum;
+- negative: negative reflectance;
+- jump: a step between the two bands around a detector splice point
+  that the slopes on either side don't explain; splice points are taken
+  from the join1_wave/join2_wave metadata of the reader (.asd files), so
+  spectra of other instruments are not checked unless `joins` is given;
+- noisy: water absorption bands whose second differences are large
+  relative to their mean. Field spectra are noisy there whatever the
+  instrument, so this check only runs when asked for.
+
+A spectrum is flagged by a check if any of its bands is. Flags are kept as
+one bit per check and band masks as one packed bitset per check.
+"""
+import warnings
+import numpy as np
+import pandas as pd
+from .collection import Collection
+
+CHECKS = ('saturated', 'negative', 'jump', 'noisy')
+DEFAULT_CHECKS = ('saturated', 'negative', 'jump')
+FLAGS = {check: 1 << i for i, check in enumerate(CHECKS)}
+# detector splice points of ASD FieldSpec instruments, for spectra read
+# without them
+JOINS = (1000., 1800.)
+WATER_BANDS = ((1350., 1460.), (1790., 1960.))
+
+
+def saturated(values, level=None, min_run=3):
+    if level is not None:
+        return values >= level
+    with np.errstate(invalid='ignore'):
+        top = np.nanmax(np.where(np.isnan(values), -np.inf, values), axis=1)
+    bands = values == top[:, np.newaxis]
+    # number of maximal bands in every window of min_run adjacent bands
+    total = np.pad(np.cumsum(bands, axis=1), ((0, 0), (1, 0)))
+    clipped = (total[:, min_run:] - total[:, :-min_run]) == min_run
+    return bands & clipped.any(axis=1)[:, np.newaxis]
+
+
+def negative(values):
+    with np.errstate(invalid='ignore'):
+        return values < 0
+
+
+def jumps(values, wavelengths, joins, tolerance=0.02):
+    """
+    Parameters
+    ----------
+    joins: list of tuple
+        Splice wavelengths of every spectrum.
+    tolerance: float
+        Largest unexplained step, relative to the values around it.
+    """
+    bands = np.zeros(values.shape, dtype=bool)
+    n = len(wavelengths)
+    codes, unique = pd.factorize(pd.Series(list(joins), dtype=object))
+    for code, spectrum_joins in enumerate(unique):
+        rows = np.flatnonzero(codes == code)
+        for join in spectrum_joins:
+            a = np.searchsorted(wavelengths, join, side='right') - 1
+            b = a + 1
+            if a < 0 or b >= n:
+                continue
+            va, vb = values[rows, a], values[rows, b]
+            # slope expected across the splice from the bands on each side
+            left = va - values[rows, a - 1] if a > 0 else 0
+            right = values[rows, b + 1] - vb if b + 1 < n else 0
+            expected = (left + right) / 2
+            with np.errstate(invalid='ignore'):
+                jump = np.abs(vb - va - expected) > \
+                    tolerance*np.maximum(np.abs(va), np.abs(vb))
+            bands[rows[jump], a] = True
+            bands[rows[jump], b] = True
+    return bands
+
+
+def noisy(values, wavelengths, windows=WATER_BANDS, tolerance=0.05):
+    """
+    Parameters
+    ----------
+    windows: list of (float, float)
+        Wavelength ranges checked.
+    tolerance: float
+        Largest standard deviation of the second differences of a window,
+        relative to the window's mean.
+    """
+    bands = np.zeros(values.shape, dtype=bool)
+    for start, stop in windows:
+        cols = np.flatnonzero((wavelengths >= start) & (wavelengths <= stop))
+        if len(cols) < 4:
+            continue
+        window = values[:, cols]
+        # windows outside a spectrum's range are all NaN and not flagged
+        with warnings.catch_warnings(), \
+                np.errstate(invalid='ignore', divide='ignore'):
+            warnings.simplefilter('ignore', RuntimeWarning)
+            noise = np.nanstd(np.diff(window, n=2, axis=1), axis=1)
+            level = np.abs(np.nanmean(window, axis=1))
+            bad = noise > tolerance*level
+        bands[np.ix_(bad, cols)] = True
+    return bands
+
+
+class QAResult(object):
+    """
+    Flags and band masks of the spectra of a Collection.
+
+    Attributes
+    ----------
+    names: pd.Index
+    wavelengths: np.ndarray
+    flags: np.ndarray of uint8
+        Bits FLAGS[check] set for every check failed by each spectrum.
+    bits: dict
+        Per check, the (spectra x bytes) band mask packed with
+        np.packbits along the wavelengths.
+    """
+    def __init__(self, names, wavelengths, bands):
+        self.names = pd.Index(names)
+        self.wavelengths = np.asarray(wavelengths)
+        self.flags = np.zeros(len(self.names), dtype=np.uint8)
+        self.bits = {}
+        for check, mask in bands.items():
+            self.flags[mask.any(axis=1)] |= FLAGS[check]
+            self.bits[check] = np.packbits(mask, axis=1)
+
+    def band_mask(self, check):
+        """
+        (spectra x wavelengths) boolean mask of the bands failing `check`
+        """
+        return np.unpackbits(self.bits[check], axis=1,
+                             count=len(self.wavelengths)).astype(bool)
+
+    def flagged(self, checks=CHECKS):
+        """
+        boolean array of the spectra failing any of `checks`
+        """
+        bits = 0
+        for check in checks:
+            bits |= FLAGS[check]
+        return (self.flags & bits) != 0
+
+    def to_frame(self):
+        """
+        pd.DataFrame of the flags with one boolean column per check
+        """
+        frame = pd.DataFrame({check: (self.flags & FLAGS[check]) != 0
+                              for check in self.bits}, index=self.names)
+        frame['flags'] = self.flags
+        return frame
+
+
+def check(collection, checks=DEFAULT_CHECKS, saturation=None, min_run=3,
+          joins=None, jump_tolerance=0.02, water_bands=WATER_BANDS,
+          noise_tolerance=0.05):
+    """
+    Run quality checks on the reflectance of a Collection.
+
+    Parameters
+    ----------
+    collection: Collection
+    checks: list of string
+        Any of CHECKS; DEFAULT_CHECKS leaves out 'noisy'.
+    saturation: float, optional
+        Saturation level of the reflectance; see `saturated`.
+    min_run: int
+    joins: tuple of float, optional
+        Splice wavelengths of spectra without join1_wave/join2_wave
+        metadata, e.g. JOINS; such spectra are not checked for jumps if
+        None.
+    jump_tolerance, noise_tolerance: float
+    water_bands: list of (float, float)
+
+    Returns
+    -------
+    QAResult
+    """
+    values = collection.matrix
+    wavelengths = np.asarray(collection.wavelengths, dtype=float)
+    spectra = collection._rows
+    bands = {}
+    for name in checks:
+        if name == 'saturated':
+            bands[name] = saturated(values, saturation, min_run)
+        elif name == 'negative':
+            bands[name] = negative(values)
+        elif name == 'jump':
+            spectrum_joins = []
+            for s in spectra:
+                meta = s.metadata or {}
+                if 'join1_wave' in meta and 'join2_wave' in meta:
+                    spectrum_joins.append((float(meta['join1_wave']),
+                                           float(meta['join2_wave'])))
+                else:
+                    spectrum_joins.append(tuple(joins or ()))
+            bands[name] = jumps(values, wavelengths, spectrum_joins,
+                                jump_tolerance)
+        elif name == 'noisy':
+            bands[name] = noisy(values, wavelengths, water_bands,
+                                noise_tolerance)
+        else:
+            raise ValueError("unknown check {}".format(name))
+    return QAResult(collection.names, wavelengths, bands)
+
+
+def drop_flagged(collection, result, checks=CHECKS):
+    """
+    New Collection of the spectra of `collection` not flagged by `checks`
+    in `result`, which must come from `check(collection)`; failures are
+    kept.
+    """
+    collection._update_store()
+    flagged = set(id(s) for s, bad in zip(collection._rows,
+                                          result.flagged(checks)) if bad)
+    kept = Collection(dtype=getattr(collection, 'dtype', None))
+    kept.failures = list(collection.failures)
+    kept.add_spectrum([s for s in collection.spectra or []
+                       if id(s) not in flagged])
+    return kept
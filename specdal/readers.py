@@ -1,6 +1,10 @@
+import io
 import os
+import re
 import sys
-import struct
+import warnings
+import functools
+from datetime import datetime
 import numpy as np
 import pandas as pd
 from .spectrum import Spectrum
@@ -13,9 +17,17 @@ cols_sed = {
     'Rad. (Ref.)':'ref_radiance',
 }
 
-def read(filepath, name=None):
+def read(filepath, name=None, lazy=False, dtype=np.float64):
     """
     function to call the appropriate reader for file extension
+
+    With lazy=True only the file header is parsed: the returned Spectrum
+    holds the header metadata and reads its data on first access to
+    Spectrum.data.
+
+    Numeric data columns are returned as floating point `dtype`, e.g.
+    np.float32 to halve the memory of large collections; wavelengths stay
+    float64.
     """
     
     FORMATS = {'.asd':read_asd, '.sig':read_sig, '.sed':read_sed }
@@ -30,10 +42,115 @@ def read(filepath, name=None):
         # sys.stderr.write(msg)
         return
 
-    return FORMATS[ext](filepath, name)
+    if lazy:
+        meta = read_metadata(filepath)
+        if meta is None:
+            return
+        return Spectrum(name=name, metadata=meta,
+                        loader=functools.partial(read, filepath, name,
+                                                  dtype=dtype))
+
+    spectrum = FORMATS[ext](filepath, name, dtype=dtype)
+    if spectrum is not None:
+        spectrum.metadata = ('filepath', os.path.abspath(filepath))
+    return spectrum
+
+
+# .asd file layout
+ASD_VERSIONS = ('ASD', 'asd', 'as6', 'as7', 'as8')
+ASD_HAS_REF = ('as6', 'as7', 'as8')
+ASD_SPECTRUM_TYPES = ("RAW_TYPE",
+                      "REF_TYPE",
+                      "RAD_TYPE",
+                      "NOUNITS_TYPE",
+                      "IRRAD_TYPE",
+                      "QI_TYPE",
+                      "TRANS_TYPE",
+                      "UNKNOWN_TYPE",
+                      "ABS_TYPE")
+# numpy dtype of the spectrum and reference blocks by header data_format
+ASD_DATA_FORMATS = {0: np.dtype('<f4'),
+                    1: np.dtype('<i4'),
+                    2: np.dtype('<f8')}
+ASD_HEADER_SIZE = 484
+# fixed-offset fields of the .asd header; `when` is a C struct tm
+# (sec, min, hour, mday, mon, year - 1900, wday, yday, isdst)
+ASD_HEADER = np.dtype({
+    'names': ['version', 'when', 'spectrum_type', 'wavestart', 'wavestep',
+              'data_format', 'num_channels', 'join1_wave', 'join2_wave'],
+    'formats': ['S3', ('<i2', (9,)), 'u1', '<f4', '<f4', 'u1', '<i2',
+                '<f4', '<f4'],
+    'offsets': [0, 160, 186, 191, 195, 199, 204, 444, 448],
+    'itemsize': ASD_HEADER_SIZE})
+
+
+def _asd_header(binconts):
+    """
+    view the .asd header of a buffer as a numpy record
+    """
+    return np.frombuffer(binconts, dtype=ASD_HEADER, count=1)[0]
+
+
+def _asd_version(header):
+    return header['version'].decode("utf-8", "replace")
+
 
+def _asd_timestamp(header):
+    """
+    measurement time of a .asd header, None if it is not a valid date
+    """
+    sec, minute, hour, mday, mon, year = (int(v) for v in header['when'][:6])
+    try:
+        return datetime(year + 1900, mon + 1, mday, hour, minute, sec)
+    except ValueError:
+        return None
 
-def read_asd(filepath, name=None):
+
+def _asd_metadata(header):
+    """
+    metadata of a .asd file taken from its header
+    """
+    return {'type': ASD_SPECTRUM_TYPES[header['spectrum_type']],
+            'version': _asd_version(header),
+            'timestamp': _asd_timestamp(header),
+            'num_channels': int(header['num_channels']),
+            'wavestart': float(header['wavestart']),
+            'wavestep': float(header['wavestep']),
+            'join1_wave': float(header['join1_wave']),
+            'join2_wave': float(header['join2_wave'])}
+
+
+def _asd_wavelengths(header):
+    wavestart = float(header['wavestart'])
+    wavestep = float(header['wavestep'])
+    num_channels = int(header['num_channels'])
+    wavestop = wavestart + num_channels*wavestep - 1
+    return np.linspace(wavestart, wavestop, num_channels)
+
+
+def _asd_decode(binconts, header, target, reference):
+    """
+    decode the spectrum and reference blocks of a .asd buffer into the
+    preallocated arrays `target` and `reference`
+    """
+    dtype = ASD_DATA_FORMATS.get(int(header['data_format']),
+                                 ASD_DATA_FORMATS[0])
+    num_channels = int(header['num_channels'])
+    target[:] = np.frombuffer(binconts, dtype=dtype, count=num_channels,
+                              offset=ASD_HEADER_SIZE)
+    if _asd_version(header) not in ASD_HAS_REF:
+        reference[:] = np.nan
+        return
+    # reference header: flag (2), ref time (8), spectrum time (8),
+    # description length (2), description
+    start = ASD_HEADER_SIZE + num_channels*dtype.itemsize
+    ref_desc_length = int(np.frombuffer(binconts, dtype='<u2', count=1,
+                                        offset=start + 18)[0])
+    reference[:] = np.frombuffer(binconts, dtype=dtype, count=num_channels,
+                                 offset=start + 20 + ref_desc_length)
+
+
+def read_asd(filepath, name=None, dtype=np.float64):
     """
     function to read .asd file
 
@@ -41,6 +158,8 @@ def read_asd(filepath, name=None):
     ----------
     filepath: string
         Full path to .asd file.
+    dtype: numpy floating point dtype
+        dtype of the data columns.
 
     Returns
     -------
@@ -48,153 +167,384 @@ def read_asd(filepath, name=None):
         Spectrum object with data from file.
         None is returned if something goes wrong.
     """
-
-    # define constants
-    VERSIONS = {'ASD': None,
-                'asd': None,
-                'as6': None,
-                'as7': None,
-                'as8': None}
-    SPECTRUM_TYPES = ("RAW_TYPE",
-                     "REF_TYPE",
-                     "RAD_TYPE",
-                     "NOUNITS_TYPE",
-                     "IRRAD_TYPE",
-                     "QI_TYPE",
-                     "TRANS_TYPE",
-                     "UNKNOWN_TYPE",
-                     "ABS_TYPE")
-    HAS_REF = {'ASD': False,
-               'asd': False,
-               'as6': True,
-               'as7': True,
-               'as8': True}
-
     if name is None:
         name = os.path.basename(filepath)
 
     mask = False
-    
+
     # read binary .asd file
     with open(filepath, "rb") as f:
         binconts = f.read()
-        version = binconts[0:3].decode("utf-8")
 
-        if not version in VERSIONS:
-            print("ERROR:", version , "not supported.")
+    version = binconts[0:3].decode("utf-8", "replace")
+    if not version in ASD_VERSIONS:
+        print("ERROR:", version , "not supported.")
+        return
+
+    header = _asd_header(binconts)
+    waves = _asd_wavelengths(header)
+
+    # decode target and reference straight into one block so that the
+    # DataFrame below wraps it without copying
+    values = np.empty((3, len(waves)), dtype=dtype)
+    _asd_decode(binconts, header, values[0], values[1])
+    np.divide(values[0], values[1], out=values[2])
+
+    data = pd.DataFrame(values.T, index=pd.Index(waves, name="wavelength"),
+                        columns=["target", "reference", "pct_reflect"],
+                        copy=False)
+
+    meta = _asd_metadata(header)
+
+    # convert data into spectrum and return
+    return Spectrum(name=name, data=data, mask=mask, metadata=meta)
+
+
+def read_asd_batch(filepaths, column="pct_reflect", out=None, mmap=False,
+                   dtype=np.float64):
+    """
+    function to decode many .asd files of the same layout into one array
+
+    Parameters
+    ----------
+    filepaths: list of string
+        Full paths to .asd files sharing version, data format and
+        wavelength layout.
+    column: {"pct_reflect", "target", "reference"}
+        Quantity to decode for each file.
+    out: np.ndarray, optional
+        Preallocated (len(filepaths), num_channels) array to decode into,
+        e.g. a np.memmap for output larger than memory.
+    mmap: bool
+        Memory-map each input file instead of reading it into a buffer.
+    dtype: numpy floating point dtype
+        dtype of the array allocated when `out` is not given.
+
+    Returns
+    -------
+    (np.ndarray, np.ndarray)
+        Wavelengths and the array whose i-th row holds `column` of the
+        i-th file.
+        None is returned if a file doesn't match the first file's layout.
+    """
+    COLUMNS = ("pct_reflect", "target", "reference")
+    if column not in COLUMNS:
+        msg = " ".join(["ERROR:", column, "not supported.\n"])
+        sys.stderr.write(msg)
+        return
+
+    if len(filepaths) == 0:
+        return np.empty(0), np.empty((0, 0), dtype=dtype)
+
+    layout = None
+    buf = bytearray()
+    for i, filepath in enumerate(filepaths):
+        if mmap:
+            binconts = np.memmap(filepath, dtype=np.uint8, mode='r')
+        else:
+            # reuse one buffer for every file
+            with open(filepath, "rb") as f:
+                nbytes = os.fstat(f.fileno()).st_size
+                if nbytes > len(buf):
+                    buf = bytearray(nbytes)
+                binconts = memoryview(buf)[:nbytes]
+                f.readinto(binconts)
+        header = _asd_header(binconts)
+        file_layout = (_asd_version(header), int(header['data_format']),
+                       int(header['num_channels']),
+                       float(header['wavestart']), float(header['wavestep']))
+        if layout is None:
+            layout = file_layout
+            if layout[0] not in ASD_VERSIONS:
+                print("ERROR:", layout[0], "not supported.")
+                return
+            waves = _asd_wavelengths(header)
+            if out is None:
+                out = np.empty((len(filepaths), len(waves)), dtype=dtype)
+            target = np.empty(len(waves))
+            reference = np.empty(len(waves))
+        elif file_layout != layout:
+            msg = " ".join(["ERROR:", filepath,
+                            "does not match the layout of", filepaths[0],
+                            "\n"])
+            sys.stderr.write(msg)
+            return
+
+        _asd_decode(binconts, header, target, reference)
+        if column == "target":
+            out[i] = target
+        elif column == "reference":
+            out[i] = reference
         else:
-            # read spectrum type
-            spectrum_type_index = struct.unpack("B", binconts[186:(186 + 1)])[0]
-            spectrum_type = SPECTRUM_TYPES[spectrum_type_index]
-
-            # read wavelength info
-            wavestart = struct.unpack("f", binconts[191:(191 + 4)])[0]
-            wavestep = struct.unpack("f", binconts[195:(195 + 4)])[0]
-            num_channels = struct.unpack("h", binconts[204:(204 + 2)])[0]
-            wavestop = wavestart + num_channels*wavestep - 1
-            waves = np.linspace(wavestart, wavestop, num_channels)
-
-            # read data
-            data_format = struct.unpack("B", binconts[199:(199 + 1)])[0]
-            fmt = "f"*num_channels
-            if data_format == 2:
-                fmt = 'd'*num_channels
-            if data_format == 0:
-                fmt = 'f'*num_channels
-            size = num_channels*8
-
-            # Read the spectrum block data
-            spectrum = np.array(struct.unpack(fmt, binconts[484:(484 + size)]))
-
-            # Read the join wavelengths
-            join1_wave = struct.unpack("f", binconts[444:(444 + 4)])[0]
-            join2_wave = struct.unpack("f", binconts[448:(448 + 4)])[0]
-
-            reference = None
-            if HAS_REF[version]:
-                # read reference
-                start = 484 + size
-                ref_flag = struct.unpack('??', binconts[start: start + 2])[0]
-                first, last = start + 18, start + 20
-                ref_desc_length = struct.unpack('H', binconts[first:last])[0]
-                first = start + 20 + ref_desc_length
-                last = first + size
-                reference = np.array(struct.unpack(fmt, binconts[first:last]))
-            else:
-                mask = False
-
-            data = pd.DataFrame({"target" : spectrum,
-                                 "reference": reference}, index=waves)
-            data.index.name = "wavelength"
-
-            data['pct_reflect'] = data.iloc[:, 1] / data.iloc[:, 0]
-
-            # metadata
-            meta = {
-                'type':spectrum_type
-            }
-            
-            # convert data into spectrum and return
-            return Spectrum(name=name, data=data, mask=mask, metadata=meta)
-
-
-def read_sig(filepath, name=None):
+            np.divide(target, reference, out=out[i])
+
+    return waves, out
+
+
+# lines ending the header of .sig and .sed files
+SIG_DATA_LINE = re.compile(r'^data=.*$', re.M)
+SED_DATA_LINE = re.compile(r'^Data:[ \t]*\r?$', re.M)
+
+
+def _sig_header(lines):
+    """
+    parse the `key= value` header of .sig file lines
+
+    Returns
+    -------
+    (dict, int)
+        Metadata and the line number of the `data=` line, which is None if
+        there is no data block.
+    """
+    meta = {}
+    for i, line in enumerate(lines):
+        line = line.splitlines()[0]
+        if line.startswith("data="):
+            return meta, i
+        line = line.split("= ")
+        if len(line) > 1:
+            meta[line[0]] = line[1]
+    return meta, None
+
+
+def _sed_header(lines):
+    """
+    parse the `key: value` header of .sed file lines
+
+    Returns
+    -------
+    (dict, int)
+        Metadata and the line number of the `Data:` line, which is None if
+        there is no data block.
+    """
+    meta = {}
+    for i, line in enumerate(lines):
+        line = line.splitlines()[0]
+        if line.rstrip() == 'Data:':
+            return meta, i
+        line = line.split(": ")
+        if len(line) > 1:
+            meta[line[0]] = line[1]
+    return meta, None
+
+
+def _parse_numbers(block, ncols):
+    """
+    parse a whitespace separated block of numbers into a (rows x ncols)
+    array, None if it isn't a complete numeric table
+    """
+    with warnings.catch_warnings():
+        # numpy only warns when it stops at a token that isn't a number
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            values = np.fromstring(block, sep=" ")
+        except (ValueError, DeprecationWarning):
+            return
+    if values.size == 0 or values.size % ncols:
+        return
+    return values.reshape(-1, ncols)
+
+
+def _astype(data, dtype):
+    """
+    cast the floating point columns of a DataFrame to `dtype`
+    """
+    cast = {col: dtype for col, coltype in data.dtypes.items()
+            if np.issubdtype(coltype, np.floating) and coltype != dtype}
+    if cast:
+        data = data.astype(cast)
+    return data
+
+
+def _sig_frame(text, dtype=np.float64):
+    """
+    metadata and data of the text of a .sig file, (None, None) if it has no
+    data block
+    """
+    match = SIG_DATA_LINE.search(text)
+    if match is None:
+        return None, None
+    meta = _sig_header(text[:match.start()].splitlines())[0]
+    if meta['units'] == "Counts, Counts":
+        colnames = ["wavelength", "ref_counts",
+                    "tgt_counts", "pct_reflect"]
+    elif meta['units'] == "Radiance, Radiance":
+        colnames = ["wavelength", "ref_radiance",
+                    "tgt_radiance", "pct_reflect"]
+    block = text[match.end():].lstrip("\r\n")
+    first = block[:block.find("\n")].split()
+    values = None
+    if len(first) == len(colnames):
+        values = _parse_numbers(block, len(colnames))
+    if values is None:
+        data = pd.read_csv(io.StringIO(block), sep=r"\s+", index_col=0,
+                           header=None, names=colnames)
+        data = _astype(data, dtype)
+    else:
+        data = pd.DataFrame(values[:, 1:].astype(dtype), columns=colnames[1:],
+                            index=pd.Index(values[:, 0], name=colnames[0]))
+    return meta, data
+
+
+def _sed_frame(text, dtype=np.float64):
+    """
+    metadata, data and mask of the text of a .sed file, (None, None, None)
+    if it has no data block
+
+    Note: pct_reflect sometimes doesn't match tgt/ref
+    """
+    match = SED_DATA_LINE.search(text)
+    if match is None:
+        return None, None, None
+    meta = _sed_header(text[:match.start()].splitlines())[0]
+    block = text[match.end():].lstrip("\r\n")
+    newline = block.find("\n")
+    columns = block[:newline].rstrip("\r").split("\t")
+    values = _parse_numbers(block[newline + 1:], len(columns))
+    if values is None:
+        data = pd.read_csv(io.StringIO(block), sep="\t")
+    else:
+        data = pd.DataFrame(values, columns=columns)
+
+    mask = False
+    ## must have the columns: 'Wvl', 'Rad. (Target)', 'Rad. (Ref.)'
+    for col in ('Wvl', 'Rad. (Target)', 'Rad. (Ref.)'):
+        if col not in data.columns:
+            mask = True
+
+    # calculate reflectance
+    if mask is not True:
+        if 'Reflect. %' not in data.columns:
+            data['Reflect. %'] = data['Rad. (Target)'] / data['Rad. (Ref.)']
+    # translate column headers
+    data.columns = [cols_sed[column] if column in cols_sed else column
+                    for column in data.columns]
+    data = _astype(data.set_index("wavelength"), dtype)
+    return meta, data, mask
+
+
+def read_metadata(filepath):
+    """
+    function to read the metadata of a file without its data
+
+    Only the header is read: the first 484 bytes of a .asd file, or the
+    lines of a .sig or .sed file up to its data block.
+
+    Returns
+    -------
+    dict
+        Metadata as found in Spectrum.metadata after a full read.
+        None is returned if the format is not supported.
+    """
+    ext = os.path.splitext(filepath)[1]
+    if ext == '.asd':
+        with open(filepath, "rb") as f:
+            binconts = f.read(ASD_HEADER_SIZE)
+        version = binconts[0:3].decode("utf-8", "replace")
+        if not version in ASD_VERSIONS:
+            print("ERROR:", version , "not supported.")
+            return
+        meta = _asd_metadata(_asd_header(binconts))
+    elif ext == '.sig':
+        with open(filepath, 'r') as f:
+            meta = _sig_header(f)[0]
+    elif ext == '.sed':
+        with open(filepath, 'r') as f:
+            meta = _sed_header(f)[0]
+    else:
+        return
+    meta['filepath'] = os.path.abspath(filepath)
+    return meta
+
+
+def read_sig(filepath, name=None, dtype=np.float64):
+    """
+    function to read .sig file
+
+    The file is read once; its numeric block is parsed with numpy, falling
+    back to pandas if it holds anything but numbers.
+    """
     if name is None:
         name = os.path.basename(filepath)
 
     with open(filepath, 'r') as f:
-        meta = {}
-        for i, line in enumerate(f):
-            line = line.splitlines()[0].split("= ")
-            if len(line) > 1:
-                if line[0] == 'data':
-                    if meta['units'] == "Counts, Counts":
-                        colnames = ["wavelength", "ref_counts",
-                                    "tgt_counts", "pct_reflect"]
-                    elif meta['units'] == "Radiance, Radiance":
-                        colnames = ["wavelength", "ref_radiance",
-                                    "tgt_radiance", "pct_reflect"]
-                    data = pd.read_table(filepath, skiprows=i+1,
-                                         sep="\s+", index_col=0,
-                                         header=None, names=colnames
-                    )
-                    return Spectrum(name=name, data=data, metadata=meta)
-                else:
-                    meta[line[0]] = line[1]
-
-
-def read_sed(filepath, name=None):
+        meta, data = _sig_frame(f.read(), dtype)
+    if data is None:
+        return
+    return Spectrum(name=name, data=data, metadata=meta)
+
+
+def read_sed(filepath, name=None, dtype=np.float64):
     """
+    function to read .sed file
+
     Note: pct_reflect sometimes doesn't match tgt/ref
     """
-    mask = False
     if name is None:
         name = os.path.basename(filepath)
     with open(filepath, 'r') as f:
-        meta = {}
-        for i, line in enumerate(f):
-            line = line.splitlines()[0].split(": ")
-            if line[0] == 'Data:':
-                data = pd.read_table(filepath, skiprows=i+1,
-                                     sep="\t"
-                )
-                
-                ## must have the columns: 'Wvl', 'Rad. (Target)', 'Rad. (Ref.)'
-                for col in ('Wvl', 'Rad. (Target)', 'Rad. (Ref.)'):
-                    if col not in data.columns:
-                        mask = True
-
-                # calculate reflectance
-                if mask is not True:
-                    if 'Reflect. %' not in data.columns:
-                        data['Reflect. %'] = data['Rad. (Target)'] / data['Rad. (Ref.)']
-                # translate column headers
-                data.columns = [cols_sed[column] if column in cols_sed else column
-                                for column in data.columns]
-                data = data.set_index("wavelength")
-                
-                return Spectrum(name=name, data=data, mask=mask, metadata=meta)
-
-            else:
-                if len(line) > 1:
-                    meta[line[0]] = line[1]
+        meta, data, mask = _sed_frame(f.read(), dtype)
+    if data is None:
+        return
+    return Spectrum(name=name, data=data, mask=mask, metadata=meta)
+
+
+def read_text_batch(filepaths, column="pct_reflect", out=None,
+                    dtype=np.float64):
+    """
+    function to read many .sig or .sed files of the same layout into one
+    array
+
+    Parameters
+    ----------
+    filepaths: list of string
+        Full paths to .sig or .sed files sharing data columns and
+        wavelengths.
+    column: string
+        Data column to read from each file, e.g. "pct_reflect" or
+        "tgt_radiance".
+    out: np.ndarray, optional
+        Preallocated (len(filepaths), wavelengths) array to read into.
+    dtype: numpy floating point dtype
+        dtype of the array allocated when `out` is not given.
+
+    Returns
+    -------
+    (np.ndarray, np.ndarray)
+        Wavelengths and the array whose i-th row holds `column` of the
+        i-th file.
+        None is returned if a file doesn't match the first file's layout.
+    """
+    waves, columns = None, None
+    for i, filepath in enumerate(filepaths):
+        ext = os.path.splitext(filepath)[1]
+        with open(filepath, 'r') as f:
+            text = f.read()
+        if ext == '.sig':
+            data = _sig_frame(text, dtype)[1]
+        elif ext == '.sed':
+            data = _sed_frame(text, dtype)[1]
+        else:
+            print("ERROR:", ext, "not supported.")
+            return
+        if data is None:
+            msg = " ".join(["ERROR:", filepath, "has no data block\n"])
+            sys.stderr.write(msg)
+            return
+        if waves is None:
+            waves, columns = data.index.values, list(data.columns)
+            if column not in columns:
+                msg = " ".join(["ERROR:", column, "not in", filepath, "\n"])
+                sys.stderr.write(msg)
+                return
+            if out is None:
+                out = np.empty((len(filepaths), len(waves)), dtype=dtype)
+        elif list(data.columns) != columns or \
+             not np.array_equal(data.index.values, waves):
+            msg = " ".join(["ERROR:", filepath,
+                            "does not match the layout of", filepaths[0],
+                            "\n"])
+            sys.stderr.write(msg)
+            return
+        out[i] = data[column].values
+    return waves, out
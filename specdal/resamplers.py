@@ -1,17 +1,40 @@
 import sys
 import numpy as np
 import pandas as pd
+from .plans import PlanCache
 
 debug = False
+METHODS = ('slinear', 'cubic')
+
 def resample(spectrum, method="slinear"):
 
-    METHODS = ('slinear', 'cubic')
     if method not in METHODS:
         msg = " ".join(["ERROR:", method, "not supported.\n"])
         sys.stderr.write(msg)
         return
 
-    wavelengths = pd.Series(spectrum.data.index)
+    data = spectrum.data
+    if all(np.issubdtype(dtype, np.number) for dtype in data.dtypes):
+        plan = plans.get(data.index.values, method)
+        values = plan.apply(data.values.T)
+        data = pd.DataFrame(values.T, columns=data.columns, copy=False,
+                            index=pd.Index(plan.index, name=data.index.name))
+    else:
+        data = _resample_frame(data, method)
+        if data is None:
+            return
+
+    spectrum.data = data
+    spectrum.resampled = True
+    return spectrum
+
+
+def _resample_frame(data, method):
+    """
+    resample each overlapping sequence of a DataFrame to integer wavelengths
+    using pandas interpolation
+    """
+    wavelengths = pd.Series(data.index)
     n = len(wavelengths)
 
     # spectrum may have overlapping sequences
@@ -22,14 +45,14 @@ def resample(spectrum, method="slinear"):
     for sequence in zip(head_positions, tail_positions):
         # subset the dataframe corresponding to the sequence
         head_pos, tail_pos = sequence
-        dataframe = spectrum.data.iloc[head_pos:tail_pos].copy()
+        dataframe = data.iloc[head_pos:tail_pos].copy()
         # expand index to all integers
         int_index = pd.Index(np.arange(np.round(wavelengths[head_pos]),
                                        np.round(wavelengths[tail_pos-1]) + 1),
-                             name=spectrum.data.index.name)
+                             name=data.index.name)
         temp_index = dataframe.index.union(int_index)
         dataframe = dataframe.reindex(temp_index)
-        # interpolate 
+        # interpolate
         dataframe = dataframe.interpolate(method=method)
         # select the integer indices
         dataframes.append(dataframe.loc[int_index])
@@ -40,11 +63,160 @@ def resample(spectrum, method="slinear"):
 
             fig, ax = plt.subplots()
             dataframe.reset_index().plot.scatter(x="index", y="ref_radiances", ax=ax, c="red")
-            spectrum.data.iloc[head_pos:tail_pos].reset_index().plot(x="wavelengh", y="ref_radiances", ax=ax, c="blue")
-            spectrum.data.iloc[head_pos:tail_pos].reset_index().plot.scatter(x="wavelengh", y="ref_radiances", ax=ax, c="blue", s=100)
+            data.iloc[head_pos:tail_pos].reset_index().plot(x="wavelengh", y="ref_radiances", ax=ax, c="blue")
+            data.iloc[head_pos:tail_pos].reset_index().plot.scatter(x="wavelengh", y="ref_radiances", ax=ax, c="blue", s=100)
             plt.show()
             return
 
-    spectrum.data = pd.concat(dataframes)
-    spectrum.resampled = True
-    return spectrum
+    return pd.concat(dataframes)
+
+
+class ResamplePlan(object):
+    """
+    Interpolation from one source wavelength grid to integer wavelengths.
+
+    Each increasing sequence of the source grid is resampled to the
+    integers between its rounded end points, exactly as `resample` does.
+    The interpolation is stored as one sparse (targets x sources) weight
+    matrix, so applying it to any number of spectra is a single matrix
+    multiply.
+
+    Parameters
+    ----------
+    wavelengths: array-like
+        Source wavelength grid, possibly with overlapping sequences.
+    method: {'slinear', 'cubic'}
+    """
+    def __init__(self, wavelengths, method="slinear"):
+        from scipy import sparse
+        from scipy.interpolate import interp1d
+
+        wavelengths = np.array(wavelengths, dtype=float)
+        n = len(wavelengths)
+        breaks = list(np.flatnonzero(np.diff(wavelengths) < 0) + 1)
+
+        rows, cols, weights, indices = [], [], [], []
+        offset = 0
+        for head, tail in zip([0] + breaks, breaks + [n]):
+            x = wavelengths[head:tail]
+            target = np.arange(np.round(x[0]), np.round(x[-1]) + 1)
+            pos = np.searchsorted(x, target)
+            hit = (pos < len(x)) & (x[np.minimum(pos, len(x) - 1)] == target)
+            inside = (target > x[0]) & (target < x[-1]) & ~hit
+
+            # target wavelengths present in the source keep their value
+            rows.append(offset + np.flatnonzero(hit))
+            cols.append(head + pos[hit])
+            weights.append(np.ones(hit.sum()))
+
+            # the rest are interpolated from the sequence
+            inside_rows = offset + np.flatnonzero(inside)
+            if method == "slinear":
+                right = pos[inside]
+                left = right - 1
+                frac = (target[inside] - x[left]) / (x[right] - x[left])
+                rows += [inside_rows, inside_rows]
+                cols += [head + left, head + right]
+                weights += [1 - frac, frac]
+            elif inside.any():
+                # interpolating the identity yields the weight of every
+                # source point on every target
+                block = interp1d(x, np.eye(len(x)), kind=method, axis=0,
+                                 assume_sorted=True)(target[inside])
+                rows.append(np.repeat(inside_rows, len(x)))
+                cols.append(np.tile(head + np.arange(len(x)), len(inside_rows)))
+                weights.append(block.ravel())
+
+            indices.append(target)
+            offset += len(target)
+
+        self.method = method
+        self.wavelengths = wavelengths
+        self.index = np.concatenate(indices)
+        rows = np.concatenate(rows)
+        self.weights = sparse.csr_matrix(
+            (np.concatenate(weights), (rows, np.concatenate(cols))),
+            shape=(len(self.index), n))
+        # weights cast to the dtypes of the values they were applied to
+        self._weights = {self.weights.dtype: self.weights}
+        # targets outside their sequence's range have no weights
+        self.undefined = np.ones(len(self.index), dtype=bool)
+        self.undefined[rows] = False
+
+    def apply(self, values):
+        """
+        Resample the last axis of `values`.
+
+        Returns
+        -------
+        np.ndarray
+            Array shaped like `values` with the last axis on `index`, of
+            the same floating point dtype (float64 for other values).
+            Rows containing NaN are resampled by `resample`'s pandas path,
+            which interpolates around missing values.
+        """
+        values = np.asarray(values)
+        if not np.issubdtype(values.dtype, np.floating):
+            values = values.astype(float)
+        shape = values.shape
+        flat = values.reshape(-1, shape[-1])
+        weights = self._weights.get(flat.dtype)
+        if weights is None:
+            weights = self._weights[flat.dtype] = \
+                self.weights.astype(flat.dtype)
+        out = np.ascontiguousarray((weights @ flat.T).T)
+        out[:, self.undefined] = np.nan
+
+        for row in np.flatnonzero(np.isnan(flat).any(axis=1)):
+            frame = pd.DataFrame({"value": flat[row]}, index=self.wavelengths)
+            out[row] = _resample_frame(frame, self.method)["value"].values
+        return out.reshape(shape[:-1] + (len(self.index),))
+
+
+# plans of recently seen wavelength grids; see plans.info() for hit counts
+plans = PlanCache(ResamplePlan, maxsize=32)
+
+
+def resample_array(values, wavelengths, method="slinear"):
+    """
+    Resample many spectra sharing one wavelength grid.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        Array whose last axis is on `wavelengths`, e.g. a (spectra x
+        wavelengths) matrix.
+    wavelengths: array-like
+    method: {'slinear', 'cubic'}
+
+    Returns
+    -------
+    (np.ndarray, np.ndarray)
+        Integer wavelengths and the resampled values.
+    """
+    if method not in METHODS:
+        msg = " ".join(["ERROR:", method, "not supported.\n"])
+        sys.stderr.write(msg)
+        return
+
+    plan = plans.get(wavelengths, method)
+    return plan.index, plan.apply(values)
+
+
+def resample_collection(collection, method="slinear"):
+    """
+    Resample every spectrum of a Collection, batching spectra that share a
+    wavelength grid and data columns into one matrix multiply.
+    """
+    if method not in METHODS:
+        msg = " ".join(["ERROR:", method, "not supported.\n"])
+        sys.stderr.write(msg)
+        return
+
+    for spectra, index, columns, values in collection._grid_blocks():
+        index, values = resample_array(values, index.values, method)
+        index = pd.Index(index, name=spectra[0].data.index.name)
+        collection._set_grid_block(spectra, index, columns, values)
+        for spectrum in spectra:
+            spectrum.resampled = True
+    return collection
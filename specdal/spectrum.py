@@ -1,6 +1,12 @@
+import itertools
 import numpy as np
 import pandas as pd
-from collections import Iterable
+from collections.abc import Iterable
+
+# every assignment to Spectrum.data draws a new version, which lets a
+# Collection tell whether its columnar store is still up to date; versions
+# are only unique within a process, so unpickled spectra draw a new one
+_versions = itertools.count()
 
 class Spectrum(object):
     """
@@ -16,6 +22,10 @@ class Spectrum(object):
         Indicates whether the spectrum has been resampled to integer wavelengths
     metadata : dictionary
         key:value pair for metadata
+    loader : callable, optional
+        Called without arguments on the first access to `data` when no data
+        was given; returns the Spectrum read from file, whose data, mask and
+        metadata are then taken over.
 
     Raises
     ------
@@ -25,7 +35,9 @@ class Spectrum(object):
     --------
     """
     
-    def __init__(self, name, data=None, resampled=False, metadata=None, mask=False):
+    def __init__(self, name, data=None, resampled=False, metadata=None, mask=False,
+                 loader=None):
+        self._loader = loader
         if data is not None:
             self.data = data
         self.name = name
@@ -34,6 +46,11 @@ class Spectrum(object):
         if metadata is not None:
             self.metadata = metadata
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if '_version' in state:
+            self._version = next(_versions)
+
     @property
     def name(self):
         return self._name
@@ -44,15 +61,41 @@ class Spectrum(object):
 
     @property
     def data(self):
+        if getattr(self, "_loader", None) is not None and \
+           not hasattr(self, "_data"):
+            self._load()
         return self._data
 
+    def _load(self):
+        loader, self._loader = self._loader, None
+        spectrum = loader()
+        if spectrum is None:
+            return
+        self.data = spectrum.data
+        self.mask = spectrum.mask
+        metadata = dict(self.metadata or {})
+        metadata.update(spectrum.metadata or {})
+        self.metadata = metadata
+
+    @property
+    def loaded(self):
+        """
+        False until the data of a lazily read spectrum has been read
+        """
+        return hasattr(self, "_data") or getattr(self, "_loader", None) is None
+
     @data.setter
     def data(self, value):
         if isinstance(value, pd.DataFrame):
             self._data = value
+            self._version = next(_versions)
         else:
             print("Error: data must be a pd.DataFrame object")
 
+    @property
+    def version(self):
+        return getattr(self, "_version", None)
+
     @property
     def resampled(self):
         return self._resampled
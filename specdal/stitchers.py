@@ -1,17 +1,288 @@
 import sys
 import numpy as np
 import pandas as pd
+from .plans import PlanCache
 
 debug = True
+METHODS = ('mean', 'blending')
 
 def stitch(spectrum, method="mean"):
-    METHODS = ('mean')
     if method not in METHODS:
         msg = " ".join(["ERROR:", method, "not supported.\n"])
         sys.stderr.write(msg)
         return
 
-    if method == "mean":
-        spectrum.data = spectrum.data.groupby(level=0, axis=0).mean()
+    data = spectrum.data
+    if all(np.issubdtype(dtype, np.number) for dtype in data.dtypes):
+        plan = plans.get(data.index.values, method)
+        values = plan.apply(data.values.T)
+        spectrum.data = pd.DataFrame(values.T, columns=data.columns,
+                                     copy=False,
+                                     index=pd.Index(plan.index,
+                                                    name=data.index.name))
+    elif method == "mean":
+        spectrum.data = data.groupby(level=0, axis=0).mean()
+    else:
+        msg = " ".join(["ERROR:", method, "needs numeric data.\n"])
+        sys.stderr.write(msg)
+        return
 
     return spectrum
+
+
+class StitchPlan(object):
+    """
+    Merge of duplicate wavelengths for one wavelength grid.
+
+    Only wavelengths measured by more than one detector are combined;
+    every other wavelength is copied. 'mean' averages the duplicates like
+    `groupby(level=0).mean()`. 'blending' weights each duplicate by its
+    distance from the end of its own detector sequence, cross-fading from
+    one detector to the next across the overlap.
+
+    Parameters
+    ----------
+    wavelengths: array-like
+        Wavelength grid with overlapping increasing sequences.
+    method: {'mean', 'blending'}
+    """
+    def __init__(self, wavelengths, method="mean"):
+        wavelengths = np.array(wavelengths, dtype=float)
+        self.method = method
+        self.wavelengths = wavelengths
+        self.index, inverse, counts = np.unique(wavelengths,
+                                                return_inverse=True,
+                                                return_counts=True)
+
+        single = counts[inverse] == 1
+        self.single_src = np.flatnonzero(single)
+        self.single_out = inverse[single]
+
+        self.overlap_src = np.flatnonzero(~single)
+        self.overlap_out = np.flatnonzero(counts > 1)
+        weights = np.ones(len(self.overlap_src))
+        if method == "blending":
+            weights = self._distances(wavelengths)[self.overlap_src]
+        # (overlap outputs x overlap sources) weight matrix
+        rows = np.searchsorted(self.overlap_out, inverse[self.overlap_src])
+        self.weights = np.zeros((len(self.overlap_out), len(self.overlap_src)))
+        self.weights[rows, np.arange(len(self.overlap_src))] = weights
+
+    @staticmethod
+    def _distances(wavelengths):
+        """
+        distance of each wavelength from the nearer end of its sequence,
+        plus one grid step so that end points keep a small weight
+        """
+        n = len(wavelengths)
+        breaks = list(np.flatnonzero(np.diff(wavelengths) < 0) + 1)
+        distances = np.empty(n)
+        for head, tail in zip([0] + breaks, breaks + [n]):
+            x = wavelengths[head:tail]
+            step = np.median(np.diff(x)) if len(x) > 1 else 1.0
+            distances[head:tail] = np.minimum(x - x[0], x[-1] - x) + step
+        return distances
+
+    def apply(self, values):
+        """
+        Stitch the last axis of `values`; NaNs are skipped like pandas does.
+        Floating point values keep their dtype, others become float64.
+        """
+        values = np.asarray(values)
+        if not np.issubdtype(values.dtype, np.floating):
+            values = values.astype(float)
+        out = np.empty(values.shape[:-1] + (len(self.index),),
+                       dtype=values.dtype)
+        out[..., self.single_out] = values[..., self.single_src]
+        if len(self.overlap_src):
+            overlap = values[..., self.overlap_src]
+            finite = np.isfinite(overlap)
+            weights = self.weights.T.astype(values.dtype, copy=False)
+            total = np.where(finite, overlap, 0) @ weights
+            weight = finite @ weights
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out[..., self.overlap_out] = total / weight
+        return out
+
+
+# plans of recently seen wavelength grids; see plans.info() for hit counts
+plans = PlanCache(StitchPlan, maxsize=32)
+
+
+def stitch_array(values, wavelengths, method="mean"):
+    """
+    Stitch many spectra sharing one wavelength grid.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        Array whose last axis is on `wavelengths`, e.g. a (spectra x
+        wavelengths) matrix.
+    wavelengths: array-like
+    method: {'mean', 'blending'}
+
+    Returns
+    -------
+    (np.ndarray, np.ndarray)
+        Sorted unique wavelengths and the stitched values.
+    """
+    if method not in METHODS:
+        msg = " ".join(["ERROR:", method, "not supported.\n"])
+        sys.stderr.write(msg)
+        return
+
+    plan = plans.get(wavelengths, method)
+    return plan.index, plan.apply(values)
+
+
+def stitch_collection(collection, method="mean"):
+    """
+    Stitch every spectrum of a Collection, batching spectra that share a
+    wavelength grid and data columns.
+    """
+    if method not in METHODS:
+        msg = " ".join(["ERROR:", method, "not supported.\n"])
+        sys.stderr.write(msg)
+        return
+
+    for spectra, index, columns, values in collection._grid_blocks():
+        index, values = stitch_array(values, index.values, method)
+        index = pd.Index(index, name=spectra[0].data.index.name)
+        collection._set_grid_block(spectra, index, columns, values)
+    return collection
+
+
+JUMP_METHODS = ('additive', 'multiplicative')
+
+
+def jump_correct_array(values, wavelengths, joins, method="additive",
+                       reference=1):
+    """
+    Remove the steps between the detectors of many spectra sharing one
+    wavelength grid.
+
+    The step at a splice is the difference (additive) or ratio
+    (multiplicative) between the first band of the next detector and the
+    value extrapolated from the last two bands of the previous detector.
+    Every detector is shifted or scaled by the steps between it and the
+    reference detector, which is left unchanged.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        Array whose last axis is on `wavelengths`, e.g. a (spectra x
+        wavelengths) matrix.
+    wavelengths: array-like
+        Increasing wavelengths.
+    joins: list of float
+        Splice wavelengths, the last wavelength of every detector but the
+        last one.
+    method: {'additive', 'multiplicative'}
+    reference: int
+        Position of the reference detector, 0 for the first one.
+
+    Returns
+    -------
+    np.ndarray
+        Corrected copy of `values`.
+    """
+    if method not in JUMP_METHODS:
+        msg = " ".join(["ERROR:", method, "not supported.\n"])
+        sys.stderr.write(msg)
+        return
+    if not 0 <= reference <= len(joins):
+        msg = " ".join(["ERROR: reference detector", str(reference),
+                        "not in", str(len(joins) + 1), "detectors\n"])
+        sys.stderr.write(msg)
+        return
+
+    values = np.asarray(values)
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    n = len(wavelengths)
+    # last band of every detector but the last, and the detector of each band
+    ends = np.searchsorted(wavelengths, np.asarray(joins, dtype=float),
+                           side='right') - 1
+    detector = np.searchsorted(ends, np.arange(n), side='left')
+    valid = (ends >= 1) & (ends < n - 1)
+    a = np.clip(ends, 1, n - 2)
+    b = a + 1
+
+    va, vb = values[..., a], values[..., b]
+    slope = (va - values[..., a - 1]) / (wavelengths[a] - wavelengths[a - 1])
+    expected = va + slope*(wavelengths[b] - wavelengths[a])
+    identity = 0. if method == "additive" else 1.
+    with np.errstate(invalid='ignore', divide='ignore'):
+        step = vb - expected if method == "additive" else vb / expected
+        step = np.where(valid & np.isfinite(step), step, identity)
+
+    shape = step.shape[:-1] + (1,)
+    if method == "additive":
+        total = np.concatenate([np.zeros(shape), np.cumsum(step, axis=-1)],
+                               axis=-1)
+        total -= total[..., reference:reference + 1]
+        out = values - total[..., detector]
+    else:
+        total = np.concatenate([np.ones(shape), np.cumprod(step, axis=-1)],
+                               axis=-1)
+        total /= total[..., reference:reference + 1]
+        out = values / total[..., detector]
+    if np.issubdtype(values.dtype, np.floating):
+        out = out.astype(values.dtype, copy=False)
+    return out
+
+
+def _spectrum_joins(spectrum, joins):
+    meta = spectrum.metadata or {}
+    if 'join1_wave' in meta and 'join2_wave' in meta:
+        return (float(meta['join1_wave']), float(meta['join2_wave']))
+    return joins
+
+
+def jump_correct(collection, method="additive", reference=1, joins=None):
+    """
+    Correct the reflectance of every spectrum of a Collection for steps
+    between detectors, batching spectra that share a wavelength grid and
+    splice points.
+
+    Parameters
+    ----------
+    collection: Collection
+    method: {'additive', 'multiplicative'}
+    reference: int
+        Position of the detector left unchanged; 1 is the SWIR1 detector
+        of ASD instruments.
+    joins: tuple of float, optional
+        Splice wavelengths of spectra without join1_wave/join2_wave
+        metadata; such spectra are left unchanged if not given.
+
+    See Also
+    --------
+    jump_correct_array
+    """
+    if method not in JUMP_METHODS:
+        msg = " ".join(["ERROR:", method, "not supported.\n"])
+        sys.stderr.write(msg)
+        return
+    if joins is not None:
+        joins = tuple(float(join) for join in joins)
+
+    for spectra, index, columns, values in collection._grid_blocks():
+        if "pct_reflect" not in columns:
+            continue
+        layer = columns.index("pct_reflect")
+        codes, unique = pd.factorize(pd.Series(
+            [_spectrum_joins(s, joins) for s in spectra], dtype=object))
+        if not len(unique):
+            continue
+        # the block may be the collection's store, which spectra of other
+        # collections can share
+        values = values.copy()
+        for code, block_joins in enumerate(unique):
+            rows = np.flatnonzero(codes == code)
+            corrected = jump_correct_array(values[layer, rows], index.values,
+                                           block_joins, method, reference)
+            if corrected is None:
+                return
+            values[layer, rows] = corrected
+        collection._set_grid_block(spectra, index, columns, values)
+    return collection
@@ -0,0 +1,226 @@
+"""
+Binary container for collections of spectra.
+
+A store is a directory holding
+
+- meta.json: layer names, wavelength index name and number of chunks;
+- wavelengths.npy: the shared wavelength axis;
+- chunk_<n>.npy: one (layers x spectra x wavelengths) array per chunk;
+- chunk_<n>.json: the spectrum names, masks, resampled flags and metadata
+  of chunk n.
+
+Chunks are plain .npy files, so they can be memory-mapped and sliced
+without reading the rest of the store, and appending spectra only adds a
+chunk: its files are written, then meta.json is replaced, so appending
+costs the same however large the store is.
+"""
+import os
+import json
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def _meta_path(path):
+    return os.path.join(path, 'meta.json')
+
+
+def chunk_file(n):
+    """
+    file name of the values of the n-th chunk
+    """
+    return 'chunk_{:06d}.npy'.format(n)
+
+
+def _chunk_meta_path(path, n):
+    return os.path.join(path, 'chunk_{:06d}.json'.format(n))
+
+
+def read_header(path):
+    """
+    meta.json of the store at `path`, without the chunk descriptions
+    """
+    with open(_meta_path(path)) as f:
+        return json.load(f)
+
+
+def read_meta(path):
+    """
+    meta.json of the store at `path`, with the description of every chunk
+    as 'chunks'
+    """
+    meta = read_header(path)
+    meta['chunks'] = []
+    for n in range(meta['nchunks']):
+        with open(_chunk_meta_path(path, n)) as f:
+            meta['chunks'].append(json.load(f))
+    return meta
+
+
+def _write_json(filepath, obj):
+    tmppath = filepath + '.tmp'
+    with open(tmppath, 'w') as f:
+        json.dump(obj, f, default=str)
+    os.replace(tmppath, filepath)
+
+
+def write(path, values, wavelengths, names, layers=("pct_reflect",),
+          mask=None, metadata=None, resampled=None, index_name="wavelength",
+          append=False):
+    """
+    Write (or append) a chunk of spectra to the store at `path`.
+
+    Parameters
+    ----------
+    path: string
+        Store directory; created if missing.
+    values: np.ndarray
+        (layers x spectra x wavelengths) array.
+    wavelengths: array-like
+    names: list of string
+    layers: tuple of string
+        Data column of each layer of `values`.
+    mask, resampled: list of bool, optional
+    metadata: list of dict, optional
+    append: bool
+        Add the spectra to an existing store instead of replacing it.
+        Layers and wavelengths must match the store's.
+
+    Returns
+    -------
+    dict
+        Description of the chunk written, as in read_meta.
+    """
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    n = values.shape[1]
+    chunk = {'names': [str(name) for name in names],
+             'mask': [bool(m) for m in (mask if mask is not None
+                                        else [False]*n)],
+             'resampled': [bool(r) for r in (resampled if resampled is not None
+                                             else [False]*n)],
+             'metadata': [m or {} for m in (metadata if metadata is not None
+                                            else [None]*n)]}
+
+    if append and os.path.exists(_meta_path(path)):
+        meta = read_header(path)
+        stored = np.load(os.path.join(path, 'wavelengths.npy'))
+        if list(meta['layers']) != list(layers) or \
+           not np.array_equal(stored, wavelengths):
+            raise ValueError("layers and wavelengths must match the store "
+                             "at {}".format(path))
+    else:
+        if not os.path.exists(path):
+            os.makedirs(path)
+        for f in os.listdir(path):
+            if f.startswith('chunk_') and f.endswith(('.npy', '.json')):
+                os.remove(os.path.join(path, f))
+        meta = {'format': 'specdal', 'version': FORMAT_VERSION,
+                'layers': list(layers), 'index_name': index_name,
+                'nchunks': 0}
+        np.save(os.path.join(path, 'wavelengths.npy'), wavelengths)
+
+    n = meta['nchunks']
+    chunk['file'] = chunk_file(n)
+    np.save(os.path.join(path, chunk['file']), np.ascontiguousarray(values))
+    _write_json(_chunk_meta_path(path, n), chunk)
+    meta['nchunks'] = n + 1
+    _write_json(_meta_path(path), meta)
+    return chunk
+
+
+def iter_chunks(path, layers=None, mmap=True):
+    """
+    Yield (chunk metadata, values) for every chunk of the store at `path`,
+    memory-mapping the chunks read-only by default.
+
+    values is the (layers x spectra x wavelengths) array of the chunk,
+    restricted to `layers` if given.
+    """
+    meta = read_meta(path)
+    layer_inds = None
+    if layers is not None:
+        layer_inds = [meta['layers'].index(layer) for layer in layers]
+    for chunk in meta['chunks']:
+        values = np.load(os.path.join(path, chunk['file']),
+                         mmap_mode='r' if mmap else None)
+        if layer_inds is not None:
+            values = values[layer_inds]
+        yield chunk, values
+
+
+def _select(meta, wavelengths, names, layers, wave_range):
+    """
+    layer indices, wavelength slice and, per chunk, row indices selected
+    """
+    layer_inds = list(range(len(meta['layers'])))
+    if layers is not None:
+        layer_inds = [meta['layers'].index(layer) for layer in layers]
+    cols = slice(None)
+    if wave_range is not None:
+        start, stop = wave_range
+        cols = slice(np.searchsorted(wavelengths, start, side='left'),
+                     np.searchsorted(wavelengths, stop, side='right'))
+    rows = []
+    for chunk in meta['chunks']:
+        if names is None:
+            rows.append(None)
+        else:
+            rows.append([i for i, name in enumerate(chunk['names'])
+                         if name in names])
+    return layer_inds, cols, rows
+
+
+def read(path, names=None, layers=None, wavelengths=None, mmap=False):
+    """
+    Read spectra from the store at `path`.
+
+    Parameters
+    ----------
+    names: list of string, optional
+        Read only these spectra.
+    layers: list of string, optional
+        Read only these data columns.
+    wavelengths: (float, float), optional
+        Read only wavelengths in this closed range.
+    mmap: bool
+        Memory-map the chunks (copy-on-write) instead of reading them.
+        A store of one chunk read without `names` stays a memory map.
+
+    Returns
+    -------
+    dict
+        values, wavelengths, names, layers, mask, resampled, metadata and
+        index_name.
+    """
+    meta = read_meta(path)
+    axis = np.load(os.path.join(path, 'wavelengths.npy'))
+    if names is not None:
+        names = set(names)
+    layer_inds, cols, rows = _select(meta, axis, names, layers, wavelengths)
+
+    blocks = []
+    result = {'names': [], 'mask': [], 'resampled': [], 'metadata': []}
+    for chunk, chunk_rows in zip(meta['chunks'], rows):
+        values = np.load(os.path.join(path, chunk['file']),
+                         mmap_mode='c' if mmap else None)
+        if layer_inds != list(range(len(meta['layers']))):
+            values = values[layer_inds]
+        values = values[:, :, cols]
+        if chunk_rows is None:
+            chunk_rows = range(len(chunk['names']))
+        else:
+            values = values[:, chunk_rows, :]
+        blocks.append(values)
+        for key in result:
+            result[key] += [chunk[key][i] for i in chunk_rows]
+
+    if len(blocks) == 1:
+        values = blocks[0]
+    elif blocks:
+        values = np.concatenate(blocks, axis=1)
+    else:
+        values = np.empty((len(layer_inds), 0, len(axis[cols])))
+    result.update({'values': values, 'wavelengths': axis[cols],
+                   'layers': [meta['layers'][i] for i in layer_inds],
+                   'index_name': meta['index_name']})
+    return result
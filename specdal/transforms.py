@@ -0,0 +1,303 @@
+"""
+Spectral indices and filters of spectra.
+
+Indices are band math over the reflectance at a few bands. They are kept
+in the INDICES registry as the bands they read and a function of those
+band values; `register` adds new ones:
+
+    @transforms.register('sr', 800., 670.)
+    def simple_ratio(nir, red):
+        return nir / red
+
+A band is a wavelength, interpolated linearly between its neighbours, or
+a (start, stop) range averaged over. The bands of all requested indices
+are looked up once per wavelength axis (see BandPlan) and read from the
+whole (spectra x wavelengths) matrix with one matrix multiply; every index
+function then runs on whole columns of band values.
+
+Filters smooth or differentiate the last axis of an array: 'savgol' is a
+Savitzky-Golay filter, 'derivative' a finite difference derivative.
+"""
+import sys
+import numpy as np
+import pandas as pd
+from .plans import PlanCache
+
+INDICES = {}
+
+
+def register(name, *bands):
+    """
+    decorator adding func(*band_values) to INDICES as index `name` of the
+    reflectance at `bands`
+    """
+    bands = tuple(tuple(map(float, band)) if np.ndim(band) else float(band)
+                  for band in bands)
+
+    def decorator(func):
+        INDICES[name] = (bands, func)
+        return func
+    return decorator
+
+
+@register('ndvi', 800., 670.)
+def ndvi(nir, red):
+    """normalized difference vegetation index"""
+    return (nir - red) / (nir + red)
+
+
+@register('ndwi', 860., 1240.)
+def ndwi(nir, swir):
+    """normalized difference water index of Gao (1996)"""
+    return (nir - swir) / (nir + swir)
+
+
+@register('pri', 531., 570.)
+def pri(r531, r570):
+    """photochemical reflectance index"""
+    return (r531 - r570) / (r531 + r570)
+
+
+@register('rep', 670., 700., 740., 780.)
+def red_edge_position(r670, r700, r740, r780):
+    """red-edge position by linear four-point interpolation, in nm"""
+    return 700. + 40.*((r670 + r780)/2 - r700) / (r740 - r700)
+
+
+def band_depth(left, center, right):
+    """
+    index function of the continuum-removed depth at `center` of an
+    absorption feature, the continuum being the line between the
+    reflectance at the shoulders `left` and `right`
+    """
+    def depth(r_left, r_center, r_right):
+        continuum = r_left + (r_right - r_left)*(center - left)/(right - left)
+        return 1. - r_center/continuum
+    return depth
+
+
+for _name, _bands in (('bd670', (550., 670., 750.)),
+                      ('bd970', (920., 970., 1040.)),
+                      ('bd1200', (1080., 1200., 1280.))):
+    register(_name, *_bands)(band_depth(*_bands))
+
+
+class BandPlan(object):
+    """
+    Weights reading band values from one wavelength axis.
+
+    `columns` are the positions of the wavelengths read by some band and
+    `weights` the (bands x columns) weight of each of them in each band.
+
+    Parameters
+    ----------
+    wavelengths: array-like
+        Increasing wavelengths.
+    bands: tuple
+        Wavelengths, interpolated linearly, or (start, stop) ranges,
+        averaged over. Bands off the axis are NaN.
+    """
+    def __init__(self, wavelengths, bands):
+        wavelengths = np.array(wavelengths, dtype=float)
+        n = len(wavelengths)
+        self.wavelengths = wavelengths
+        self.bands = bands
+        self.weights = np.zeros((len(bands), n))
+        self.missing = np.zeros(len(bands), dtype=bool)
+        for i, band in enumerate(bands):
+            if np.ndim(band):
+                cols = np.flatnonzero((wavelengths >= band[0]) &
+                                      (wavelengths <= band[1]))
+                self.weights[i, cols] = 1. / max(len(cols), 1)
+                self.missing[i] = len(cols) == 0
+                continue
+            pos = np.searchsorted(wavelengths, band)
+            if pos < n and wavelengths[pos] == band:
+                self.weights[i, pos] = 1.
+            elif 0 < pos < n:
+                frac = (band - wavelengths[pos - 1]) / \
+                    (wavelengths[pos] - wavelengths[pos - 1])
+                self.weights[i, pos - 1] = 1. - frac
+                self.weights[i, pos] = frac
+            else:
+                self.missing[i] = True
+        # only the columns some band reads are gathered
+        self.columns = np.flatnonzero((self.weights != 0).any(axis=0))
+        self.weights = self.weights[:, self.columns]
+        self.used = self.weights != 0
+
+    def apply(self, values):
+        """
+        (..., bands) band values of the last axis of `values`; a band is
+        NaN if any value it reads is
+        """
+        values = np.asarray(values)
+        if not np.issubdtype(values.dtype, np.floating):
+            values = values.astype(float)
+        values = values[..., self.columns]
+        nan = np.isnan(values)
+        weights = self.weights.T.astype(values.dtype, copy=False)
+        out = np.where(nan, 0, values) @ weights
+        out[(nan @ self.used.T) | self.missing] = np.nan
+        return out
+
+
+# plans of recently seen wavelength axes and band lists
+plans = PlanCache(BandPlan, maxsize=32)
+
+
+def compute_indices(values, wavelengths, names=None):
+    """
+    Spectral indices of many spectra sharing one wavelength axis.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        (spectra x wavelengths) reflectance matrix.
+    wavelengths: array-like
+    names: list of string, optional
+        Indices of INDICES to compute; all of them by default.
+
+    Returns
+    -------
+    np.ndarray
+        (spectra x indices) matrix, of the floating point dtype of
+        `values`.
+        None is returned if an index is not registered.
+    """
+    if names is None:
+        names = list(INDICES)
+    for name in names:
+        if name not in INDICES:
+            msg = " ".join(["ERROR: index", name, "not registered.\n"])
+            sys.stderr.write(msg)
+            return
+
+    bands = []
+    for name in names:
+        bands += [b for b in INDICES[name][0] if b not in bands]
+    plan = plans.get(wavelengths, tuple(bands))
+    band_values = plan.apply(values)
+    out = np.empty((band_values.shape[0], len(names)),
+                   dtype=band_values.dtype)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for j, name in enumerate(names):
+            index_bands, func = INDICES[name]
+            out[:, j] = func(*(band_values[:, bands.index(b)]
+                               for b in index_bands))
+    return out
+
+
+def indices(collection, names=None):
+    """
+    Spectral indices of the reflectance of every spectrum of a Collection.
+
+    Returns
+    -------
+    pd.DataFrame
+        (spectra x indices) DataFrame.
+    """
+    if names is None:
+        names = list(INDICES)
+    values = compute_indices(collection.matrix, collection.wavelengths,
+                             names)
+    if values is None:
+        return
+    return pd.DataFrame(values, index=collection.names, columns=list(names))
+
+
+def _step(wavelengths):
+    """
+    spacing of an evenly spaced wavelength axis, None otherwise
+    """
+    steps = np.diff(np.asarray(wavelengths, dtype=float))
+    if len(steps) == 0 or not np.allclose(steps, steps[0]):
+        return None
+    return steps[0]
+
+
+def savgol(values, wavelengths, window=11, polyorder=2, deriv=0):
+    """
+    Savitzky-Golay filter of the last axis of `values`.
+
+    Parameters
+    ----------
+    values: np.ndarray
+    wavelengths: array-like
+        Evenly spaced wavelengths.
+    window: int
+        Odd number of bands fitted.
+    polyorder: int
+        Order of the fitted polynomial.
+    deriv: int
+        Order of the derivative, per nm; 0 smooths.
+
+    The ends are extended with the end values, so NaNs only spread
+    within a window of their band.
+    """
+    from scipy.signal import savgol_filter
+
+    step = _step(wavelengths)
+    if step is None:
+        msg = "ERROR: savgol needs evenly spaced wavelengths; resample first\n"
+        sys.stderr.write(msg)
+        return
+    values = np.asarray(values)
+    out = savgol_filter(values, window, polyorder, deriv=deriv, delta=step,
+                        axis=-1, mode='nearest')
+    if np.issubdtype(values.dtype, np.floating):
+        out = out.astype(values.dtype, copy=False)
+    return out
+
+
+def derivative(values, wavelengths, order=1):
+    """
+    `order`-th derivative of the last axis of `values`, per nm, by central
+    differences
+    """
+    values = np.asarray(values)
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    out = values
+    for _ in range(order):
+        out = np.gradient(out, wavelengths, axis=-1)
+    if np.issubdtype(values.dtype, np.floating):
+        out = out.astype(values.dtype, copy=False)
+    return out
+
+
+FILTERS = {'savgol': savgol, 'derivative': derivative}
+
+
+def filter_array(values, wavelengths, method="savgol", **kwargs):
+    """
+    Filter many spectra sharing one wavelength axis with FILTERS[method].
+    """
+    if method not in FILTERS:
+        msg = " ".join(["ERROR:", method, "not supported.\n"])
+        sys.stderr.write(msg)
+        return
+    return FILTERS[method](values, wavelengths, **kwargs)
+
+
+def filter_collection(collection, method="savgol", **kwargs):
+    """
+    Filter every data column of every spectrum of a Collection, batching
+    spectra that share a wavelength grid and data columns.
+
+    Parameters
+    ----------
+    method: {'savgol', 'derivative'}
+    kwargs:
+        Options of the filter, e.g. window, polyorder and deriv of savgol.
+    """
+    if method not in FILTERS:
+        msg = " ".join(["ERROR:", method, "not supported.\n"])
+        sys.stderr.write(msg)
+        return
+
+    for spectra, index, columns, values in collection._grid_blocks():
+        values = filter_array(values, index.values, method, **kwargs)
+        if values is None:
+            return
+        collection._set_grid_block(spectra, index, columns, values)
+    return collection
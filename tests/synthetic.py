@@ -0,0 +1,90 @@
+"""
+Writers for small synthetic .asd, .sig and .sed files used by the tests.
+"""
+import struct
+import numpy as np
+
+
+def write_asd(filepath, version="as7", num_channels=2151, wavestart=350.0,
+              wavestep=1.0, target=None, reference=None, data_format=2,
+              spectrum_type=1, join1=1000.0, join2=1800.0, when=None):
+    """
+    write a minimal .asd file readable by readers.read_asd
+
+    `when` is a datetime stored as the measurement time.
+    """
+    if target is None:
+        target = np.linspace(1000., 2000., num_channels)
+    if reference is None:
+        reference = np.linspace(2000., 3000., num_channels)
+    fmt = {0: "f", 1: "i", 2: "d"}[data_format]
+    header = bytearray(484)
+    header[0:3] = version.encode("utf-8")
+    if when is not None:
+        header[160:178] = struct.pack("9h", when.second, when.minute,
+                                      when.hour, when.day, when.month - 1,
+                                      when.year - 1900, 0, 0, 0)
+    header[186:187] = struct.pack("B", spectrum_type)
+    header[191:195] = struct.pack("f", wavestart)
+    header[195:199] = struct.pack("f", wavestep)
+    header[199:200] = struct.pack("B", data_format)
+    header[204:206] = struct.pack("h", num_channels)
+    header[444:448] = struct.pack("f", join1)
+    header[448:452] = struct.pack("f", join2)
+    with open(filepath, "wb") as f:
+        f.write(bytes(header))
+        f.write(struct.pack(fmt*num_channels, *target))
+        if version in ("as6", "as7", "as8"):
+            desc = b"white panel"
+            f.write(struct.pack("??", True, False))
+            f.write(bytes(16))
+            f.write(struct.pack("H", len(desc)))
+            f.write(desc)
+            f.write(struct.pack(fmt*num_channels, *reference))
+
+
+def write_sig(filepath, wavelengths=None, units="Radiance, Radiance",
+              seed=0):
+    """
+    write a minimal SVC .sig file with three overlapping detector ranges
+    """
+    if wavelengths is None:
+        wavelengths = np.concatenate([np.linspace(338.5, 1010.3, 512),
+                                      np.linspace(972.4, 1900.6, 256),
+                                      np.linspace(1885.2, 2513.9, 256)])
+    rng = np.random.RandomState(seed)
+    n = len(wavelengths)
+    ref = 1000. + rng.rand(n)
+    tgt = 500. + rng.rand(n)
+    with open(filepath, "w") as f:
+        f.write("/*** Spectra Vista SIG Data ***/\n")
+        f.write("name= synthetic.sig\n")
+        f.write("instrument= HI: 1024 (HR-1024)\n")
+        f.write("units= {}\n".format(units))
+        f.write("time= 06/11/2014 10:13:05 AM, 06/11/2014 10:15:10 AM\n")
+        f.write("data= \n")
+        for w, r, t in zip(wavelengths, ref, tgt):
+            f.write("{:.1f}  {:.2f}  {:.2f}  {:.2f}\n".format(w, r, t,
+                                                               100*t/r))
+
+
+def write_sed(filepath, wavelengths=None, seed=0):
+    """
+    write a minimal PSR .sed file
+    """
+    if wavelengths is None:
+        wavelengths = np.arange(350, 2501)
+    rng = np.random.RandomState(seed)
+    n = len(wavelengths)
+    ref = 1000. + rng.rand(n)
+    tgt = 500. + rng.rand(n)
+    with open(filepath, "w") as f:
+        f.write("Comment: \n")
+        f.write("Version: 2.3 [1.2.1]\n")
+        f.write("Instrument: PSR-3500_SN1234 [3]\n")
+        f.write("Date: 06/11/2014,06/11/2014\n")
+        f.write("Time: 10:13:05.00,10:15:10.00\n")
+        f.write("Data:\n")
+        f.write("Wvl\tRad. (Target)\tRad. (Ref.)\tReflect. %\n")
+        for w, r, t in zip(wavelengths, ref, tgt):
+            f.write("{}\t{:.4f}\t{:.4f}\t{:.2f}\n".format(w, t, r, 100*t/r))
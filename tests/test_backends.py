@@ -0,0 +1,150 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import operator
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(".."))
+from specdal import collection as c
+from specdal import pipeline as pl
+from specdal import backends
+from specdal import cli
+from specdal.groups import GroupStats
+from synthetic import write_asd
+
+try:
+    import dask
+except ImportError:
+    dask = None
+try:
+    import distributed
+except ImportError:
+    distributed = None
+
+
+class LocalBackendTests(unittest.TestCase):
+    def test_map_reduce(self):
+        for workers in (None, 3):
+            backend = backends.get_backend('local', workers=workers,
+                                           executor='thread')
+            try:
+                items = backend.map(str, range(7))
+                self.assertEqual(backend.compute(
+                    backend.reduce(operator.add, items)), "0123456")
+            finally:
+                backend.close()
+
+    def test_unknown(self):
+        self.assertIsNone(backends.get_backend('spark'))
+
+
+class GroupStatsTests(unittest.TestCase):
+    def test_merge(self):
+        rng = np.random.RandomState(0)
+        values = 10 + rng.rand(6, 5)
+        keys = np.array(['a', 'b', 'a', 'c', 'b', 'a'])
+        index = pd.Index(np.arange(5.))
+        whole = GroupStats(index).add(keys, values)
+        # partitions on different groups and wavelengths
+        first = GroupStats(index[:4]).add(keys[:3], values[:3, :4])
+        second = GroupStats(index[1:]).add(keys[3:], values[3:, 1:])
+        merged = first.merge(second)
+        self.assertEqual(merged.groups, ['a', 'b', 'c'])
+        expected = whole.frames()
+        for group, frame in merged.frames().items():
+            counts = [np.sum(keys[:3] == group)] + \
+                [np.sum(keys == group)]*3 + [np.sum(keys[3:] == group)]
+            np.testing.assert_array_equal(frame['count'], counts)
+            # wavelengths of both partitions
+            both = frame.iloc[1:4]
+            for stat in ('mean', 'std', 'max'):
+                np.testing.assert_allclose(
+                    both[stat], expected[group][stat].iloc[1:4])
+
+
+class PartitionTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.indir = os.path.join(self.tmpdir, "in")
+        os.makedirs(self.indir)
+        rng = np.random.RandomState(0)
+        for i in range(7):
+            write_asd(os.path.join(self.indir,
+                                   "site{}_{}.asd".format(i % 3, i)),
+                      target=1000 + 100*rng.rand(2151))
+        with open(os.path.join(self.indir, "bad.asd"), "wb") as f:
+            f.write(b"as7")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def expected(self):
+        coll = c.Collection.from_directory(self.indir)
+        return coll, coll.group_stats(('_', 0),
+                                      stats=['mean', 'std', 'count'])
+
+    def check(self, backend):
+        coll, expected = self.expected()
+        result = pl.reduce_partitions(c.list_files(self.indir), backend,
+                                      partition_size=2,
+                                      group_by_separator=['_', '0'],
+                                      qa={'checks': ['negative']})
+        frames = result['stats'].frames()
+        self.assertEqual(sorted(frames), ['site0', 'site1', 'site2'])
+        for group, frame in frames.items():
+            for stat in ('mean', 'std', 'count'):
+                np.testing.assert_allclose(frame[stat],
+                                           expected[stat][group])
+        self.assertEqual(list(result['mask'].index), list(coll.names))
+        self.assertEqual(list(result['qa'].index), list(coll.names))
+        self.assertEqual([os.path.basename(f) for f, e in
+                          result['failures']], ['bad.asd'])
+
+    def test_serial(self):
+        self.check(None)
+
+    def test_local(self):
+        backend = backends.LocalBackend(workers=2, executor='process')
+        try:
+            self.check(backend)
+        finally:
+            backend.close()
+
+    @unittest.skipIf(dask is None, "dask is not installed")
+    def test_dask(self):
+        for scheduler in ('synchronous', 'threads'):
+            backend = backends.get_backend('dask', scheduler=scheduler,
+                                           workers=2)
+            self.check(backend)
+
+    @unittest.skipIf(distributed is None, "dask.distributed is not installed")
+    def test_dask_local_cluster(self):
+        backend = backends.get_backend('dask', scheduler='local-cluster',
+                                       workers=2)
+        try:
+            self.check(backend)
+        finally:
+            backend.close()
+
+    def test_main(self):
+        outdir = os.path.join(self.tmpdir, "out")
+        status = cli.main([self.indir, outdir, '--backend', 'local',
+                           '-j', '2', '--partition-size', '3',
+                           '-gsep', '_', '0', '--save-partitions',
+                           '--no-figures'])
+        self.assertEqual(status, 0)
+        stats = pd.read_csv(os.path.join(outdir, 'data', 'site0_stats.csv'),
+                            index_col=0)
+        self.assertTrue((stats['count'] == 3).all())
+        self.assertEqual(sorted(os.listdir(os.path.join(outdir,
+                                                        'partitions'))),
+                         ['part_000000', 'part_000001', 'part_000002'])
+        self.assertTrue(os.path.exists(os.path.join(outdir,
+                                                    'failures.csv')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(".."))
+from specdal import collection as c
+from specdal import calibration as cal
+from specdal import readers
+from specdal.chunked import ChunkedCollection
+from synthetic import write_asd, write_sig, write_sed
+
+
+class TimestampTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_formats(self):
+        expected = pd.Timestamp("2014-06-11 10:15:10")
+        for ext, write in (("sig", write_sig), ("sed", write_sed)):
+            path = os.path.join(self.tmpdir, "a." + ext)
+            write(path)
+            self.assertEqual(cal.timestamp(readers.read(path).metadata),
+                             expected)
+        path = os.path.join(self.tmpdir, "a.asd")
+        write_asd(path, when=datetime(2014, 6, 11, 10, 15, 10))
+        meta = readers.read(path).metadata
+        self.assertEqual(cal.timestamp(meta), expected)
+        # as stored in a binary store
+        meta['timestamp'] = str(meta['timestamp'])
+        self.assertEqual(cal.timestamp(meta), expected)
+        self.assertTrue(pd.isnull(cal.timestamp({})))
+
+
+class MatchTests(unittest.TestCase):
+    def setUp(self):
+        base = np.datetime64('2020-01-01T10:00:00')
+        self.panel_times = base + np.array([600, 0], dtype='m8[s]')
+        self.times = np.concatenate([
+            base + np.array([-60, 120, 480, 900], dtype='m8[s]'),
+            [np.datetime64('NaT')]])
+
+    def test_nearest(self):
+        left, right, weight, matched = cal.match_panels(self.times,
+                                                        self.panel_times)
+        np.testing.assert_array_equal(left[:4], [1, 1, 0, 0])
+        np.testing.assert_array_equal(right, left)
+        np.testing.assert_array_equal(matched, [1, 1, 1, 1, 0])
+
+    def test_linear(self):
+        left, right, weight, matched = cal.match_panels(
+            self.times, self.panel_times, "linear", max_gap=200)
+        np.testing.assert_array_equal(matched, [1, 1, 1, 0, 0])
+        np.testing.assert_array_equal(left[:3], [1, 1, 1])
+        np.testing.assert_array_equal(right[:3], [1, 0, 0])
+        np.testing.assert_allclose(weight, [0, 0.2, 0.8, 0, 0])
+
+    def test_unsupported(self):
+        self.assertIsNone(cal.match_panels(self.times, self.panel_times,
+                                           "cubic"))
+
+
+class RecalibrateTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.indir = os.path.join(self.tmpdir, "in")
+        os.makedirs(self.indir)
+        self.panel = {0: np.full(2151, 2000.), 10: np.full(2151, 1000.)}
+        for minute, panel in self.panel.items():
+            write_asd(os.path.join(self.indir,
+                                   "wref_{:02d}.asd".format(minute)),
+                      target=panel, reference=panel,
+                      when=datetime(2020, 1, 1, 10, minute))
+        for minute in (2, 8, 11):
+            write_asd(os.path.join(self.indir,
+                                   "leaf_{:02d}.asd".format(minute)),
+                      target=np.full(2151, 500.),
+                      reference=np.full(2151, 4000.),
+                      when=datetime(2020, 1, 1, 10, minute))
+        self.panels = ["wref_00.asd", "wref_10.asd"]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read(self):
+        return c.Collection.from_directory(self.indir)
+
+    def test_nearest(self):
+        coll = self.read()
+        cal.recalibrate(coll, self.panels)
+        data = coll.data
+        np.testing.assert_allclose(data['leaf_02.asd'], 0.25)
+        np.testing.assert_allclose(data['leaf_08.asd'], 0.5)
+        np.testing.assert_allclose(data['leaf_11.asd'], 0.5)
+        np.testing.assert_allclose(data['wref_00.asd'], 1)
+        np.testing.assert_allclose(coll.layer('reference')[0], 2000)
+        leaf = [s for s in coll.spectra if s.name == 'leaf_02.asd'][0]
+        np.testing.assert_allclose(leaf.data['pct_reflect'], 0.25)
+
+    def test_linear(self):
+        coll = self.read()
+        reflectance = pd.Series([0.9, 1.1], index=[350., 2500.])
+        cal.recalibrate(coll, self.panels, method="linear", max_gap=150,
+                        panel_reflectance=reflectance)
+        data = coll.data
+        scale = np.linspace(0.9, 1.1, 2151)
+        np.testing.assert_allclose(data['leaf_02.asd'], 500/1800*scale)
+        np.testing.assert_allclose(data['leaf_08.asd'], 500/1200*scale)
+        # 60 s from the last panel
+        np.testing.assert_allclose(data['leaf_11.asd'], 500/1000*scale)
+
+    def test_unmatched(self):
+        coll = self.read()
+        cal.recalibrate(coll, self.panels, max_gap=30)
+        # only the panels themselves are within 30 s of a panel
+        np.testing.assert_allclose(coll.data['leaf_02.asd'], 0.125)
+        self.assertIsNone(cal.recalibrate(coll, []))
+
+    def test_chunked(self):
+        path = os.path.join(self.tmpdir, "store")
+        store = ChunkedCollection.from_directory(path, self.indir,
+                                                 chunksize=2)
+        self.assertEqual(store.layers, ["target", "reference",
+                                        "pct_reflect"])
+        store.recalibrate(self.panels, method="linear")
+        coll = self.read()
+        cal.recalibrate(coll, self.panels, method="linear")
+        pd.testing.assert_frame_equal(store.data, coll.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
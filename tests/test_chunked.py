@@ -0,0 +1,93 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+
+sys.path.insert(0, os.path.abspath(".."))
+from specdal import collection as c
+from specdal import pipeline as pl
+from specdal.chunked import ChunkedCollection
+from synthetic import write_asd, write_sig
+
+
+class ChunkedCollectionTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.indir = os.path.join(self.tmpdir, "in")
+        os.makedirs(self.indir)
+        rng = np.random.RandomState(0)
+        for i in range(10):
+            target = 1000 + 1000*rng.rand(2151)
+            target[i] = np.nan
+            write_asd(os.path.join(self.indir, "s{}_a{}.asd".format(i % 3, i)),
+                      target=target)
+            write_sig(os.path.join(self.indir, "s{}_b{}.sig".format(i % 3, i)),
+                      seed=i)
+        self.filepaths = c.list_files(self.indir)
+        self.path = os.path.join(self.tmpdir, "store")
+        self.chunked = ChunkedCollection.from_files(
+            self.path, self.filepaths, chunksize=6, resampler='slinear',
+            stitcher='mean')
+        self.full = pl.process_files(self.filepaths, 'slinear', 'mean')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_layout(self):
+        self.assertEqual(len(self.chunked.meta['chunks']), 4)
+        self.assertEqual(len(self.chunked), 20)
+        self.assertEqual(list(self.chunked.names), list(self.full.names))
+        pdt.assert_frame_equal(self.chunked.mask, self.full.mask)
+        # the axis of the first chunk, holding both formats, is kept
+        np.testing.assert_array_equal(self.chunked.wavelengths,
+                                      np.arange(338., 2515.))
+
+    def test_data(self):
+        expected = self.full.data.reindex(self.chunked.index)
+        pdt.assert_frame_equal(self.chunked.data, expected)
+        pdt.assert_frame_equal(pd.concat(list(self.chunked.iter_data()),
+                                         axis=1), expected)
+        names = [s.name for coll in self.chunked.iter_chunks()
+                 for s in coll.spectra]
+        self.assertEqual(names, list(self.full.names))
+
+    def test_group_by_separator(self):
+        expected = self.full.data.reindex(self.chunked.index)
+        groups = list(self.chunked.group_by_separator('_', 0))
+        self.assertEqual([gname for gname, gdata in groups],
+                         ['s0', 's1', 's2'])
+        for gname, gdata in groups:
+            pdt.assert_frame_equal(gdata, expected[gdata.columns])
+            self.assertTrue(all(name.startswith(gname)
+                                for name in gdata.columns))
+
+    def test_group_stats(self):
+        stats = self.chunked.group_stats('_', 0)
+        expected = self.full.group_stats(('_', 0))
+        for stat, frame in stats.items():
+            pdt.assert_frame_equal(frame,
+                                   expected[stat].reindex(frame.index),
+                                   check_exact=False, rtol=1e-9)
+
+    def test_append_float32(self):
+        path = os.path.join(self.tmpdir, "store32")
+        chunked = ChunkedCollection.from_files(
+            path, self.filepaths[:6], chunksize=4, resampler='slinear',
+            stitcher='mean', dtype=np.float32)
+        chunked.append(c.Collection.from_files(self.filepaths[6:8]))
+        self.assertEqual(len(chunked), 8)
+        self.assertEqual(chunked.dtype, np.float32)
+        stats = chunked.group_stats('_', 0, stats=['mean'])
+        self.assertTrue((stats['mean'].dtypes == np.float32).all())
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(".."))
+from specdal import cli
+from synthetic import write_asd
+
+ROOT = os.path.abspath("..")
+
+
+def imported_after(code):
+    """
+    top-level packages imported by a fresh interpreter running `code`
+    """
+    script = ("import sys; " + code + "; "
+              "print(' '.join(sorted(set(m.split('.')[0] "
+              "for m in sys.modules))))")
+    out = subprocess.check_output([sys.executable, "-c", script], cwd=ROOT)
+    return set(out.decode().split())
+
+
+class ImportTests(unittest.TestCase):
+    def test_no_heavy_imports(self):
+        for module in ("specdal", "specdal.collection", "specdal.pipeline",
+                       "specdal.cli"):
+            modules = imported_after("import " + module)
+            self.assertNotIn("matplotlib", modules, module)
+            self.assertNotIn("scipy", modules, module)
+
+    def test_run_without_figures(self):
+        indir = tempfile.mkdtemp()
+        outdir = tempfile.mkdtemp()
+        try:
+            write_asd(os.path.join(indir, "a_1.asd"))
+            modules = imported_after(
+                "from specdal import cli; cli.main([{!r}, {!r}, "
+                "'--no-figures'])".format(indir, outdir))
+            self.assertNotIn("matplotlib", modules)
+        finally:
+            shutil.rmtree(indir)
+            shutil.rmtree(outdir)
+
+
+class MainTests(unittest.TestCase):
+    def setUp(self):
+        self.indir = tempfile.mkdtemp()
+        self.outdir = tempfile.mkdtemp()
+        for i in range(4):
+            write_asd(os.path.join(self.indir,
+                                   "site{}_{}.asd".format(i % 2, i)))
+
+    def tearDown(self):
+        shutil.rmtree(self.indir)
+        shutil.rmtree(self.outdir)
+
+    def test_main(self):
+        status = cli.main([self.indir, self.outdir, '-gsep', '_', '0',
+                           '--qa', 'negative'])
+        self.assertEqual(status, 0)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.outdir,
+                                                        'figures'))),
+                         ['site0.png', 'site1.png'])
+        data = pd.read_csv(os.path.join(self.outdir, 'data', 'site1.csv'),
+                           index_col=0)
+        self.assertEqual(list(data.index), ['site1_1.asd', 'site1_3.asd'])
+        self.assertTrue(os.path.exists(os.path.join(self.outdir, 'qa.csv')))
+
+    def test_module(self):
+        subprocess.check_call([sys.executable, "-m", "specdal", self.indir,
+                               self.outdir, "--stream", "--no-figures"],
+                              cwd=ROOT)
+        self.assertTrue(os.path.exists(os.path.join(self.outdir, 'data',
+                                                    'all_stats.csv')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,11 @@
 import unittest
 import os
 import sys
+import shutil
+import tempfile
+import itertools
+from unittest import mock
+import numpy as np
 import pandas as pd
 import pandas.util.testing as pdt
 import matplotlib.pyplot as plt
@@ -9,6 +14,8 @@ sys.path.insert(0, os.path.abspath(".."))
 from specdal import spectrum as s
 from specdal import collection as c
 from specdal import readers as r
+from specdal.cache import SpectrumCache
+from synthetic import write_asd, write_sig, write_sed
 
 
 class CollectionTests(unittest.TestCase):
@@ -29,6 +36,220 @@ class CollectionTests(unittest.TestCase):
         plt.show()
 
 
+class FromDirectoryTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for i in range(4):
+            write_asd(os.path.join(self.tmpdir, "a_{}.asd".format(i)))
+            write_sig(os.path.join(self.tmpdir, "b_{}.sig".format(i)))
+            write_sed(os.path.join(self.tmpdir, "c_{}.sed".format(i)))
+        # truncated file and unsupported extension
+        with open(os.path.join(self.tmpdir, "broken.asd"), "wb") as f:
+            f.write(b"as7" + bytes(300))
+        with open(os.path.join(self.tmpdir, "notes.txt"), "w") as f:
+            f.write("not a spectrum")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_serial(self):
+        coll = c.Collection.from_directory(self.tmpdir)
+        names = [spec.name for spec in coll.spectra]
+        self.assertEqual(names, sorted(names))
+        self.assertEqual(len(names), 12)
+        self.assertEqual(len(coll.failures), 1)
+        self.assertTrue(coll.failures[0][0].endswith("broken.asd"))
+
+    def test_parallel_matches_serial(self):
+        serial = c.Collection.from_directory(self.tmpdir)
+        for executor in ("thread", "process"):
+            coll = c.Collection.from_directory(self.tmpdir, workers=3,
+                                               executor=executor)
+            self.assertEqual([spec.name for spec in coll.spectra],
+                             [spec.name for spec in serial.spectra])
+            self.assertEqual(coll.failures, serial.failures)
+            for s1, s2 in zip(coll.spectra, serial.spectra):
+                pdt.assert_frame_equal(s1.data, s2.data)
+
+    def test_versions_from_other_processes(self):
+        # a fresh counter, as in a new process, so that versions drawn here
+        # and in the workers would collide
+        indir = os.path.join(self.tmpdir, "asd")
+        os.makedirs(indir)
+        for i in range(3):
+            write_asd(os.path.join(indir, "a_{}.asd".format(i)))
+        counter = itertools.count()
+        with mock.patch.object(s, '_versions', counter), \
+                mock.patch.object(c, '_versions', counter):
+            coll = c.Collection.from_directory(indir, workers=2,
+                                               executor="process")
+            cache = SpectrumCache(os.path.join(self.tmpdir, "cache"))
+            spec = r.read(os.path.join(indir, "a_0.asd"))
+            spec.name = "cached"
+            cache.put("a", spec)
+            coll.add_spectrum(cache.get("a"))
+            versions = [spec.version for spec in coll.spectra]
+            self.assertEqual(len(set(versions)), len(versions))
+            for spec in (coll.spectra[0], coll.spectra[-1]):
+                before = coll.data[spec.name].copy()
+                spec.data = spec.data*2
+                pdt.assert_series_equal(coll.data[spec.name], before*2,
+                                        check_names=False)
+
+    def test_scan(self):
+        serial = c.Collection.from_directory(self.tmpdir)
+        for workers in (None, 3):
+            coll = c.Collection.scan(self.tmpdir, workers=workers)
+            self.assertEqual([spec.name for spec in coll.spectra],
+                             [spec.name for spec in serial.spectra])
+            self.assertEqual(coll.failures, serial.failures)
+            meta = coll.metadata
+            self.assertEqual(list(meta.index),
+                             [spec.name for spec in serial.spectra])
+            self.assertEqual(meta["units"].notnull().sum(), 4)
+            self.assertFalse(any(spec.loaded for spec in coll.spectra))
+            for s1, s2 in zip(coll.spectra, serial.spectra):
+                pdt.assert_frame_equal(s1.data, s2.data)
+            pdt.assert_frame_equal(coll.mask, serial.mask)
+
+    def test_unknown_executor(self):
+        self.assertIsNone(c.Collection.from_directory(self.tmpdir,
+                                                      executor="mpi"))
+
+
+class StoreTests(unittest.TestCase):
+    def setUp(self):
+        self.c = c.Collection()
+        index = pd.Index([1.0, 2.0, 3.0], name="wavelength")
+        for i in range(3):
+            data = pd.DataFrame({"tgt": [1.0, 2.0, 3.0],
+                                 "pct_reflect": [i, i + 0.5, i + 1.0]},
+                                index=index)
+            self.c.add_spectrum(s.Spectrum(name="s{}".format(i), data=data))
+
+    def test_data_matches_concat(self):
+        expected = pd.concat([spec.data["pct_reflect"].rename(spec.name)
+                              for spec in self.c.spectra], axis=1)
+        pdt.assert_frame_equal(self.c.data, expected)
+        self.assertEqual(self.c.matrix.shape, (3, 3))
+        self.assertEqual(list(self.c.names), ["s0", "s1", "s2"])
+
+    def test_spectra_are_views(self):
+        matrix = self.c.matrix
+        for spec in self.c.spectra:
+            self.assertTrue(np.shares_memory(spec.data.values, matrix))
+            self.assertEqual(list(spec.data.columns), ["tgt", "pct_reflect"])
+        # the store is not rebuilt while nothing changes
+        self.assertTrue(np.shares_memory(self.c.matrix, matrix))
+
+    def test_rebuild_on_change(self):
+        spec = self.c.spectra[1]
+        spec.data = spec.data * 2
+        self.assertEqual(self.c.data["s1"].tolist(), [2.0, 3.0, 4.0])
+        self.c.add_spectrum(s.Spectrum(name="s3", data=spec.data))
+        self.assertEqual(self.c.matrix.shape, (4, 3))
+
+    def test_mask_after_store(self):
+        self.c.matrix
+        self.c.spectra[0].mask = True
+        self.assertEqual(self.c.mask_vector.tolist(), [True, False, False])
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "store")
+            self.c.save(path)
+            loaded = c.Collection.load(path)
+            self.assertEqual(loaded.mask["mask"].tolist(),
+                             [True, False, False])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_union_axis(self):
+        data = pd.DataFrame({"pct_reflect": [7.0, 8.0]},
+                            index=pd.Index([3.0, 4.0], name="wavelength"))
+        self.c.add_spectrum(s.Spectrum(name="s3", data=data))
+        expected = pd.concat([spec.data["pct_reflect"].rename(spec.name)
+                              for spec in self.c.spectra], axis=1)
+        pdt.assert_frame_equal(self.c.data, expected)
+
+    def test_from_array(self):
+        values = np.arange(12.0).reshape(3, 4)
+        coll = c.Collection.from_array(values, [400, 401, 402, 403],
+                                       ["a", "b", "c"], mask=[0, 1, 0])
+        self.assertTrue(np.shares_memory(coll.data.values, values))
+        self.assertEqual(coll.spectra[1].data["pct_reflect"].tolist(),
+                         [4.0, 5.0, 6.0, 7.0])
+        self.assertEqual(coll.mask["mask"].tolist(), [False, True, False])
+
+
+class GroupStatsTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        names = ["site{}_plot{}_{}".format(i % 3, i % 2, i) for i in range(30)]
+        values = rng.rand(30, 20)
+        values[4, 3] = np.nan
+        values[[0, 3], 5] = np.nan
+        self.c = c.Collection.from_array(values, np.arange(400., 420.), names)
+
+    def expected(self, element_inds):
+        def group_fcn(name):
+            return "_".join([name.split("_")[e] for e in element_inds])
+        return self.c.data.groupby(by=group_fcn, axis=1)
+
+    def test_matches_pandas(self):
+        stats = self.c.group_stats(("_", 0, 1))
+        groupby = self.expected([0, 1])
+        for stat in ("mean", "median", "std", "min", "max", "count"):
+            pdt.assert_frame_equal(stats[stat], getattr(groupby, stat)(),
+                                   check_names=False)
+
+    def test_several_specs(self):
+        stats = self.c.group_stats(("_", 0), ("_", 1), stats=["mean"])
+        self.assertEqual(sorted(stats), [("_", 0), ("_", 1)])
+        pdt.assert_frame_equal(stats[("_", 1)]["mean"],
+                               self.expected([1]).mean(), check_names=False)
+
+    def test_group_by_separator(self):
+        groups = dict(list(self.c.group_by_separator("_", "0")))
+        self.assertEqual(sorted(groups), ["site0", "site1", "site2"])
+        self.assertEqual(groups["site1"].shape, (20, 10))
+        # element positions may also be given as a list
+        self.assertEqual(len(self.c.group_by_separator("_", [0, 1])), 6)
+
+    def test_negative_positions(self):
+        groups = dict(list(self.c.group_by_separator("_", -1)))
+        self.assertEqual(len(groups), 30)
+        keys = self.c.group_index("_", 0, -2).keys
+        self.assertEqual(list(keys[:2]), ["site0_plot0", "site1_plot1"])
+        np.testing.assert_array_equal(self.c.group_index("_", -3).keys,
+                                      self.c.group_index("_", 0).keys)
+
+    def test_literal_separator(self):
+        coll = c.Collection.from_array(
+            np.zeros((2, 2)), [400., 401.], ["a.b||c", "d.e||f"])
+        self.assertEqual(list(coll.group_index("||", 1).keys), ["c", "f"])
+        self.assertEqual(list(coll.group_index(".", 0).keys), ["a", "d"])
+
+    def test_missing_positions(self):
+        with self.assertRaises(IndexError):
+            self.c.group_by_separator("_", 3)
+        with self.assertRaises(IndexError):
+            self.c.group_by_separator("_", -4)
+        # a name shorter than the others
+        self.c.add_spectrum(s.Spectrum(name="site9",
+                                       data=self.c.spectra[0].data.copy()))
+        with self.assertRaises(IndexError):
+            self.c.group_by_separator("_", 1)
+        self.assertEqual(len(self.c.group_by_separator("_", -1)), 31)
+
+    def test_group_index_cached(self):
+        index = self.c.group_index("_", 0)
+        self.assertIs(self.c.group_index("_", 0), index)
+        self.c.add_spectrum(s.Spectrum(name="site9_plot0_x",
+                                       data=self.c.spectra[0].data.copy()))
+        self.assertIsNot(self.c.group_index("_", 0), index)
+        self.assertEqual(len(self.c.group_index("_", 0)), 4)
+
+
 def main():
     unittest.main()
 
@@ -0,0 +1,130 @@
+import unittest
+import os
+import sys
+import shutil
+import asyncio
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(".."))
+from specdal import collection as c
+from specdal import ingest
+from specdal.chunked import ChunkedCollection
+from synthetic import write_asd
+
+
+def ingestor(outdir, **kwargs):
+    kwargs.setdefault('executor', 'thread')
+    kwargs.setdefault('batch_delay', 0.05)
+    return ingest.Ingestor(outdir, **kwargs)
+
+
+async def submit_all(ing, filepaths):
+    await ing.start()
+    futures = [await ing.submit(f) for f in filepaths]
+    results = [await f for f in futures]
+    await ing.close()
+    return results
+
+
+class IngestTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.indir = os.path.join(self.tmpdir, "in")
+        self.outdir = os.path.join(self.tmpdir, "out")
+        os.makedirs(self.indir)
+        self.files = []
+        for i in range(6):
+            filepath = os.path.join(self.indir,
+                                    "site{}_{}.asd".format(i % 2, i))
+            write_asd(filepath, target=np.linspace(1000., 2000., 2151)*(i + 1))
+            self.files.append(filepath)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read_stats(self, group):
+        return pd.read_csv(os.path.join(self.outdir, 'data',
+                                        group + '_stats.csv'), index_col=0)
+
+    def test_submit(self):
+        ing = ingestor(self.outdir, group_by_separator=['_', '0'],
+                       batch_size=4, qa={'checks': ['negative']},
+                       indices=['ndvi'])
+        results = asyncio.run(submit_all(ing, self.files))
+        self.assertTrue(all(r['stored'] and r['error'] is None
+                            for r in results))
+        self.assertEqual(results[0]['qa'], {'negative': False, 'flags': 0})
+        self.assertIn('ndvi', results[0]['indices'])
+
+        store = ChunkedCollection(os.path.join(self.outdir, 'store'))
+        self.assertEqual(len(store), 6)
+        self.assertEqual(len(store.meta['chunks']), 2)
+        # incremental statistics match a batch computation
+        data = c.Collection.from_files(self.files).data
+        site1 = data[[n for n in data.columns if n.startswith('site1')]]
+        stats = self.read_stats('site1')
+        np.testing.assert_allclose(stats['mean'], site1.mean(axis=1))
+        np.testing.assert_allclose(stats['std'], site1.std(axis=1))
+        self.assertTrue((stats['count'] == 3).all())
+        qa = pd.read_csv(os.path.join(self.outdir, 'qa.csv'), index_col=0)
+        self.assertEqual(len(qa), 6)
+
+    def test_duplicates_and_failures(self):
+        bad = os.path.join(self.indir, "bad.asd")
+        with open(bad, "w") as f:
+            f.write("not a spectrum")
+        ing = ingestor(self.outdir)
+        results = asyncio.run(submit_all(ing, self.files[:2] +
+                                         [self.files[0], bad]))
+        self.assertEqual(results[2]['error'], "already ingested")
+        self.assertIsNotNone(results[3]['error'])
+        self.assertFalse(results[3]['stored'])
+        self.assertTrue(os.path.exists(os.path.join(self.outdir,
+                                                    'failures.csv')))
+        # a restarted service knows what is stored and its statistics
+        ing = ingestor(self.outdir)
+        results = asyncio.run(submit_all(ing, self.files))
+        self.assertEqual([r['stored'] for r in results],
+                         [False, False, True, True, True, True])
+        data = c.Collection.from_files(self.files).data
+        stats = self.read_stats('all')
+        np.testing.assert_allclose(stats['mean'], data.mean(axis=1))
+        self.assertTrue((stats['count'] == 6).all())
+
+    def test_watch(self):
+        async def run():
+            ing = ingestor(self.outdir)
+            await ing.start()
+            task = asyncio.ensure_future(ing.watch(self.indir, 0.02))
+            while len(ing.names) < len(self.files):
+                await asyncio.sleep(0.02)
+            task.cancel()
+            await ing.close()
+            return ing
+        ing = asyncio.run(asyncio.wait_for(run(), 30))
+        self.assertEqual(len(ing.store), 6)
+
+    def test_serve(self):
+        async def run():
+            ing = ingestor(self.outdir)
+            await ing.start()
+            server = await ing.serve(port=0)
+            port = server.sockets[0].getsockname()[1]
+            loop = asyncio.get_event_loop()
+            results = [await loop.run_in_executor(None, ingest.send, f,
+                                                  "127.0.0.1", port)
+                       for f in self.files[:2] + self.files[:1]]
+            server.close()
+            await server.wait_closed()
+            await ing.close()
+            return results
+        results = asyncio.run(run())
+        self.assertEqual([r['stored'] for r in results], [True, True, False])
+        self.assertTrue(os.path.exists(os.path.join(self.outdir, 'inbox',
+                                                    'site0_0.asd')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(".."))
+from specdal import collection as c
+from specdal import library as lb
+from specdal.qa import WATER_BANDS
+
+
+def brute_force(library, query, metric):
+    """distance of `query` to every row of `library`, one at a time"""
+    out = []
+    for row in library:
+        if metric == 'angle':
+            cos = row @ query / np.linalg.norm(row) / np.linalg.norm(query)
+            out.append(np.arccos(np.clip(cos, -1, 1)))
+        elif metric == 'euclidean':
+            out.append(np.linalg.norm(row - query))
+        else:
+            out.append(1 - np.corrcoef(row, query)[0, 1])
+    return np.array(out)
+
+
+class LibraryTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.wavelengths = np.arange(400., 2400., 10.)
+        # smooth spectra of a few broad features
+        centers = np.linspace(400, 2400, 8)
+        basis = np.exp(-(self.wavelengths[np.newaxis] -
+                         centers[:, np.newaxis])**2/(2*150.**2))
+        self.values = rng.rand(300, 8) @ basis + \
+            0.01*rng.rand(300, len(self.wavelengths))
+        self.names = ["lib{}".format(i) for i in range(300)]
+        self.queries = self.values[[3, 150, 299]]*1.2 + \
+            0.002*rng.randn(3, len(self.wavelengths))
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_exact(self):
+        index = lb.LibraryIndex(self.values, self.wavelengths, self.names,
+                                dtype=np.float64)
+        for metric in lb.METRICS:
+            rows, distances = index.query(self.queries, metric=metric, k=4)
+            self.assertEqual(rows.shape, (3, 4))
+            for q, query in enumerate(self.queries):
+                expected = brute_force(self.values, query, metric)
+                order = np.argsort(expected)[:4]
+                np.testing.assert_array_equal(rows[q], order)
+                np.testing.assert_allclose(distances[q], expected[order],
+                                           atol=1e-9)
+        # scaling does not change the angle or correlation
+        rows = index.query(self.queries, metric='angle', k=1)[0]
+        np.testing.assert_array_equal(rows[:, 0], [3, 150, 299])
+
+    def test_pca(self):
+        exact = lb.LibraryIndex(self.values, self.wavelengths, self.names)
+        reduced = lb.LibraryIndex(self.values, self.wavelengths, self.names,
+                                  components=10)
+        for metric in lb.METRICS:
+            rows, distances = reduced.query(self.queries, metric=metric, k=3)
+            expected = exact.query(self.queries, metric=metric, k=3)
+            np.testing.assert_array_equal(rows, expected[0])
+            np.testing.assert_allclose(distances, expected[1], rtol=1e-5)
+        self.assertEqual(reduced.space('angle').projected.shape, (300, 10))
+
+    def test_single_query_and_axes(self):
+        index = lb.LibraryIndex(self.values, self.wavelengths, self.names)
+        rows, distances = index.query(self.queries[0], k=2)
+        self.assertEqual(rows.shape, (1, 2))
+        self.assertEqual(rows[0, 0], 3)
+        # a query on a finer axis is interpolated onto the library's
+        fine = np.arange(395., 2405., 5.)
+        query = np.interp(fine, self.wavelengths, self.queries[1])
+        self.assertEqual(index.query(query, fine, k=1)[0][0, 0], 150)
+        # NaN in the query
+        query = self.queries[1].copy()
+        query[:20] = np.nan
+        self.assertEqual(index.query(query, k=1)[0][0, 0], 150)
+        self.assertIsNone(index.query(query, metric='cosine'))
+
+    def test_excluded_bands(self):
+        values = self.values.copy()
+        values[5, 0] = np.nan
+        index = lb.LibraryIndex(values, self.wavelengths, self.names,
+                                exclude=WATER_BANDS)
+        bands = self.wavelengths[index.bands]
+        self.assertNotIn(self.wavelengths[0], bands)
+        self.assertFalse(((bands >= 1350) & (bands <= 1460)).any())
+        self.assertEqual(index.values.shape, (300, len(bands)))
+
+    def test_search_collection(self):
+        library = c.Collection.from_array(self.values, self.wavelengths,
+                                          self.names)
+        index = lb.LibraryIndex.from_collection(library)
+        unknown = c.Collection.from_array(self.queries, self.wavelengths,
+                                          ['a', 'b', 'c'])
+        result = index.search(unknown, metric='correlation', k=2)
+        self.assertEqual(list(result.index), ['a', 'a', 'b', 'b', 'c', 'c'])
+        self.assertEqual(list(result['rank']), [1, 2]*3)
+        self.assertEqual(list(result['match'][result['rank'] == 1]),
+                         ['lib3', 'lib150', 'lib299'])
+
+    def test_save_load(self):
+        path = os.path.join(self.tmpdir, "library")
+        index = lb.LibraryIndex(self.values, self.wavelengths, self.names,
+                                components=10, metadata=[{'class': 'x'}]*300)
+        index.save(path, metrics=['angle'])
+        loaded = lb.LibraryIndex.load(path)
+        self.assertIsInstance(loaded.space('angle').vectors, np.memmap)
+        self.assertEqual(loaded.metadata[0], {'class': 'x'})
+        for metric in ('angle', 'euclidean'):
+            expected = index.query(self.queries, metric=metric)
+            result = loaded.query(self.queries, metric=metric)
+            np.testing.assert_array_equal(result[0], expected[0])
+            np.testing.assert_allclose(result[1], expected[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdt
+
+sys.path.insert(0, os.path.abspath(".."))
+from specdal import collection as c
+from specdal import resamplers as rs
+from specdal import stitchers as st
+from specdal import pipeline as pl
+from specdal.cache import SpectrumCache
+from synthetic import write_asd, write_sig, write_sed
+
+
+class StreamTests(unittest.TestCase):
+    def setUp(self):
+        self.indir = tempfile.mkdtemp()
+        self.outdir = tempfile.mkdtemp()
+        for i in range(7):
+            write_sig(os.path.join(self.indir,
+                                   "site{}_plot{}.sig".format(i % 2, i)),
+                      seed=i)
+        with open(os.path.join(self.indir, "broken.sig"), "w") as f:
+            f.write("units= Counts, Counts\ndata= \n1 2\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.indir)
+        shutil.rmtree(self.outdir)
+
+    def test_stream_matches_batch(self):
+        groups = pl.stream(self.indir, self.outdir, resampler="slinear",
+                           stitcher="mean", group_by_separator=["_", "0"],
+                           chunksize=3)
+        self.assertEqual(sorted(groups), ["site0", "site1"])
+
+        coll = c.Collection.from_directory(self.indir)
+        rs.resample_collection(coll)
+        st.stitch_collection(coll)
+        for gname, gdata in coll.group_by_separator("_", 0):
+            path = os.path.join(self.outdir, "data", gname + ".csv")
+            written = pd.read_csv(path, index_col=0)
+            np.testing.assert_allclose(written.values,
+                                       gdata.transpose().values)
+            stats = pd.read_csv(os.path.join(self.outdir, "data",
+                                             gname + "_stats.csv"),
+                                index_col=0)
+            np.testing.assert_allclose(stats["mean"], gdata.mean(axis=1))
+            np.testing.assert_allclose(stats["std"], gdata.std(axis=1),
+                                       atol=1e-9)
+            self.assertTrue(os.path.exists(
+                os.path.join(self.outdir, "figures", gname + ".png")))
+
+        mask = pd.read_csv(os.path.join(self.outdir, "mask.csv"),
+                           index_col=0)
+        self.assertEqual(len(mask), 7)
+        failures = pd.read_csv(os.path.join(self.outdir, "failures.csv"))
+        self.assertEqual(len(failures), 1)
+
+    def test_stream_binary_format(self):
+        pl.stream(self.indir, self.outdir, resampler="slinear",
+                  stitcher="mean", group_by_separator=["_", "0"],
+                  chunksize=3, figures=False, format="npy")
+        coll = c.Collection.from_directory(self.indir)
+        rs.resample_collection(coll)
+        st.stitch_collection(coll)
+        for gname, gdata in coll.group_by_separator("_", 0):
+            loaded = c.Collection.load(os.path.join(self.outdir, "data",
+                                                    gname))
+            pdt.assert_frame_equal(loaded.data, gdata)
+
+    def test_iter_chunks(self):
+        filepaths = c.list_files(self.indir)
+        chunks = list(pl.iter_chunks(filepaths, chunksize=3, workers=2,
+                                     executor="thread"))
+        self.assertEqual(len(chunks), 3)
+        names = [s.name for coll in chunks for s in coll.spectra or []]
+        self.assertEqual(names, [os.path.basename(f) for f in filepaths
+                                 if not f.endswith("broken.sig")])
+
+
+class CacheTests(unittest.TestCase):
+    def setUp(self):
+        self.indir = tempfile.mkdtemp()
+        self.cachedir = tempfile.mkdtemp()
+        for i in range(4):
+            write_sig(os.path.join(self.indir, "s{}.sig".format(i)), seed=i)
+        self.filepaths = c.list_files(self.indir)
+
+    def tearDown(self):
+        shutil.rmtree(self.indir)
+        shutil.rmtree(self.cachedir)
+
+    def process(self, **settings):
+        cache = SpectrumCache(self.cachedir, settings=settings)
+        coll = pl.process_files(self.filepaths, cache=cache, **settings)
+        return coll, cache
+
+    def test_rerun_loads_from_cache(self):
+        first, cache = self.process(resampler="slinear", stitcher="mean")
+        self.assertEqual(cache.info(), {'hits': 0, 'misses': 4})
+        second, cache = self.process(resampler="slinear", stitcher="mean")
+        self.assertEqual(cache.info(), {'hits': 4, 'misses': 0})
+        self.assertEqual(list(second.names), list(first.names))
+        pdt.assert_frame_equal(second.data, first.data)
+
+    def test_changed_file_and_settings(self):
+        self.process(resampler="slinear")
+        write_sig(self.filepaths[1], seed=10)
+        os.utime(self.filepaths[1], ns=(0, 10**9))
+        coll, cache = self.process(resampler="slinear")
+        self.assertEqual(cache.info(), {'hits': 3, 'misses': 1})
+        expected = pl.process_files([self.filepaths[1]], resampler="slinear")
+        pdt.assert_frame_equal(coll.data[["s1.sig"]], expected.data)
+
+        coll, cache = self.process(resampler="cubic")
+        self.assertEqual(cache.info()['hits'], 0)
+        self.assertTrue(all(s.resampled for s in coll.spectra))
+
+    def test_content_hash(self):
+        cache = SpectrumCache(self.cachedir, content_hash=True)
+        key = cache.key(self.filepaths[0])
+        os.utime(self.filepaths[0], ns=(0, 10**9))
+        self.assertEqual(cache.key(self.filepaths[0]), key)
+
+class DtypeTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        for i in range(6):
+            write_asd(os.path.join(self.tmpdir, "s{}_a{}.asd".format(i % 2, i)),
+                      target=1000 + 1000*rng.rand(2151))
+            write_sig(os.path.join(self.tmpdir, "s{}_b{}.sig".format(i % 2, i)),
+                      seed=i)
+            write_sed(os.path.join(self.tmpdir, "s{}_c{}.sed".format(i % 2, i)),
+                      seed=i)
+        self.filepaths = c.list_files(self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_float32_matches_float64(self):
+        for resampler, stitcher in (('slinear', 'mean'), ('cubic', 'blending')):
+            double = pl.process_files(self.filepaths, resampler, stitcher)
+            single = pl.process_files(self.filepaths, resampler, stitcher,
+                                      dtype=np.float32)
+            for spectrum in single.spectra:
+                self.assertTrue((spectrum.data.dtypes == np.float32).all())
+            self.assertEqual(single.matrix.dtype, np.float32)
+            np.testing.assert_allclose(single.matrix, double.matrix,
+                                       rtol=1e-5)
+
+            # float32 rounding errors scale with the data, not the std
+            atol = 1e-6*np.nanmax(np.abs(double.matrix))
+            stats32 = single.group_stats(('_', 0))
+            stats64 = double.group_stats(('_', 0))
+            for stat in ('mean', 'median', 'std', 'min', 'max'):
+                self.assertTrue((stats32[stat].dtypes == np.float32).all())
+                np.testing.assert_allclose(stats32[stat], stats64[stat],
+                                           rtol=1e-5, atol=atol)
+            pdt.assert_frame_equal(stats32['count'], stats64['count'])
+
+    def test_store_keeps_dtype(self):
+        coll = pl.process_files(self.filepaths, 'slinear', 'mean',
+                                dtype=np.float32)
+        path = os.path.join(self.tmpdir, "store")
+        coll.save(path)
+        loaded = c.Collection.load(path)
+        self.assertEqual(loaded.matrix.dtype, np.float32)
+        np.testing.assert_array_equal(loaded.matrix, coll.matrix)
+
+    def test_collection_dtype(self):
+        coll = c.Collection.from_files(self.filepaths[:3])
+        self.assertEqual(coll.matrix.dtype, np.float64)
+        coll.dtype = np.float32
+        coll.spectra[0].data = coll.spectra[0].data.copy()
+        self.assertEqual(coll.matrix.dtype, np.float32)
+
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
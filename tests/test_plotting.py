@@ -0,0 +1,58 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+from matplotlib.figure import Figure
+
+sys.path.insert(0, os.path.abspath(".."))
+from specdal import collection as c
+from specdal import plotting
+
+
+class PlottingTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        names = ["g{}_{}".format(i % 3, i) for i in range(90)]
+        self.c = c.Collection.from_array(rng.rand(90, 50),
+                                         np.arange(400., 450.), names)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_decimate(self):
+        data = plotting.decimate(self.c.data, max_lines=10, step=5)
+        self.assertEqual(data.shape, (10, 10))
+        self.assertEqual(data.columns[0], "g0_0")
+        self.assertEqual(data.columns[-1], "g2_89")
+        data = self.c.data
+        self.assertIs(plotting.decimate(data), data)
+
+    def test_collection_plot(self):
+        ax = Figure().subplots()
+        self.assertIs(self.c.plot(ax=ax, max_lines=25), ax)
+        self.assertEqual(len(ax.get_lines()), 25)
+        self.assertIsNone(ax.get_legend())
+
+    def test_render_groups(self):
+        groups = list(self.c.group_by_separator("_", 0))
+        for workers, executor in ((None, "process"), (2, "process"),
+                                  (2, "thread")):
+            paths = plotting.render_groups(groups, self.tmpdir,
+                                           workers=workers,
+                                           executor=executor, max_lines=5)
+            self.assertEqual([os.path.basename(p) for p in paths],
+                             ["g0.png", "g1.png", "g2.png"])
+            for path in paths:
+                self.assertTrue(os.path.getsize(path) > 0)
+                os.remove(path)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
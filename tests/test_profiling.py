@@ -0,0 +1,123 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+import tempfile
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(".."))
+from specdal import profiling
+from specdal import collection as c
+from specdal import pipeline as pl
+from specdal import backends
+from synthetic import write_asd, write_sig
+
+
+class ProfilerTests(unittest.TestCase):
+    def tearDown(self):
+        profiling.disable()
+
+    def test_disabled(self):
+        self.assertIsNone(profiling.active())
+        with profiling.stage("read"):
+            pass
+        profiling.count("files")
+        profiling.record_file("a.asd", 1.0)
+        self.assertIs(profiling.stage("read"), profiling.stage("write"))
+
+    def test_stages_counters_and_hooks(self):
+        events = []
+        profiler = profiling.enable()
+        profiler.add_hook(lambda *event: events.append(event))
+        for _ in range(3):
+            with profiling.stage("read"):
+                pass
+        profiling.count("files", 5)
+        profiling.record_file("a.asd", 0.003, 100)
+        profiling.record_file("b.sig", 20.0, 50, error="ValueError")
+        report = profiler.report()
+        self.assertEqual(report['stages']['read']['calls'], 3)
+        self.assertEqual(report['counters'], {'files': 5})
+        self.assertEqual(report['readers']['.sig'],
+                         {'files': 1, 'bytes': 50, 'seconds': 20.0,
+                          'errors': 1})
+        counts = report['latency_histogram']['counts']
+        self.assertEqual(len(counts), len(profiling.LATENCY_BINS) + 1)
+        self.assertEqual(counts[2], 1)
+        self.assertEqual(counts[-1], 1)
+        self.assertEqual(report['slowest_files'][0]['filepath'], "b.sig")
+        self.assertEqual([e[0] for e in events],
+                         ["stage"]*3 + ["counter", "file", "file"])
+        self.assertEqual(events[-1][3]['reader'], ".sig")
+
+
+class InstrumentationTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for i in range(3):
+            write_asd(os.path.join(self.tmpdir, "a_{}.asd".format(i)))
+            write_sig(os.path.join(self.tmpdir, "b_{}.sig".format(i)))
+        with open(os.path.join(self.tmpdir, "broken.asd"), "wb") as f:
+            f.write(b"as7" + bytes(300))
+        self.profiler = profiling.enable()
+
+    def tearDown(self):
+        profiling.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def test_file_reads(self):
+        for workers in (None, 2):
+            self.profiler.files = []
+            c.Collection.from_directory(self.tmpdir, workers=workers)
+            files = {f[0]: f for f in self.profiler.files}
+            self.assertEqual(len(files), 7)
+            path = os.path.join(self.tmpdir, "a_0.asd")
+            self.assertEqual(files[path][3], os.path.getsize(path))
+            self.assertIsNone(files[path][4])
+            broken = files[os.path.join(self.tmpdir, "broken.asd")]
+            self.assertTrue(broken[4].startswith("ValueError"))
+
+    def test_process_files(self):
+        pl.process_files(c.list_files(self.tmpdir), resampler='slinear',
+                         stitcher='mean')
+        self.assertEqual(set(self.profiler.stages),
+                         {"read", "resample", "stitch"})
+        self.assertEqual(self.profiler.counters,
+                         {"files": 7, "failures": 1})
+
+    def test_partitions_in_worker_processes(self):
+        filepaths = [f for f in c.list_files(self.tmpdir)
+                     if f.endswith(".asd")]
+        backend = backends.LocalBackend(workers=2, executor='process')
+        try:
+            pl.reduce_partitions(filepaths, backend, partition_size=2,
+                                 resampler='slinear')
+        finally:
+            backend.close()
+        self.assertEqual(self.profiler.stages["resample"][0], 2)
+        self.assertEqual(self.profiler.counters,
+                         {"files": 4, "failures": 1})
+        self.assertEqual(len(self.profiler.files), 4)
+        # workers leave no profiler behind in this process
+        self.assertIs(profiling.active(), self.profiler)
+
+    def test_save(self):
+        c.Collection.from_directory(self.tmpdir)
+        with profiling.stage("read"):
+            pass
+        jsonpath = self.profiler.save(os.path.join(self.tmpdir, "p.json"))
+        with open(jsonpath) as f:
+            self.assertEqual(len(json.load(f)['readers']), 2)
+        csvpath = self.profiler.save(os.path.join(self.tmpdir, "p.csv"))
+        table = pd.read_csv(csvpath)
+        self.assertEqual((table['kind'] == 'file').sum(), 7)
+        self.assertEqual((table['kind'] == 'stage').sum(), 1)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
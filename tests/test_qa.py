@@ -0,0 +1,150 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(".."))
+from specdal import collection as c
+from specdal import pipeline as pl
+from specdal import qa
+from specdal import readers
+from synthetic import write_asd, write_sig
+
+
+class QATests(unittest.TestCase):
+    def setUp(self):
+        self.wavelengths = np.arange(350, 2501, dtype=float)
+        x = (self.wavelengths - 350) / 2150
+        values = np.tile(0.2 + 0.3*x, (5, 1))
+        values[1, 100:110] = -0.01
+        values[2, 400:600] = 0.9
+        values[3, self.wavelengths > 1000] += 0.1
+        rng = np.random.RandomState(0)
+        noise = (self.wavelengths >= 1350) & (self.wavelengths <= 1460)
+        values[4, noise] += 0.2*rng.rand(noise.sum())
+        self.names = ["good", "negative", "saturated", "jump", "noisy"]
+        self.coll = c.Collection.from_array(values, self.wavelengths,
+                                            self.names)
+
+    def check_all(self, **kwargs):
+        # spectra made from arrays have no splice points of their own
+        return qa.check(self.coll, checks=qa.CHECKS, joins=qa.JOINS,
+                        **kwargs)
+
+    def test_checks(self):
+        result = self.check_all()
+        frame = result.to_frame()
+        for name in self.names[1:]:
+            self.assertEqual(list(frame.index[frame[name]]), [name])
+        self.assertEqual(frame.loc["good", "flags"], 0)
+        self.assertEqual(frame.loc["jump", "flags"], qa.FLAGS["jump"])
+        self.assertEqual(list(result.flagged()), [False] + [True]*4)
+        self.assertEqual(list(result.flagged(["negative"])),
+                         [False, True, False, False, False])
+
+    def test_band_mask(self):
+        result = self.check_all()
+        self.assertEqual(result.bits["negative"].shape,
+                         (5, (len(self.wavelengths) + 7) // 8))
+        mask = result.band_mask("negative")
+        self.assertEqual(mask.shape, (5, len(self.wavelengths)))
+        self.assertEqual(list(np.flatnonzero(mask[1])), list(range(100, 110)))
+        self.assertFalse(mask[[0, 2, 3, 4]].any())
+        jump = result.band_mask("jump")[3]
+        self.assertEqual(list(self.wavelengths[jump]), [1000., 1001.])
+
+    def test_saturation_level(self):
+        result = qa.check(self.coll, checks=["saturated"], saturation=0.8)
+        self.assertEqual(list(result.flagged()),
+                         [False, False, True, False, False])
+        self.assertEqual(list(result.to_frame().columns),
+                         ["saturated", "flags"])
+
+    def test_join_metadata(self):
+        metadata = [{"join1_wave": 1200, "join2_wave": 1800}]*5
+        coll = c.Collection.from_array(self.coll.matrix, self.wavelengths,
+                                       self.names, metadata=metadata)
+        result = qa.check(coll, checks=["jump"])
+        self.assertFalse(result.flagged().any())
+
+    def test_drop_flagged(self):
+        result = self.check_all()
+        kept = qa.drop_flagged(self.coll, result)
+        self.assertEqual(list(kept.names), ["good"])
+        kept = qa.drop_flagged(self.coll, result, checks=["negative"])
+        self.assertEqual(list(kept.names),
+                         ["good", "saturated", "jump", "noisy"])
+
+    def test_defaults(self):
+        # no splice points and no noise check by default
+        frame = qa.check(self.coll).to_frame()
+        self.assertEqual(list(frame.columns),
+                         list(qa.DEFAULT_CHECKS) + ["flags"])
+        self.assertEqual(list(frame.index[frame["flags"] > 0]),
+                         ["negative", "saturated"])
+
+    def test_sig_not_flagged(self):
+        # a field spectrum of an SVC instrument: a step between detectors
+        # near 1000 nm and noisy water absorption bands
+        rng = np.random.RandomState(0)
+        wavelengths = np.concatenate([np.linspace(338.5, 1010.3, 512),
+                                      np.linspace(1011.4, 1900.6, 256),
+                                      np.linspace(1901.2, 2513.9, 256)])
+        path = os.path.join(tempfile.mkdtemp(), "field.sig")
+        try:
+            write_sig(path, wavelengths=wavelengths)
+            spectrum = readers.read(path)
+            data = spectrum.data
+            data.loc[data.index > 1000, "pct_reflect"] *= 1.1
+            water = (data.index > 1350) & (data.index < 1460)
+            data.loc[water, "pct_reflect"] *= 1 + 0.5*rng.rand(water.sum())
+            coll = c.Collection()
+            coll.add_spectrum(spectrum)
+            self.assertFalse(qa.check(coll).flagged().any())
+            self.assertTrue(qa.check(coll, checks=["jump"],
+                                     joins=qa.JOINS).flagged().all())
+        finally:
+            shutil.rmtree(os.path.dirname(path))
+
+    def test_unknown_check(self):
+        with self.assertRaises(ValueError):
+            qa.check(self.coll, checks=["spikes"])
+
+
+class PipelineQATests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.indir = os.path.join(self.tmpdir, "in")
+        os.makedirs(self.indir)
+        for i in range(4):
+            reference = np.full(2151, 2000.)
+            target = np.full(2151, 1000.)
+            if i == 2:
+                target[100:200] = -10
+            write_asd(os.path.join(self.indir, "s_{}.asd".format(i)),
+                      target=target, reference=reference)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_process_files(self):
+        filepaths = c.list_files(self.indir)
+        coll = pl.process_files(filepaths, qa={"checks": ["negative"]})
+        self.assertEqual(list(coll.names), ["s_0.asd", "s_1.asd", "s_3.asd"])
+        self.assertEqual(list(coll.qa.flagged()),
+                         [False, False, True, False])
+
+    def test_stream(self):
+        outdir = os.path.join(self.tmpdir, "out")
+        groups = pl.stream(self.indir, outdir, chunksize=3, figures=False,
+                           qa={"checks": ["negative"]})
+        self.assertEqual(groups["all"].stats()["count"].max(), 3)
+        flags = pd.read_csv(os.path.join(outdir, "qa.csv"), index_col=0)
+        self.assertEqual(list(flags.index[flags["negative"]]), ["s_2.asd"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,15 @@
 import unittest
 import os
 import sys
+import shutil
+import tempfile
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
 sys.path.insert(0, os.path.abspath(".."))
 from specdal import readers as r
+from synthetic import write_asd, write_sig, write_sed
 
 class ReaderTests(unittest.TestCase):
     def setUp(self):
@@ -35,6 +42,195 @@ class ReaderTests(unittest.TestCase):
                 spec = r.read(filepath)
 
 
+class AsdDecodeTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        self.targets = 1 + rng.rand(3, 2151)
+        self.references = 2 + rng.rand(3, 2151)
+        self.paths = []
+        for i in range(3):
+            path = os.path.join(self.tmpdir, "asd_{}.asd".format(i))
+            write_asd(path, target=self.targets[i],
+                      reference=self.references[i])
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read_asd(self):
+        s = r.read_asd(self.paths[0])
+        self.assertEqual(list(s.data.columns),
+                         ["target", "reference", "pct_reflect"])
+        self.assertEqual(s.data.index[0], 350)
+        self.assertEqual(s.data.index[-1], 2500)
+        np.testing.assert_array_equal(s.data["target"], self.targets[0])
+        np.testing.assert_allclose(s.data["pct_reflect"],
+                                   self.targets[0] / self.references[0])
+        self.assertEqual(s.metadata["type"], "REF_TYPE")
+
+    def test_read_asd_float_format(self):
+        path = os.path.join(self.tmpdir, "float.asd")
+        write_asd(path, data_format=0, target=self.targets[0],
+                  reference=self.references[0])
+        s = r.read_asd(path)
+        np.testing.assert_allclose(s.data["reference"], self.references[0],
+                                   rtol=1e-6)
+
+    def test_read_asd_without_reference(self):
+        path = os.path.join(self.tmpdir, "v1.asd")
+        write_asd(path, version="ASD", target=self.targets[0])
+        s = r.read_asd(path)
+        np.testing.assert_array_equal(s.data["target"], self.targets[0])
+        self.assertTrue(s.data["reference"].isnull().all())
+
+    def test_read_asd_batch(self):
+        for mmap in (False, True):
+            waves, out = r.read_asd_batch(self.paths, mmap=mmap)
+            self.assertEqual(out.shape, (3, 2151))
+            np.testing.assert_array_equal(waves, np.arange(350., 2501.))
+            np.testing.assert_allclose(out, self.targets / self.references)
+
+    def test_read_asd_batch_matches_read_asd(self):
+        waves, out = r.read_asd_batch(self.paths)
+        for path, row in zip(self.paths, out):
+            np.testing.assert_array_equal(
+                r.read_asd(path).data['pct_reflect'].values, row)
+
+    def test_read_asd_batch_into_preallocated(self):
+        out = np.zeros((3, 2151), dtype=np.float32)
+        waves, res = r.read_asd_batch(self.paths, column="target", out=out)
+        self.assertIs(res, out)
+        np.testing.assert_allclose(out, self.targets, rtol=1e-6)
+
+    def test_read_asd_batch_layout_mismatch(self):
+        path = os.path.join(self.tmpdir, "short.asd")
+        write_asd(path, num_channels=100)
+        self.assertIsNone(r.read_asd_batch(self.paths + [path]))
+
+
+class MetadataTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.when = datetime(2014, 6, 11, 10, 13, 5)
+        self.paths = [os.path.join(self.tmpdir, f)
+                      for f in ("a.asd", "b.sig", "c.sed")]
+        write_asd(self.paths[0], when=self.when)
+        write_sig(self.paths[1])
+        write_sed(self.paths[2])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_matches_full_read(self):
+        for path in self.paths:
+            self.assertEqual(r.read_metadata(path), r.read(path).metadata)
+
+    def test_asd_header(self):
+        meta = r.read_metadata(self.paths[0])
+        self.assertEqual(meta["timestamp"], self.when)
+        self.assertEqual(meta["version"], "as7")
+        self.assertEqual(meta["num_channels"], 2151)
+        self.assertEqual((meta["join1_wave"], meta["join2_wave"]),
+                         (1000.0, 1800.0))
+
+    def test_text_headers(self):
+        self.assertEqual(r.read_metadata(self.paths[1])["units"],
+                         "Radiance, Radiance")
+        self.assertEqual(r.read_metadata(self.paths[2])["Instrument"],
+                         "PSR-3500_SN1234 [3]")
+
+    def test_dtype(self):
+        for path in self.paths:
+            double = r.read(path)
+            single = r.read(path, dtype=np.float32)
+            self.assertTrue((single.data.dtypes == np.float32).all())
+            self.assertEqual(single.data.index.dtype, np.float64)
+            np.testing.assert_allclose(single.data.values,
+                                       double.data.values, rtol=1e-6)
+            lazy = r.read(path, lazy=True, dtype=np.float32)
+            self.assertTrue((lazy.data.dtypes == np.float32).all())
+
+    def test_lazy_read(self):
+        for path in self.paths:
+            s = r.read(path, lazy=True)
+            self.assertFalse(s.loaded)
+            self.assertIsNone(s.version)
+            self.assertEqual(s.metadata, r.read_metadata(path))
+            full = r.read(path)
+            np.testing.assert_array_equal(s.data.values, full.data.values)
+            self.assertTrue(s.loaded)
+            self.assertEqual(s.mask, full.mask)
+            self.assertEqual(s.metadata, full.metadata)
+
+
+class TextParserTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.sigs = [os.path.join(self.tmpdir, "b_{}.sig".format(i))
+                     for i in range(3)]
+        self.seds = [os.path.join(self.tmpdir, "c_{}.sed".format(i))
+                     for i in range(3)]
+        for i in range(3):
+            write_sig(self.sigs[i], seed=i)
+            write_sed(self.seds[i], seed=i)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_sig_matches_pandas(self):
+        s = r.read_sig(self.sigs[0])
+        expected = pd.read_table(self.sigs[0], skiprows=6, sep=r"\s+",
+                                 index_col=0, header=None)
+        np.testing.assert_array_equal(s.data.index.values, expected.index)
+        np.testing.assert_array_equal(s.data.values, expected.values)
+        self.assertEqual(list(s.data.columns),
+                         ["ref_radiance", "tgt_radiance", "pct_reflect"])
+        self.assertEqual(s.data.index.name, "wavelength")
+
+    def test_sed_matches_pandas(self):
+        s = r.read_sed(self.seds[0])
+        expected = pd.read_table(self.seds[0], skiprows=6, sep="\t")
+        np.testing.assert_array_equal(s.data.index.values, expected["Wvl"])
+        np.testing.assert_array_equal(s.data["tgt_radiance"],
+                                      expected["Rad. (Target)"])
+        self.assertFalse(s.mask)
+
+    def test_data_line_without_space(self):
+        path = os.path.join(self.tmpdir, "nospace.sig")
+        with open(self.sigs[0]) as f:
+            text = f.read()
+        with open(path, "w") as f:
+            f.write(text.replace("data= \n", "data=\n"))
+        pdt.assert_frame_equal(r.read_sig(path).data,
+                               r.read_sig(self.sigs[0]).data)
+
+    def test_non_numeric_block(self):
+        path = os.path.join(self.tmpdir, "missing.sed")
+        with open(self.seds[0]) as f:
+            lines = f.readlines()
+        lines[10] = "355\t-\t1000.0\t50.0\n"
+        with open(path, "w") as f:
+            f.writelines(lines)
+        s = r.read_sed(path)
+        self.assertEqual(len(s.data), 2151)
+        self.assertEqual(s.data["tgt_radiance"].values[3], "-")
+
+    def test_text_batch(self):
+        for paths in (self.sigs, self.seds):
+            waves, out = r.read_text_batch(paths)
+            self.assertEqual(out.shape, (3, len(waves)))
+            for i, path in enumerate(paths):
+                s = r.read(path)
+                np.testing.assert_array_equal(waves, s.data.index.values)
+                np.testing.assert_array_equal(out[i], s.data["pct_reflect"])
+
+    def test_text_batch_layout_mismatch(self):
+        path = os.path.join(self.tmpdir, "short.sed")
+        write_sed(path, wavelengths=np.arange(350, 1001))
+        self.assertIsNone(r.read_text_batch(self.seds + [path]))
+
+
 def main():
     unittest.main()
 
@@ -7,7 +7,9 @@ import numpy as np
 
 sys.path.insert(0, os.path.abspath(".."))
 from specdal import spectrum as s
+from specdal import collection as c
 from specdal import resamplers as rs
+from specdal.plans import PlanCache
 
 
 class ResamplerTests(unittest.TestCase):
@@ -47,6 +49,72 @@ class ResamplerTests(unittest.TestCase):
         #pdt.assert_frame_equal(s1_rs.data, pd.DataFrame())  # replace with reampled values
 
 
+class BatchResamplerTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        # three overlapping detector sequences on a non-integer grid
+        self.waves = np.concatenate([np.linspace(338.5, 1010.3, 60),
+                                     np.linspace(972.4, 1900.6, 40),
+                                     np.linspace(1885.2, 2513.9, 30)])
+        self.values = rng.rand(5, len(self.waves))
+
+    def frame(self, row):
+        return pd.DataFrame({"pct_reflect": row},
+                            index=pd.Index(self.waves, name="wavelength"))
+
+    def test_matches_pandas_path(self):
+        for method in rs.METHODS:
+            index, out = rs.resample_array(self.values, self.waves, method)
+            for row, res in zip(self.values, out):
+                expected = rs._resample_frame(self.frame(row), method)
+                np.testing.assert_array_equal(index, expected.index.values)
+                np.testing.assert_allclose(res, expected["pct_reflect"])
+
+    def test_rows_with_nan(self):
+        self.values[2, 10] = np.nan
+        index, out = rs.resample_array(self.values, self.waves, "slinear")
+        expected = rs._resample_frame(self.frame(self.values[2]), "slinear")
+        np.testing.assert_allclose(out[2], expected["pct_reflect"])
+
+    def test_resample_collection(self):
+        coll = c.Collection()
+        for i, row in enumerate(self.values):
+            coll.add_spectrum(s.Spectrum(name=str(i), data=self.frame(row)))
+        rs.resample_collection(coll, "cubic")
+        self.assertTrue(all(spec.resampled for spec in coll.spectra))
+        expected = rs._resample_frame(self.frame(self.values[3]), "cubic")
+        pdt.assert_frame_equal(coll.spectra[3].data, expected)
+        self.assertEqual(coll.matrix.shape, (5, len(expected)))
+        self.assertTrue(np.shares_memory(coll.spectra[3].data.values,
+                                         coll.matrix))
+
+    def test_resample_matches_pandas_path(self):
+        for method in rs.METHODS:
+            spec = s.Spectrum(name="a", data=self.frame(self.values[0]))
+            expected = rs._resample_frame(spec.data, method)
+            pdt.assert_frame_equal(rs.resample(spec, method).data, expected)
+
+    def test_plan_cache(self):
+        rs.plans.clear()
+        for row in self.values:
+            rs.resample(s.Spectrum(name="a", data=self.frame(row)))
+        self.assertEqual(rs.plans.info()["misses"], 1)
+        self.assertEqual(rs.plans.info()["hits"], len(self.values) - 1)
+        rs.resample(s.Spectrum(name="a", data=self.frame(self.values[0])),
+                    method="cubic")
+        self.assertEqual(rs.plans.info()["misses"], 2)
+
+    def test_plan_cache_bound(self):
+        cache = PlanCache(rs.ResamplePlan, maxsize=2)
+        for shift in (0.0, 0.1, 0.2, 0.0):
+            cache.get(self.waves + shift, "slinear")
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.info()["misses"], 4)
+
+    def test_unsupported_method(self):
+        self.assertIsNone(rs.resample_array(self.values, self.waves, "akima"))
+
+
 def main():
     unittest.main()
 
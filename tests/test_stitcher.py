@@ -1,11 +1,13 @@
 import unittest
 import os
 import sys
+import numpy as np
 import pandas as pd
 import pandas.util.testing as pdt
 
 sys.path.insert(0, os.path.abspath(".."))
 from specdal import spectrum as s
+from specdal import collection as c
 from specdal import stitchers as st
 
 
@@ -57,6 +59,96 @@ class StitcherTests(unittest.TestCase):
         pdt.assert_frame_equal(self.s2.data, self.s2_st_data)
 
 
+class FastStitcherTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.waves = np.concatenate([np.arange(350., 1011.),
+                                     np.arange(972., 1901.),
+                                     np.arange(1885., 2501.)])
+        self.values = rng.rand(4, len(self.waves))
+        self.values[1, 700] = np.nan
+
+    def frame(self, row):
+        return pd.DataFrame({"pct_reflect": row},
+                            index=pd.Index(self.waves, name="wavelength"))
+
+    def test_mean_matches_groupby(self):
+        index, out = st.stitch_array(self.values, self.waves)
+        for row, res in zip(self.values, out):
+            expected = self.frame(row).groupby(level=0).mean()
+            np.testing.assert_array_equal(index, expected.index.values)
+            np.testing.assert_allclose(res, expected["pct_reflect"])
+
+    def test_blending_crossfades(self):
+        values = np.concatenate([np.zeros(661), np.ones(929),
+                                 np.ones(616)])[np.newaxis]
+        index, out = st.stitch_array(values, self.waves, "blending")
+        overlap = out[0, (index >= 972) & (index <= 1010)]
+        # weight moves from the first detector to the second
+        self.assertTrue(np.all(np.diff(overlap) > 0))
+        self.assertTrue(0 < overlap[0] < 0.1 and 0.9 < overlap[-1] < 1)
+        self.assertEqual(out[0, index == 1900][0], 1.0)
+
+    def test_stitch_collection(self):
+        coll = c.Collection()
+        for i, row in enumerate(self.values):
+            coll.add_spectrum(s.Spectrum(name=str(i), data=self.frame(row),
+                                         resampled=True))
+        expected = coll.spectra[1].data.groupby(level=0).mean()
+        st.stitch_collection(coll)
+        pdt.assert_frame_equal(coll.spectra[1].data, expected)
+        self.assertEqual(coll.matrix.shape, (4, 2151))
+
+    def test_unsupported_method(self):
+        spec = s.Spectrum(name="a", data=self.frame(self.values[0]))
+        self.assertIsNone(st.stitch(spec, "median"))
+
+
+class JumpCorrectTests(unittest.TestCase):
+    def setUp(self):
+        self.waves = np.arange(350, 2501, dtype=float)
+        base = 0.2 + 1e-4*(self.waves - 350)
+        self.base = np.vstack([base, 2*base])
+        # second detector 0.05 higher, third 0.02 lower than the second
+        self.steps = np.select([self.waves > 1800, self.waves > 1000],
+                               [0.03, 0.05], 0)
+        self.values = self.base + self.steps
+
+    def test_additive(self):
+        out = st.jump_correct_array(self.values, self.waves, (1000, 1800),
+                                    reference=0)
+        np.testing.assert_allclose(out, self.base)
+        out = st.jump_correct_array(self.values, self.waves, (1000, 1800))
+        np.testing.assert_allclose(out, self.base + 0.05)
+
+    def test_multiplicative(self):
+        factors = np.select([self.waves > 1800, self.waves > 1000],
+                            [0.9, 1.1], 1)
+        values = self.base*factors
+        out = st.jump_correct_array(values, self.waves, (1000, 1800),
+                                    method="multiplicative", reference=2)
+        np.testing.assert_allclose(out, self.base*0.9)
+
+    def test_invalid(self):
+        self.assertIsNone(st.jump_correct_array(self.values, self.waves,
+                                                (1000, 1800), reference=3))
+        self.assertIsNone(st.jump_correct_array(self.values, self.waves,
+                                                (1000, 1800), "median"))
+
+    def test_jump_correct(self):
+        coll = c.Collection.from_array(
+            self.values.astype(np.float32), self.waves, ["a", "b"],
+            metadata=[{"join1_wave": 1000.0, "join2_wave": 1800.0}, {}])
+        st.jump_correct(coll, reference=0)
+        self.assertEqual(coll.matrix.dtype, np.float32)
+        np.testing.assert_allclose(coll.matrix[0], self.base[0], rtol=1e-5)
+        # no splice points, left unchanged
+        np.testing.assert_allclose(coll.matrix[1], self.values[1],
+                                   rtol=1e-5)
+        st.jump_correct(coll, reference=0, joins=(1000, 1800))
+        np.testing.assert_allclose(coll.matrix, self.base, rtol=1e-5)
+
+
 def main():
     unittest.main()
 
@@ -0,0 +1,81 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdt
+
+sys.path.insert(0, os.path.abspath(".."))
+from specdal import spectrum as s
+from specdal import collection as c
+from specdal import store
+
+
+class StoreTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "store")
+        index = pd.Index(np.arange(400., 410.), name="wavelength")
+        rng = np.random.RandomState(0)
+        self.c = c.Collection()
+        for i in range(4):
+            data = pd.DataFrame({"tgt_radiance": rng.rand(10),
+                                 "pct_reflect": rng.rand(10)}, index=index)
+            self.c.add_spectrum(s.Spectrum(name="s{}".format(i), data=data,
+                                           mask=i == 2, resampled=True,
+                                           metadata={"site": str(i % 2)}))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_roundtrip(self):
+        self.c.save(self.path)
+        for mmap in (False, True):
+            coll = c.Collection.load(self.path, mmap=mmap)
+            pdt.assert_frame_equal(coll.data, self.c.data)
+            pdt.assert_frame_equal(coll.mask, self.c.mask)
+            pdt.assert_frame_equal(coll.spectra[1].data,
+                                   self.c.spectra[1].data)
+            self.assertEqual(coll.spectra[3].metadata, {"site": "1"})
+            self.assertTrue(coll.spectra[0].resampled)
+        self.assertIsInstance(coll.matrix.base, np.memmap)
+
+    def test_selective_load(self):
+        self.c.save(self.path)
+        coll = c.Collection.load(self.path, names=["s3", "s1"],
+                                 layers=[], wavelengths=(402, 405))
+        self.assertEqual(list(coll.names), ["s1", "s3"])
+        self.assertEqual(list(coll.spectra[0].data.columns), ["pct_reflect"])
+        pdt.assert_frame_equal(coll.data,
+                               self.c.data.loc[402:405, ["s1", "s3"]])
+
+    def test_append(self):
+        self.c.save(self.path, names=["s0", "s1"])
+        self.c.save(self.path, names=["s2", "s3"], append=True)
+        self.assertEqual(len(store.read_meta(self.path)["chunks"]), 2)
+        pdt.assert_frame_equal(c.Collection.load(self.path).data,
+                               self.c.data)
+        other = c.Collection.from_array(np.zeros((1, 5)), np.arange(5),
+                                        ["x"])
+        with self.assertRaises(ValueError):
+            other.save(self.path, append=True)
+
+    def test_chunk_files(self):
+        self.c.save(self.path, names=["s0", "s1"])
+        self.c.save(self.path, names=["s2", "s3"], append=True)
+        header = store.read_header(self.path)
+        self.assertEqual(header["version"], store.FORMAT_VERSION)
+        self.assertEqual(header["nchunks"], 2)
+        self.assertNotIn("chunks", header)
+        self.assertTrue(os.path.exists(os.path.join(self.path,
+                                                    "chunk_000001.json")))
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
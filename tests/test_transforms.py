@@ -0,0 +1,160 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(".."))
+from specdal import collection as c
+from specdal import pipeline as pl
+from specdal import transforms as tr
+from synthetic import write_asd
+
+
+class IndexTests(unittest.TestCase):
+    def setUp(self):
+        self.wavelengths = np.arange(350, 2501, dtype=float)
+        # sigmoid red edge centered at 715 nm
+        edge = 1/(1 + np.exp(-(self.wavelengths - 715)/15))
+        self.values = np.vstack([0.05 + 0.4*edge, 0.1 + 0.2*edge])
+
+    def test_ndvi(self):
+        out = tr.compute_indices(self.values, self.wavelengths, ['ndvi'])
+        v = pd.DataFrame(self.values.T, index=self.wavelengths)
+        expected = (v.loc[800] - v.loc[670]) / (v.loc[800] + v.loc[670])
+        np.testing.assert_allclose(out[:, 0], expected.values)
+
+    def test_red_edge_position(self):
+        out = tr.compute_indices(self.values, self.wavelengths, ['rep'])
+        np.testing.assert_allclose(out[:, 0], 715, atol=5)
+
+    def test_band_depth(self):
+        values = np.ones((1, len(self.wavelengths)))
+        values[0, self.wavelengths == 970] = 0.8
+        out = tr.compute_indices(values, self.wavelengths,
+                                 ['bd970', 'bd670'])
+        np.testing.assert_allclose(out, [[0.2, 0]], atol=1e-12)
+
+    def test_interpolated_bands(self):
+        # 2 nm grid: 531 falls between bands
+        wavelengths = self.wavelengths[::2]
+        values = 1 + wavelengths[np.newaxis]/1000
+        out = tr.compute_indices(values, wavelengths, ['pri'])
+        np.testing.assert_allclose(out[0, 0], (1.531 - 1.57)/(1.531 + 1.57))
+
+    def test_missing_values(self):
+        values = self.values.copy()
+        values[0, self.wavelengths == 800] = np.nan
+        out = tr.compute_indices(values, self.wavelengths, ['ndvi', 'pri'])
+        self.assertTrue(np.isnan(out[0, 0]))
+        self.assertFalse(np.isnan(out[0, 1]) or np.isnan(out[1]).any())
+        # bands off the wavelength axis
+        out = tr.compute_indices(self.values[:, :400], self.wavelengths[:400],
+                                 ['ndvi'])
+        self.assertTrue(np.isnan(out).all())
+
+    def test_register(self):
+        @tr.register('test_sr', 800., (660., 680.))
+        def simple_ratio(nir, red):
+            return nir / red
+        try:
+            out = tr.compute_indices(self.values, self.wavelengths,
+                                     ['test_sr'])
+        finally:
+            del tr.INDICES['test_sr']
+        v = pd.DataFrame(self.values.T, index=self.wavelengths)
+        expected = v.loc[800] / v.loc[660:680].mean()
+        np.testing.assert_allclose(out[:, 0], expected.values)
+
+    def test_dtype(self):
+        out = tr.compute_indices(self.values.astype(np.float32),
+                                 self.wavelengths)
+        self.assertEqual(out.dtype, np.float32)
+        self.assertEqual(out.shape, (2, len(tr.INDICES)))
+
+    def test_unknown_index(self):
+        self.assertIsNone(tr.compute_indices(self.values, self.wavelengths,
+                                             ['ndvi', 'nope']))
+
+    def test_collection(self):
+        coll = c.Collection.from_array(self.values, self.wavelengths,
+                                       ['a', 'b'])
+        frame = tr.indices(coll, ['ndvi', 'rep'])
+        self.assertEqual(list(frame.index), ['a', 'b'])
+        self.assertEqual(list(frame.columns), ['ndvi', 'rep'])
+
+
+class FilterTests(unittest.TestCase):
+    def setUp(self):
+        self.wavelengths = np.arange(350, 2501, dtype=float)
+        x = self.wavelengths / 1000
+        self.values = np.vstack([x**2, 1 + x])
+
+    def test_savgol(self):
+        out = tr.savgol(self.values, self.wavelengths, window=11, polyorder=2)
+        np.testing.assert_allclose(out[:, 5:-5], self.values[:, 5:-5])
+        out = tr.savgol(self.values, self.wavelengths, deriv=1)
+        np.testing.assert_allclose(out[0, 5:-5],
+                                   2*self.wavelengths[5:-5]/1e6)
+        np.testing.assert_allclose(out[1, 5:-5], 1e-3)
+
+    def test_savgol_needs_even_spacing(self):
+        wavelengths = self.wavelengths.copy()
+        wavelengths[-1] += 0.5
+        self.assertIsNone(tr.savgol(self.values, wavelengths))
+
+    def test_savgol_nan(self):
+        values = self.values.copy()
+        values[0, 1000] = np.nan
+        out = tr.savgol(values, self.wavelengths, window=11)
+        self.assertEqual(np.isnan(out).sum(), 11)
+
+    def test_derivative(self):
+        out = tr.derivative(self.values, self.wavelengths, order=2)
+        np.testing.assert_allclose(out[0, 2:-2], 2e-6)
+        np.testing.assert_allclose(out[1, 2:-2], 0, atol=1e-15)
+
+    def test_filter_collection(self):
+        coll = c.Collection.from_array(self.values.astype(np.float32),
+                                       self.wavelengths, ['a', 'b'])
+        tr.filter_collection(coll, 'derivative')
+        self.assertEqual(coll.matrix.dtype, np.float32)
+        np.testing.assert_allclose(coll.matrix[1], 1e-3, rtol=1e-3)
+        self.assertIsNone(tr.filter_collection(coll, 'wavelet'))
+
+
+class PipelineTransformTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.indir = os.path.join(self.tmpdir, "in")
+        os.makedirs(self.indir)
+        for i in range(5):
+            write_asd(os.path.join(self.indir, "s_{}.asd".format(i)),
+                      target=np.linspace(100, 900, 2151),
+                      reference=np.full(2151, 1000.))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_process_files(self):
+        coll = pl.process_files(c.list_files(self.indir),
+                                indices=['ndvi'],
+                                transform={'method': 'derivative'})
+        self.assertEqual(coll.indices.shape, (5, 1))
+        # indices are computed before the spectra are filtered
+        self.assertTrue((coll.indices['ndvi'] > 0).all())
+        np.testing.assert_allclose(coll.matrix, 800/2150/1000)
+
+    def test_stream(self):
+        outdir = os.path.join(self.tmpdir, "out")
+        pl.stream(self.indir, outdir, chunksize=2, figures=False,
+                  indices=[])
+        frame = pd.read_csv(os.path.join(outdir, "indices.csv"),
+                            index_col=0)
+        self.assertEqual(frame.shape, (5, len(tr.INDICES)))
+
+
+if __name__ == '__main__':
+    unittest.main()